@@ -1,14 +1,19 @@
 """Hermes MQTT server for Rhasspy Dialogue Mananger"""
 import asyncio
+import functools
+import importlib
+import json
 import logging
+import sys
 import typing
-from collections import defaultdict, deque
+from collections import defaultdict, deque, OrderedDict
 from dataclasses import dataclass
 from pathlib import Path
 from uuid import uuid4
 
 import threading
-from time import sleep
+import time
+from numpy import rad2deg
 
 from rhasspyhermes.asr import (
 	AsrStartListening,
@@ -127,7 +132,22 @@ SoundsType = typing.Union[
 from .pixels import Respeaker4MicArray, MatrixVoice, DummyBoard, LED_MIN_VAL, LED_MAX_VAL
 from .led_patterns.google_home_led_pattern import GoogleHomeLedPattern
 from .led_patterns.alexa_led_pattern import AlexaLedPattern
-from .energy_DOAs import localized_sources, tracked_sources
+from .energy_DOAs import localized_sources, tracked_sources, AzimuthGrid
+from .colormaps import Colormap, DEFAULT_COLORMAP, TRACKS_COLORMAP
+from .lisa_decoder import decode_ssl, decode_sst, source_site
+from .audio_envelope import rms_envelope, DEFAULT_ENVELOPE_WINDOW
+from .snapshot import StateSnapshot, DEFAULT_SNAPSHOT_INTERVAL, DEFAULT_SNAPSHOT_MAX_AGE
+from .pattern_tables import PatternTableCache
+from .clock import DEFAULT_CLOCK
+from .profiler import SamplingProfiler, ProfilerException, DEFAULT_PROFILE_DURATION
+from .watchdog import Watchdog, WATCHDOG_STATUS_TOPIC
+from .quality import QualityController, LOW_QUALITY_SPOT_DECIMATION, LOW_QUALITY_FPS
+from .ingress import IngressLimiter, key_name, DEFAULT_INGRESS_RATE, DEFAULT_INGRESS_BURST, DEFAULT_INGRESS_STRATEGY, \
+	MAX_INGRESS_BACKLOG
+from .hw_writer import HwWriterException, DEFAULT_WRITER_FPS
+from .led_state import LedStateMachine, IDLE, WAKE, LISTENING, THINKING, SPEAKING, RESULT
+
+DEFAULT_DITHER_FPS = 100.0 # render rate of --dither without --render-fps (the max_fps if limited)
 
 
 defualt_pattern = 'GoogleHome'
@@ -139,11 +159,49 @@ available_led_patterns = {'GoogleHome': GoogleHomeLedPattern,
 						  'Alexa': AlexaLedPattern,
 					     } #'': None}				
 
+# Admin topic: reload the pattern (recompiled from its source) and/or switch pattern and board at runtime,
+# payload {"pattern": "Alexa", "hw_board": "DummyBoard", "siteId": "default"}, every key is optional
+ADMIN_RELOAD_TOPIC = 'lisa/ledmanager/admin/reload'
+RELOAD_GAP_TIMEOUT = 2.0 # s, waiting for the first frame after a reload
+DEFAULT_LAYER_TIMEOUT = 1.0 # s without SSL/SST sources before the energy layers are cleared
+# Admin topic: sample the threads of the manager for a while (see profiler), payload {"duration": 10, "siteId": "default"}
+ADMIN_PROFILE_TOPIC = 'lisa/ledmanager/admin/profile'
+DEGRADED_OVERLAY_INTERVAL = 0.1 # s, min interval between two redraws of an energy overlay when degraded
+MAX_TTS_REQUESTS = 8 # TtsSay ids waiting for their audio
+
 				
 class LedManagerHermesMqttException(Exception):
 	pass
 
 
+def hermes_handler(*message_types):
+	"""Declare a LedManagerHermesMqtt method as the handler of the given Hermes message types"""
+	def decorator(func):
+		func.hermes_message_types = message_types
+		return func
+	return decorator
+
+
+class HandlerTiming:
+	"""Call count and time spent in a message handler"""
+	def __init__(self):
+		self.count = 0
+		self.total = 0.0
+		self.max = 0.0
+
+	def add(self, elapsed):
+		self.count += 1
+		self.total += elapsed
+		self.max = max(self.max, elapsed)
+
+	@property
+	def mean(self):
+		return self.total/self.count if self.count else 0.0
+
+	def __repr__(self):
+		return "count={} mean={:.3f}ms max={:.3f}ms".format(self.count, 1000*self.mean, 1000*self.max)
+
+
 class LedManagerHermesMqtt(HermesClient): 
 	"""Hermes MQTT server for Rhasspy Dialogue Manager."""
 
@@ -152,6 +210,26 @@ class LedManagerHermesMqtt(HermesClient):
 				hw_led,
 				pattern=None,
 				site_ids: typing.Optional[typing.List[str]] = None,
+				probe_hw: bool = False,
+				max_fps: typing.Optional[float] = None,
+				speak_envelope: bool = False,
+				snapshot_file: typing.Optional[str] = None,
+				snapshot_interval: float = DEFAULT_SNAPSHOT_INTERVAL,
+				pattern_cache_dir: typing.Optional[str] = None,
+				render_fps: typing.Optional[float] = None,
+				dither: bool = False,
+				hw_writer_process: bool = False,
+				clock=None,
+				profile_dir: typing.Optional[str] = None,
+				watchdog: bool = True,
+				adaptive_quality: bool = True,
+				ingress_rate: typing.Optional[float] = DEFAULT_INGRESS_RATE,
+				ingress_burst: int = DEFAULT_INGRESS_BURST,
+				ingress_strategy: str = DEFAULT_INGRESS_STRATEGY,
+				ingress_qos: int = 0,
+				azimuth_grid: bool = False,
+				colormap: str = DEFAULT_COLORMAP,
+				tracked_colormap: str = TRACKS_COLORMAP,
 	#       wakeword_ids: typing.Optional[typing.List[str]] = None,
 	#       sound_paths: typing.Optional[typing.Dict[str, Path]] = None,
 	#       session_timeout: float = 30.0,
@@ -162,57 +240,354 @@ class LedManagerHermesMqtt(HermesClient):
 		if pattern is None:
 			_LOGGER.info("Using default pattern: " + str(defualt_pattern))
 			pattern = defualt_pattern
+		if pattern not in available_led_patterns:
+			pattern = defualt_pattern
+		self.pattern_name = pattern
+		self.hw_led = hw_led
+		# the animations and the energy timing run on this clock (e.g. accelerated, see clock)
+		self.clock = clock if clock is not None else DEFAULT_CLOCK
+		# the pattern frame tables are compiled once and mapped from the cache dir at the next starts
+		self.pattern_tables = PatternTableCache(pattern_cache_dir)
+		# on-demand sampling profiles (admin topic or SIGUSR1), nothing runs until one is asked
+		self.profiler = SamplingProfiler(profile_dir)
+		# the board can be written by a dedicated process, at its own rate
+		self.hw_writer_fps = max_fps or DEFAULT_WRITER_FPS
+		self.hw_writer_process = hw_writer_process
+		if probe_hw and hw_writer_process:
+			# the probe would time the shared memory hand over, not the write of the writer process
+			raise LedManagerHermesMqttException("The board cannot be probed with the led writer process, set the max fps instead")
 		if hw_led in  available_hw:
-			if pattern in available_led_patterns:
-				self.pixels = available_hw[hw_led](pattern=available_led_patterns[pattern])  # available_hw[hw_led]# Respeaker4MicArray()
-			else:
-				self.pixels = available_hw[hw_led](pattern=available_led_patterns[defualt_pattern])
+			self.pixels = self._make_board(hw_led, available_led_patterns[pattern])  # available_hw[hw_led]# Respeaker4MicArray()
 			_LOGGER.info("Loading hw: " + hw_led)
 		else:
 			_LOGGER.error("Hw board  " + hw_led + " not recognized, available " + str(available_hw.keys()))
 			raise LedManagerHermesMqttException("Hw board not recognized: " + str(hw_led))
 		
-		self.tracked_energies = tracked_sources(callback=self.tracked_sources_update)
-		self.localized_energies = localized_sources(callback=self.localized_sources_update)
+		# Limit the frame rate to what the board can output, probed or set by the user
+		if probe_hw:
+			self.probe_hw()
+		if max_fps:
+			self.pixels.max_fps = max_fps
+		# Smooth low brightness: dithered 8 bit output, keyframes interpolated at the render rate.
+		# The dithering runs on the render ticks (unchanged frames are not written again), so it implies them
+		self.pixels.dither = dither
+		if dither and not render_fps:
+			render_fps = self.pixels.max_fps or DEFAULT_DITHER_FPS
+		if render_fps:
+			self.pixels.start_render(render_fps)
 		
-		# Subscribe Hermese Protocol topics
-		self.subscribe(
-			AsrStartListening,
-			AsrStopListening,
-			#DialogueStartSession,
-			DialogueSessionStarted,
-			DialogueSessionEnded,
-			DialogueSessionQueued,
-			#DialogueContinueSession,
-			#DialogueEndSession,
-			#DialogueConfigure,
-			TtsSayFinished,
-			NluIntent,
-			NluIntentNotRecognized,
-			AsrTextCaptured,
-			HotwordDetected,
-			AudioPlayFinished,
-		)
+		self.led_state = LedStateMachine(self.pixels, clock=self.clock)
+		self.tracked_energies = tracked_sources(callback=self.tracked_sources_update, clock=self.clock)
+		# the DOAs can be placed on the ring with a precomputed (x, y) lookup instead of arctan2, see AzimuthGrid
+		# energy -> spot colors of the overlays, the tracked one keeps the color of each track by default
+		self.colormap = Colormap(colormap)
+		self.tracked_colormap = None if tracked_colormap == TRACKS_COLORMAP else Colormap(tracked_colormap)
+		self.localized_energies = localized_sources(callback=self.localized_sources_update, clock=self.clock,
+													azimuth_grid=AzimuthGrid() if azimuth_grid else None)
+		
+		# Subscribe Hermese Protocol topics, one per message type with a declared handler
+		self.handlers = self._collect_handlers()
+		self.envelope_window = DEFAULT_ENVELOPE_WINDOW
+		# the TtsSay ids (-> session id) whose audio is spoken, the other sounds (e.g. the feedback beeps)
+		# do not change the dialogue state, and the request being spoken
+		self._tts_requests = OrderedDict()
+		self._speaking_request = None
+		if not speak_envelope:
+			# the speaking animation from the played audio is optional, it needs the whole WAVs
+			self.handlers.pop(AudioPlayBytes)
+			self.handlers.pop(TtsSay)
+		self.handler_timing = defaultdict(HandlerTiming)
+		self.subscribe(*self.handlers)
 		
 		# Subscribe Other MQTT messages topics{'lisa/': 	['ssl/source', 'sst/source'],}
-		self.subscribe(SSL_src_msg, SST_src_msg)
+		# These are decoded on the raw payload (see on_raw_message), no SSL_src_msg/SST_src_msg is built
+		self.raw_handlers = {
+			SSL_src_msg.topic(): self.on_ssl_payload,
+			SST_src_msg.topic(): self.on_sst_payload,
+			ADMIN_RELOAD_TOPIC: self.on_admin_reload,
+			ADMIN_PROFILE_TOPIC: self.on_admin_profile,
+		}
+		self._reload_lock = threading.Lock()
+		# The localization topics are shared by the sites (the payload may carry a siteId) or per site,
+		# lisa/ssl/source/<siteId>: the sources of the other sites are dropped (see on_raw_message)
+		self.localization_topics = (SSL_src_msg.topic(), SST_src_msg.topic())
+		self.site_topics = tuple(topic + '/' + site for topic in self.localization_topics
+								 for site in (sorted(self.site_ids) or ['+']))
+		self.subscribe_topics(*self.raw_handlers, *self.site_topics)
+		# The localization topics are rate limited per site and topic before they are queued (see ingress),
+		# None: no limit
+		self.ingress = None
+		if ingress_rate:
+			self.ingress = IngressLimiter(self.localization_topics, rate=ingress_rate, burst=ingress_burst,
+										  strategy=ingress_strategy, qos=ingress_qos, clock=self.clock)
+
+		# Clear the energy layers once the sources stop, so the leds can go idle (see _layer_expiry_loop)
+		self._t_layers = 0.0
+		self._layers_lit = threading.Event()
+		threading.Thread(target=self._layer_expiry_loop, name="led-layers", daemon=True).start()
+
+		# Watch the loop lag, the frame cadence and the transition waits. When they are late, either the
+		# adaptive quality steps down or (without it) the manager degrades: the overlays are redrawn at most
+		# every overlay_interval and the keyframes are not interpolated. One owner, not both at once
+		self.overlay_interval = 0.0
+		self._t_overlay = {'localized': 0.0, 'tracked': 0.0}
+		# Adaptive quality: at every watchdog window the cost of the energy frames is checked against the
+		# budget, the overlay quality is stepped down (up) accordingly, see quality
+		self.sst_overlay = True
+		self._full_quality = (self.pixels.max_fps, self.pixels.dither)
+		self.quality = QualityController(self._apply_quality) if watchdog and adaptive_quality else None
+		self.watchdog = None
+		if watchdog:
+			# only while the leds are active, an idle satellite is not woken up (see Pixels.wait_active)
+			self.watchdog = Watchdog(alert=self.publish_watchdog_status, clock=self.clock,
+									 degrade=self.degrade if self.quality is None else None,
+									 on_window=self._quality_window if self.quality is not None else None,
+									 wait_active=lambda: self.pixels.wait_active())
+			self.pixels.monitor = self.watchdog
+			self.watchdog.start()
+
+		# Restore the visual state of the previous run, then keep snapshotting it
+		self.snapshot = None
+		if snapshot_file:
+			self.snapshot = StateSnapshot(snapshot_file, self.pixels.pixels_number, self.localized_energies.n_spots)
+			self.restore_snapshot()
+			self._snapshot_stop = threading.Event()
+			threading.Thread(target=self._snapshot_loop, args=(snapshot_interval,), daemon=True).start()
 
 	def localized_sources_update(self):
 		# self.localized_energies
 		# map the energy level in a vector of RGBs
-		data_array_rgb = [[int(LED_MAX_VAL*e.energy_plane_xy), 0, 0] for e in self.localized_energies.energies]
+		if not self._overlay_due('localized'):
+			return
+		data_array_rgb = self.colormap(self.localized_energies)
 		self.pixels.set_all(data_array_rgb, persist_data=False, adding_policy='add') # Avoid having priority with other visual messages (e.g. dialogue states)
-		#print('tracked_sources_update: ' + str(data_array_rgb))
 	
 	def tracked_sources_update(self):
 		# self.tracked_energies
 		# map the energy level in a vector of RGBs
-		data_array_rgb = [[0, int(LED_MAX_VAL*e.energy_axis_z), int(LED_MAX_VAL*e.energy_plane_xy)] for e in self.tracked_energies.energies]
+		# map the tracks overlay (each track with its own color) in a vector of RGBs
+		if not self._overlay_due('tracked'):
+			return
+		if self.tracked_colormap is None:
+			data_array_rgb = LED_MAX_VAL*self.tracked_energies.rgb
+		else:
+			data_array_rgb = self.tracked_colormap(self.tracked_energies)
 		self.pixels.set_all(data_array_rgb, persist_data=False, adding_policy='max') # Avoid having priority with other visual messages (e.g. dialogue states)
-		#print('tracked_sources_update: '+ str(data_array_rgb)) 
 		
+	def _overlay_due(self, layer):
+		"""False if the overlay layer was redrawn less than overlay_interval ago (its energies are still updated)"""
+		if not self.overlay_interval:
+			return True
+		now = self.clock.monotonic()
+		if now - self._t_overlay[layer] < self.overlay_interval:
+			return False
+		self._t_overlay[layer] = now
+		return True
+
+	def _quality_window(self, status):
+		self.quality.update(self.watchdog.window, late=bool(status['exceeded']))
+
+	def _apply_quality(self, level):
+		steps_down = self.quality.steps_down
+		max_fps, dither = self._full_quality
+		spot_decimation = LOW_QUALITY_SPOT_DECIMATION if 'spot_resolution' in steps_down else 1
+		if self.loop is not None:
+			# the energies are splatted on the loop, they change resolution there
+			self.loop.call_soon_threadsafe(self._set_spot_decimation, spot_decimation)
+		else:
+			self._set_spot_decimation(spot_decimation)
+		self.sst_overlay = 'sst_overlay' not in steps_down
+		self.pixels.max_fps = min(max_fps or LOW_QUALITY_FPS, LOW_QUALITY_FPS) if 'fps' in steps_down else max_fps
+		self.pixels.dither = dither and 'dither' not in steps_down
+
+	def _set_spot_decimation(self, k):
+		"""Splat and draw the overlays on k times fewer spots (coarser kernels, cheaper messages)"""
+		self.localized_energies.set_spot_decimation(k)
+		self.tracked_energies.set_spot_decimation(k)
+
+	def degrade(self, degraded):
+		"""Lower the overlay rate and skip the keyframe interpolation (degraded), or restore them"""
+		self.overlay_interval = DEGRADED_OVERLAY_INTERVAL if degraded else 0.0
+		self.pixels.interpolate = not degraded
+		_LOGGER.warning("Degraded mode {}".format("on: overlays at {:.0f} fps, no interpolation".format(
+			1.0/DEGRADED_OVERLAY_INTERVAL) if degraded else "off"))
+
+	def publish_watchdog_status(self, status):
+		status['siteId'] = min(self.site_ids) if self.site_ids else 'default'
+		self.mqtt_client.publish(WATCHDOG_STATUS_TOPIC, json.dumps(status))
+
+	def on_ssl_payload(self, payload):
+		sources, _ = decode_ssl(payload)
+		self.localized_energies.update_batch(sources)
+		self._layers_updated()
+
+	def on_sst_payload(self, payload):
+		if not self.sst_overlay:
+			# dropped by the adaptive quality
+			return
+		sources, ids = decode_sst(payload)
+		self.tracked_energies.update_batch(sources, ids)
+		self._layers_updated()
+
+	def _layers_updated(self):
+		self._t_layers = self.clock.monotonic()
+		self._layers_lit.set()
+
+	def _layer_expiry_loop(self):
+		"""
+		Clear the energy layers layer_timeout after the last source. The thread only runs while the layers
+		are lit, it waits for the next SSL/SST message otherwise.
+		"""
+		while True:
+			self._layers_lit.wait()
+			wait = self._t_layers + DEFAULT_LAYER_TIMEOUT - self.clock.monotonic()
+			if wait > 0.0:
+				self.clock.sleep(wait)
+				continue
+			self._layers_lit.clear()
+			if self.clock.monotonic() - self._t_layers < DEFAULT_LAYER_TIMEOUT:
+				# a source arrived in between
+				self._layers_lit.set()
+				continue
+			if self.loop is not None:
+				# the energies are splatted on the loop, they are cleared there (between two messages)
+				self.loop.call_soon_threadsafe(self._clear_layers)
+			else:
+				self._clear_layers()
+
+	def _clear_layers(self):
+		if self.clock.monotonic() - self._t_layers < DEFAULT_LAYER_TIMEOUT:
+			# a source arrived since the expiry was scheduled
+			return
+		self.localized_energies.clear()
+		self.tracked_energies.clear()
+
+	# -------------------------------------------------------------------------
+
+	def save_snapshot(self):
+		self.snapshot.save(self.led_state.state, self.pixels.ledbuffer, self.localized_energies, self.tracked_energies)
+
+	def restore_snapshot(self):
+		"""Show again the last snapshot: persisted layer, energy overlays and (if recent) the dialogue state"""
+		restored = self.snapshot.restore(self.localized_energies, self.tracked_energies)
+		if restored is None:
+			return False
+		state, led_buffer = restored
+		_LOGGER.info("Restore snapshot: state {} ({:.1f} s old)".format(state, self.snapshot.age))
+		self.pixels.show(led_buffer)
+		self.localized_sources_update()
+		self.tracked_sources_update()
+		if self.snapshot.age < DEFAULT_SNAPSHOT_MAX_AGE:
+			self.led_state.restore(state)
+		return True
+
+	def _snapshot_loop(self, interval):
+		while not self._snapshot_stop.wait(interval):
+			try:
+				self.save_snapshot()
+			except Exception:
+				_LOGGER.exception("save_snapshot")
+			# nothing changes while the leds are idle, the last snapshot holds until they are active again
+			self.pixels.wait_active()
+
+	def stop_snapshot(self):
+		if self.snapshot is not None:
+			self._snapshot_stop.set()
+			self.save_snapshot()
+			self.snapshot.flush()
+
 	# -------------------------------------------------------------------------
 
+	def on_admin_reload(self, payload):
+		request = json.loads(payload) if payload.strip() else {}
+		site_id = request.get('siteId')
+		if site_id and self.site_ids and site_id not in self.site_ids:
+			return
+		self.reload(pattern=request.get('pattern'), hw_led=request.get('hw_board'))
+
+	def on_admin_profile(self, payload):
+		request = json.loads(payload) if payload.strip() else {}
+		site_id = request.get('siteId')
+		if site_id and self.site_ids and site_id not in self.site_ids:
+			return
+		self.profile(request.get('duration', DEFAULT_PROFILE_DURATION))
+
+	def profile(self, duration=DEFAULT_PROFILE_DURATION):
+		"""Sample the threads for duration seconds in background, the profile files are written in profile_dir"""
+		try:
+			self.profiler.start(duration)
+		except ProfilerException as e:
+			_LOGGER.warning(str(e))
+
+	def reload(self, pattern=None, hw_led=None):
+		"""
+		Reload the pattern from its source (or switch to pattern) and/or switch the board, in background.
+		The leds keep the current frame while the new pattern is compiled, then it is swapped in between
+		two frames and the current dialogue state is shown again on it.
+		"""
+		threading.Thread(target=self._reload, args=(pattern, hw_led), daemon=True).start()
+
+	def _reload(self, pattern, hw_led):
+		with self._reload_lock:
+			try:
+				pattern = pattern or self.pattern_name
+				hw_led = hw_led or self.hw_led
+				if hw_led not in available_hw:
+					raise LedManagerHermesMqttException("Hw board not recognized: " + str(hw_led))
+				t_start = time.perf_counter()
+				pattern_class = self._reload_pattern_class(pattern)
+				if hw_led != self.hw_led:
+					pixels = self._make_board(hw_led, pattern_class)
+					reload_time = time.perf_counter() - t_start
+					pixels.take_over(self.pixels)
+					self._replace_pixels(pixels)
+				else:
+					new_pattern = self.pixels.make_pattern(pattern_class, self.pattern_tables)
+					reload_time = time.perf_counter() - t_start
+					self.pixels.swap_pattern(new_pattern)
+				self.led_state.replay(self.pixels)
+				self.pattern_name, self.hw_led = pattern, hw_led
+			except Exception:
+				_LOGGER.exception("Reload of pattern {} on {} failed, keeping the current one".format(pattern, hw_led))
+				return
+			self.handler_timing['reload'].add(reload_time)
+			gap = self.pixels.wait_swap_frame(RELOAD_GAP_TIMEOUT)
+			if gap is not None:
+				self.handler_timing['reload frame gap'].add(gap)
+			_LOGGER.info("Reloaded pattern {} on {} in {:.1f} ms, frame gap {}".format(
+				pattern, hw_led, 1000*reload_time, "{:.1f} ms".format(1000*gap) if gap is not None else "none (no new frame)"))
+
+	@staticmethod
+	def _reload_pattern_class(pattern):
+		"""The pattern class, re-imported from its (possibly changed) source"""
+		if pattern not in available_led_patterns:
+			raise LedManagerHermesMqttException("Led pattern not recognized: " + str(pattern))
+		pattern_class = available_led_patterns[pattern]
+		module = importlib.reload(sys.modules[pattern_class.__module__])
+		pattern_class = getattr(module, pattern_class.__name__)
+		available_led_patterns[pattern] = pattern_class
+		return pattern_class
+
+	def _make_board(self, hw_led, pattern_class):
+		if not self.hw_writer_process:
+			return available_hw[hw_led](pattern=pattern_class, tables=self.pattern_tables, clock=self.clock)
+		# only imported with the writer process, see hw_writer
+		from .hw_writer import HwWriterBoard
+		try:
+			return HwWriterBoard(pattern=pattern_class, hw_board=hw_led, tables=self.pattern_tables, fps=self.hw_writer_fps,
+								 clock=self.clock)
+		except HwWriterException as e:
+			raise LedManagerHermesMqttException(str(e))
+
+	def _replace_pixels(self, pixels):
+		self.pixels = pixels
+		if self.snapshot is not None and self.snapshot.record['n_leds'] != pixels.pixels_number:
+			self.snapshot = StateSnapshot(self.snapshot.path, pixels.pixels_number, self.localized_energies.n_spots)
+
+	def probe_hw(self):
+		"""Measure the board write latency and limit the frame rate to what it can sustain"""
+		return self.pixels.probe()
+
 	@staticmethod
 	def get_available_hw():
 		return available_hw.keys()
@@ -221,70 +596,202 @@ class LedManagerHermesMqtt(HermesClient):
 	def get_available_patterns():
 		return available_led_patterns.keys()
 
+	# Every Hermes message handler is declared with @hermes_handler next to the LED state it drives,
+	# the handlers are collected in a type -> handler table when subscribing (see _collect_handlers).
+	# The LED states are transitions of self.led_state (see led_state.LedStateMachine)
+
 	# TODO: check all site_ids, reply should be only for the site id specified 
+	@hermes_handler(HotwordDetected)
+	def on_hotword_detected(self, message):
+		self.wakeup()
+
 	def wakeup(self):
-		_LOGGER.debug("enter wakeup")
-		self.pixels.off()
-		self.pixels.wakeup()
-		_LOGGER.debug("exit wakeup")
-
-	def start_listening_intent(self):
-		_LOGGER.debug("enter start_listening_intent")
-		self.pixels.off()
-		self.pixels.speak()
-		_LOGGER.debug("exit start_listening_intent")
-		
-	def stop_listening_intent(self):
-		_LOGGER.debug("enter stop_listening_intent")
-		self.pixels.off()
-		_LOGGER.debug("exit stop_listening_intent")
-		
-	def end_session(self):
-		_LOGGER.debug("enter end_session")
-		self.pixels.off()
-		_LOGGER.debug("exit end_session")
-
-	def start_thinking(self):
-		_LOGGER.debug("enter think")
-		self.pixels.off()
-		self.pixels.think()
-		_LOGGER.debug("exit think")
-	
-	def end_thinking(self):
-		_LOGGER.debug("enter think")
-		self.pixels.off()
-		_LOGGER.debug("exit think")
-	
-	def not_recognized(self):
-		_LOGGER.debug("enter not_recognized")
-		self.pixels.blink()
-		self.pixels.blink()
-		_LOGGER.debug("exit not_recognized")
-	
-	def recognized(self):
-		_LOGGER.debug("enter recognized")
-		self.pixels.blink()
-		_LOGGER.debug("exit recognized")
+		# point the wakeup to where the localized sources were while the hotword was said
+		azimuth = self.localized_energies.dominant_azimuth()
+		direction = rad2deg(azimuth) if azimuth is not None else 0
+		self.led_state.transition(WAKE, direction=direction)
+
+	@hermes_handler(DialogueSessionStarted)
+	def on_session_started(self, message):
+		self.led_state.start_session(message.session_id)
+
+	@hermes_handler(AsrStartListening)
+	def on_start_listening(self, message):
+		self.start_listening_intent(message.session_id)
+
+	def start_listening_intent(self, session_id=None):
+		self.led_state.transition(LISTENING, session_id)
+
+	@hermes_handler(AsrStopListening)
+	def on_stop_listening(self, message):
+		self.stop_listening_intent(message.session_id)
+
+	def stop_listening_intent(self, session_id=None):
+		# the text may already be captured (thinking), only leave the listening state
+		self.led_state.leave(LISTENING, session_id)
+
+	@hermes_handler(DialogueSessionEnded)
+	def on_session_ended(self, message):
+		self.end_session(message.session_id)
+
+	def end_session(self, session_id=None):
+		self.led_state.transition(IDLE, session_id)
+
+	@hermes_handler(AsrTextCaptured)
+	def on_text_captured(self, message):
+		# start only if a message was identified
+		if len(message.text) > 0:
+			self.start_thinking(message.session_id)
+
+	def start_thinking(self, session_id=None):
+		self.led_state.transition(THINKING, session_id)
+
+	def end_thinking(self, session_id=None):
+		self.led_state.leave(THINKING, session_id)
+
+	@hermes_handler(NluIntentNotRecognized)
+	def on_intent_not_recognized(self, message):
+		self.not_recognized(message.session_id)
+
+	def not_recognized(self, session_id=None):
+		self.led_state.transition(RESULT, session_id, recognized=False)
+
+	@hermes_handler(NluIntent)
+	def on_intent(self, message):
+		self.recognized(message.session_id)
+
+	def recognized(self, session_id=None):
+		self.led_state.transition(RESULT, session_id, recognized=True)
 	
 # ------------------
-	def speak(self):
-		_LOGGER.debug("enter speak")
-		self.pixels.off()
-		#self.pixels.speak()
-		_LOGGER.debug("exit speak")
-		
-	def end_speak(self):
-		_LOGGER.debug("enter end_speak")
-		self.pixels.off()
-		_LOGGER.debug("exit end_speak")
-		
-	def think(self):
-		_LOGGER.debug("enter think")
-		self.pixels.off()
-		#self.pixels.think()
-		_LOGGER.debug("exit think")
+	@hermes_handler(TtsSay)
+	def on_say(self, message):
+		# only subscribed with speak_envelope, the audio of the request is spoken (see on_play_bytes)
+		if message.id:
+			self._tts_requests[message.id] = message.session_id
+			while len(self._tts_requests) > MAX_TTS_REQUESTS:
+				self._tts_requests.popitem(last=False)
+
+	@hermes_handler(AudioPlayBytes)
+	def on_play_bytes(self, message, request_id=None):
+		# only subscribed with speak_envelope, the envelope is computed while the animation plays
+		if request_id not in self._tts_requests:
+			# not a TTS audio, e.g. the feedback beep of the recorded command while thinking
+			return
+		session_id = self._tts_requests.pop(request_id)
+		try:
+			envelope = rms_envelope(message.wav_bytes, self.envelope_window)
+		except ValueError as e:
+			_LOGGER.warning("AudioPlayBytes without envelope: {}".format(e))
+			envelope = None
+		if self.speak(session_id, envelope=envelope):
+			self._speaking_request = request_id
+
+	def speak(self, session_id=None, envelope=None):
+		return self.led_state.transition(SPEAKING, session_id, envelope=envelope, window=self.envelope_window)
+
+	@hermes_handler(AudioPlayFinished)
+	def on_play_finished(self, message):
+		# only the end of the spoken audio ends the speaking, not the end of a feedback sound
+		if message.id is not None and message.id == self._speaking_request:
+			self._speaking_request = None
+			self.end_speak()
+
+	def end_speak(self, session_id=None):
+		self.led_state.leave(SPEAKING, session_id)
+
+	@hermes_handler(DialogueSessionQueued, TtsSayFinished)
+	def on_no_led_change(self, message):
+		# Subscribed for the dialogue flow, no visual change
+		_LOGGER.debug("{}: {}".format(type(message).__name__, message))
 
-	
+	# -------------------------------------------------------------------------
+
+	def _collect_handlers(self):
+		"""Build the message type -> handler table from the methods declared with @hermes_handler"""
+		handlers = {}
+		for name in dir(type(self)):
+			method = getattr(type(self), name)
+			for message_type in getattr(method, "hermes_message_types", ()):
+				handlers[message_type] = getattr(self, name)
+		return handlers
+
+	def _timed_call(self, key, handler, arg):
+		t_start = time.perf_counter()
+		handler(arg)
+		elapsed = time.perf_counter() - t_start
+		self.handler_timing[key].add(elapsed)
+		return elapsed
+
+	def log_handler_timing(self):
+		for key, timing in self.handler_timing.items():
+			name = key if isinstance(key, str) else key.__name__
+			_LOGGER.info("Handler {}: {}".format(name, timing))
+		active, idle = self.pixels.activity()
+		_LOGGER.info("Renderer: active {:.1f} s, idle {:.1f} s ({:.1f}% idle)".format(
+			active, idle, 100.0*idle/(active + idle) if active + idle else 0.0))
+		if self.watchdog is not None:
+			_LOGGER.info("Watchdog: {} alerts{}".format(self.watchdog.alerts, ", degraded" if self.watchdog.degraded else ""))
+		if self.ingress is not None:
+			for key in self.ingress.keys():
+				_LOGGER.info("Ingress {}: {}".format(key_name(key), self.ingress.stats(key)))
+		if self.quality is not None:
+			_LOGGER.info("Quality: level {}, stepped down {}".format(self.quality.level, list(self.quality.steps_down)))
+
+	def mqtt_on_connect(self, client, userdata, flags, rc):
+		super().mqtt_on_connect(client, userdata, flags, rc)
+		if self.ingress is not None and self.ingress.qos:
+			for topic in self.localization_topics + self.site_topics:
+				client.subscribe(topic, self.ingress.qos)
+
+	def mqtt_on_message(self, client, userdata, msg):
+		"""Rate limit the localization topics (MQTT thread), the other messages are queued as they come"""
+		if self.ingress is not None:
+			topic, site_id = source_site(msg.topic, self.ingress.topics, msg.payload)
+			if topic is not None:
+				if not self.valid_site_id(site_id):
+					# not ours, it does not take a token (dropped again in on_raw_message without ingress)
+					return
+				key = (site_id, topic)
+				if self.in_queue is not None and self.in_queue.qsize() >= MAX_INGRESS_BACKLOG:
+					self.ingress.overflow(key)
+					return
+				msg, wait = self.ingress.offer(key, msg)
+				if wait is not None and self.loop is not None:
+					self.loop.call_soon_threadsafe(self.loop.call_later, wait, self._flush_ingress, key)
+				if msg is None:
+					return
+		super().mqtt_on_message(client, userdata, msg)
+
+	def _flush_ingress(self, key):
+		msg, wait = self.ingress.flush(key)
+		if wait is not None:
+			self.loop.call_later(wait, self._flush_ingress, key)
+		elif msg is not None and self.in_queue is not None:
+			self.in_queue.put_nowait(msg)
+
+	async def handle_messages_async(self, *args, **kwargs):
+		if self.watchdog is not None:
+			self.watchdog.loop = asyncio.get_event_loop()
+		await super().handle_messages_async(*args, **kwargs)
+
+	async def on_raw_message(self, topic: str, payload: bytes):
+		base_topic, site_id = source_site(topic, self.localization_topics, payload)
+		if base_topic is not None:
+			# as the Hermes handlers, a payload without site is for every site
+			if not self.valid_site_id(site_id):
+				return
+			topic = base_topic
+		handler = self.raw_handlers.get(topic)
+		if handler is not None:
+			try:
+				elapsed = self._timed_call(topic, handler, payload)
+			except Exception:
+				_LOGGER.exception("on_raw_message (topic=%s)", topic)
+				return
+			if self.quality is not None:
+				# the cost of the energy frames (the admin messages are negligible)
+				self.quality.cost.add(elapsed)
 
 	async def on_message(
 		self,
@@ -293,95 +800,12 @@ class LedManagerHermesMqtt(HermesClient):
 		session_id: typing.Optional[str] = None,
 		topic: typing.Optional[str] = None,
 	) -> GeneratorType:
-		# _LOGGER.debug("{}: {}".format(type(message), message))
-		if isinstance(message, SSL_src_msg ):
-			self.localized_energies.update(message)
-			pass# threading.Thread(target=self.speak,).start()# args=(1,))
-		elif isinstance(message, SST_src_msg):
-			self.tracked_energies.update(message)
-			pass# threading.Thread(target=self.speak,).start()# args=(1,))
-		elif isinstance(message, AsrTextCaptured):
-			_LOGGER.debug("AsrTextCaptured: {}".format(message))
-			# start only if a message was identified
-			if len(message.text) > 0:
-				threading.Thread(target=self.start_thinking,).start()#
-		elif isinstance(message, AsrStartListening):
-			_LOGGER.debug("AsrStartListening: {}".format(message))
-			threading.Thread(target=self.start_listening_intent,).start()
-		elif isinstance(message, AsrStopListening):
-			_LOGGER.debug("AsrStopListening: {}".format(message))
-			threading.Thread(target=self.stop_listening_intent,).start()
-		elif isinstance(message, AudioPlayFinished):
-			# Audio output finished
-			# play_finished_event = self.message_events[AudioPlayFinished].get(message.id)
-			_LOGGER.debug("AudioPlayFinished: {}".format(message))
-			# if play_finished_event:
-				# play_finished_event.set()
-		elif isinstance(message, DialogueConfigure):
-			_LOGGER.debug("DialogueConfigure: {}".format(message))
-			# Configure intent filter
-			# self.handle_configure(message)
-		# elif isinstance(message, DialogueStartSession):
-		elif isinstance(message, DialogueSessionStarted):
-			_LOGGER.debug("DialogueSessionStarted: {}".format(message))
-			#threading.Thread(target=self.speak,).start()# args=(1,))
-			
-			# Start session
-			# async for start_result in self.handle_start(message):
-				# yield start_result
-		elif isinstance(message, DialogueSessionEnded):
-			_LOGGER.debug("DialogueSessionEnded: {}".format(message))
-			threading.Thread(target=self.end_session,).start()
-			
-			# Start session
-			# async for start_result in self.handle_start(message):
-				# yield start_result
-		elif isinstance(message, DialogueContinueSession):
-			_LOGGER.debug("DialogueContinueSession: {}".format(message))
-			# Continue session
-			# async for continue_result in self.handle_continue(message):
-				# yield continue_result
-		elif isinstance(message, DialogueEndSession):
-			_LOGGER.debug("DialogueEndSession: {}".format(message))
-			# self.pixels.off()
-			# End session
-			# async for end_result in self.handle_end(message):
-				# yield end_result
-		elif isinstance(message, HotwordDetected):
-			_LOGGER.debug("HotwordDetected: {}".format(message))
-			threading.Thread(target=self.wakeup,).start()
-			# Wakeword detected
-			# assert topic, "Missing topic"
-			# wakeword_id = HotwordDetected.get_wakeword_id(topic)
-			# if (not self.wakeword_ids) or (wakeword_id in self.wakeword_ids):
-				# async for wake_result in self.handle_wake(wakeword_id, message):
-					# yield wake_result
-			# else:
-				# _LOGGER.warning("Ignoring wake word id=%s", wakeword_id)
-		elif isinstance(message, NluIntent):
-			_LOGGER.debug("NluIntent: {}".format(message))
-			threading.Thread(target=self.recognized,).start()
-			# Intent recognized
-			# await self.handle_recognized(message)
-		elif isinstance(message, NluIntentNotRecognized):
-			_LOGGER.debug("NluIntentNotRecognized: {}".format(message))
-			threading.Thread(target=self.not_recognized,).start()
-			# Intent not recognized
-			# async for play_error_result in self.maybe_play_sound(
-				# "error", site_id=message.site_id
-			# ):
-				# yield play_error_result
-
-			# async for not_recognized_result in self.handle_not_recognized(message):
-				# yield not_recognized_result
-		elif isinstance(message, TtsSayFinished):
-			_LOGGER.debug("TtsSayFinished: {}".format(message))
-			# Text to speech finished
-			# say_finished_event = self.message_events[TtsSayFinished].pop(
-				# message.id, None
-			# )
-			# if say_finished_event:
-				# say_finished_event.set()
+		handler = self.handlers.get(type(message))
+		if handler is not None and isinstance(message, AudioPlayBytes):
+			# the request id of the played audio is only in its topic (the session id given by the client)
+			handler = functools.partial(handler, request_id=session_id)
+		if handler is not None:
+			self._timed_call(type(message), handler, message)
 		else:
 			_LOGGER.warning("Unexpected message: %s", message)
 			
@@ -3,6 +3,7 @@
 import argparse
 import asyncio
 import logging
+import signal
 import typing
 from pathlib import Path
 
@@ -10,6 +11,11 @@ import paho.mqtt.client as mqtt
 import rhasspyhermes.cli as hermes_cli
 
 from . import LedManagerHermesMqtt, LedManagerHermesMqttException
+from .snapshot import DEFAULT_SNAPSHOT_INTERVAL
+from .clock import AcceleratedClock
+from .watchdog import WATCHDOG_STATUS_TOPIC
+from .colormaps import COLORMAPS, DEFAULT_COLORMAP, TRACKS_COLORMAP, select_colormap
+from .ingress import DEFAULT_INGRESS_RATE, DEFAULT_INGRESS_BURST, DEFAULT_INGRESS_STRATEGY, INGRESS_STRATEGIES, INGRESS_QOS
 
 _LOGGER = logging.getLogger("rhasspylisa_ledmanager")
 
@@ -26,6 +32,46 @@ def main():
 	parser.add_argument("--led-pattern", 
 						nargs='?', default=led_pattern, const=led_pattern, 
 						help="Select one led pattern: " + str(LedManagerHermesMqtt.get_available_patterns())+ ', default is: ' + led_pattern,)
+	parser.add_argument("--probe-hw", action="store_true",
+						help="Measure the board write latency at startup and limit the frame rate accordingly (not with --hw-writer-process)",)
+	parser.add_argument("--max-fps", type=float, default=None,
+						help="Maximum frame rate written to the leds (overrides the probed one)",)
+	parser.add_argument("--speak-envelope", action="store_true",
+						help="Animate the speak pattern with the envelope of the TTS audio played on the site (not the other sounds)",)
+	parser.add_argument("--snapshot-file", default=None,
+						help="Memory-mapped file where the led state is snapshotted, and restored from at start",)
+	parser.add_argument("--snapshot-interval", type=float, default=DEFAULT_SNAPSHOT_INTERVAL,
+						help="Seconds between two snapshots (default: " + str(DEFAULT_SNAPSHOT_INTERVAL) + ")",)
+	parser.add_argument("--pattern-cache-dir", default=None,
+						help="Directory where the compiled pattern frame tables are cached and mapped from at the next starts",)
+	parser.add_argument("--render-fps", type=float, default=None,
+						help="Render the leds at this rate, interpolating between the pattern frames",)
+	parser.add_argument("--dither", action="store_true",
+						help="Temporal dithering of the 8 bit led output (smoother low brightness), renders at MAX_FPS (default 100) without --render-fps",)
+	parser.add_argument("--hw-writer-process", action="store_true",
+						help="Write the leds from a dedicated process (frames handed over in shared memory)",)
+	parser.add_argument("--profile-dir", default=None,
+						help="Directory where the profiles (SIGUSR1 or admin topic) are written (default: the temp dir)",)
+	parser.add_argument("--no-watchdog", action="store_true",
+						help="Do not watch the loop lag and the frame cadence (no alert on " + WATCHDOG_STATUS_TOPIC + ", never degraded)",)
+	parser.add_argument("--no-adaptive-quality", action="store_true",
+						help="Do not step the overlay quality down under load (spot resolution, SST overlay, fps, dithering)",)
+	parser.add_argument("--ingress-rate", type=float, default=DEFAULT_INGRESS_RATE,
+						help="Max messages/s of each localization topic (lisa/ssl/source, lisa/sst/source), 0: no limit (default: " + str(DEFAULT_INGRESS_RATE) + ")",)
+	parser.add_argument("--ingress-burst", type=int, default=DEFAULT_INGRESS_BURST,
+						help="Messages of a localization topic accepted in a burst over the rate (default: " + str(DEFAULT_INGRESS_BURST) + ")",)
+	parser.add_argument("--ingress-strategy", choices=INGRESS_STRATEGIES, default=DEFAULT_INGRESS_STRATEGY,
+						help="Messages over the rate are merged (only the latest one is delivered) or dropped (default: " + DEFAULT_INGRESS_STRATEGY + ")",)
+	parser.add_argument("--ingress-qos", type=int, choices=INGRESS_QOS, default=0,
+						help="MQTT QoS of the localization topics subscriptions (default: 0, the broker may drop them)",)
+	parser.add_argument("--azimuth-grid", action="store_true",
+						help="Place the DOAs on the ring with a precomputed (x, y) lookup grid instead of arctan2 (at most one position off for elevations up to 78 deg)",)
+	parser.add_argument("--colormap", action="append", default=None,
+						help="Colormap of the localized overlay, NAME or SITE:NAME for a site (repeatable), NAME in " + str(sorted(COLORMAPS)) + " (default: " + DEFAULT_COLORMAP + ")",)
+	parser.add_argument("--tracked-colormap", action="append", default=None,
+						help="Colormap of the tracked overlay, as --colormap or " + TRACKS_COLORMAP + " for a color per track (default: " + TRACKS_COLORMAP + ")",)
+	parser.add_argument("--clock-speed", type=float, default=None,
+						help="Run the animations and the energy timing this many times faster than real time (e.g. offline rendering)",)
 	# parser.add_argument(
 		# "--hw-led",
 		# action="append",
@@ -59,6 +105,17 @@ def main():
 	else: 
 		_LOGGER.debug("Selected led pattern is default %s", led_pattern)
 
+	if args.probe_hw and args.hw_writer_process:
+		parser.error("--probe-hw cannot time the writes of --hw-writer-process, set --max-fps instead")
+
+	# the colormaps of this site (the first site id)
+	site_id = args.site_id[0] if args.site_id else 'default'
+	try:
+		colormap = select_colormap(args.colormap, site_id)
+		tracked_colormap = select_colormap(args.tracked_colormap, site_id, default=TRACKS_COLORMAP)
+	except ValueError as e:
+		parser.error(str(e))
+
 	# Listen for messages
 	client = mqtt.Client()
 	try:
@@ -67,6 +124,26 @@ def main():
 			site_ids=args.site_id,
 			hw_led=hw_board,
 			pattern=led_pattern,
+			probe_hw=args.probe_hw,
+			max_fps=args.max_fps,
+			speak_envelope=args.speak_envelope,
+			snapshot_file=args.snapshot_file,
+			snapshot_interval=args.snapshot_interval,
+			pattern_cache_dir=args.pattern_cache_dir,
+			render_fps=args.render_fps,
+			dither=args.dither,
+			hw_writer_process=args.hw_writer_process,
+			clock=AcceleratedClock(args.clock_speed) if args.clock_speed else None,
+			profile_dir=args.profile_dir,
+			watchdog=not args.no_watchdog,
+			adaptive_quality=not args.no_adaptive_quality,
+			ingress_rate=args.ingress_rate,
+			ingress_burst=args.ingress_burst,
+			ingress_strategy=args.ingress_strategy,
+			ingress_qos=args.ingress_qos,
+			azimuth_grid=args.azimuth_grid,
+			colormap=colormap,
+			tracked_colormap=tracked_colormap,
 		)
 
 		_LOGGER.debug("Site %s Connecting to %s:%s", args.site_id, args.host, args.port)
@@ -76,6 +153,13 @@ def main():
 		_LOGGER.fatal("Fatal Error creating Led Manager -> " + str(e))
 		return -1
 
+	if hasattr(signal, "SIGHUP"):
+		# SIGHUP reloads the led pattern from its source, without restarting
+		signal.signal(signal.SIGHUP, lambda signum, frame: hermes.reload())
+	if hasattr(signal, "SIGUSR1"):
+		# SIGUSR1 profiles the manager for DEFAULT_PROFILE_DURATION s
+		signal.signal(signal.SIGUSR1, lambda signum, frame: hermes.profile())
+
 	try:
 		# Run event loop
 		asyncio.run(hermes.handle_messages_async())
@@ -83,6 +167,9 @@ def main():
 		pass
 	finally:
 		_LOGGER.debug("Shutting down")
+		hermes.log_handler_timing()
+		hermes.stop_snapshot()
+		hermes.pixels.close()
 		client.loop_stop()
 
 
@@ -0,0 +1,50 @@
+"""Short-window RMS envelope of a WAV payload, computed block by block while it is played"""
+import numpy
+
+from .utils import parse_wav_header, WAV_FORMAT_PCM
+
+DEFAULT_ENVELOPE_WINDOW = 0.02 # s, one brightness step of the speak animation
+DEFAULT_BLOCK_WINDOWS = 25 # windows computed per numpy call (0.5 s at the default window)
+ENVELOPE_FLOOR_DB = -50.0 # dBFS mapped to level 0, 0 dBFS is level 1
+
+_SAMPLE_DTYPES = {1: numpy.uint8, 2: numpy.int16, 4: numpy.int32}
+
+
+def rms_envelope(wav_bytes, window=DEFAULT_ENVELOPE_WINDOW, block_windows=DEFAULT_BLOCK_WINDOWS):
+	"""
+	Generator of the envelope levels (0..1, log scale) of a WAV payload, one per window of audio.
+	The header is parsed at once (ValueError if it is malformed or the samples are not PCM), so a bad
+	payload fails in the caller and not where the envelope is consumed.
+	The samples are viewed in place and reduced a block of windows at a time, so only one block is
+	converted to float and the envelope can be consumed while the audio is played.
+	"""
+	info = parse_wav_header(wav_bytes)
+	dtype = _SAMPLE_DTYPES.get(info.sample_width)
+	if dtype is None or info.audio_format != WAV_FORMAT_PCM:
+		raise ValueError("WAV samples not supported: format {}, {} bytes".format(info.audio_format, info.sample_width))
+	samples = numpy.frombuffer(wav_bytes, dtype=dtype, count=info.data_size//info.sample_width, offset=info.data_offset)
+	return _levels(samples, info, max(1, int(info.sample_rate*window)), block_windows)
+
+
+def _levels(samples, info, window_frames, block_windows):
+	block = window_frames*block_windows*info.channels
+	for start in range(0, len(samples), block):
+		for level in _block_levels(samples[start:start + block], info.channels, info.sample_width, window_frames):
+			yield level
+
+
+def _block_levels(samples, channels, width, window_frames):
+	"""Envelope levels of a block of interleaved samples, vectorized over the windows of the block"""
+	full_scale = float(1 << (8*width - 1))
+	samples = samples[:len(samples) - len(samples) % channels].reshape(-1, channels)
+	if width == 1:
+		# 8 bit WAV is unsigned
+		mono = samples.mean(axis=1, dtype=numpy.float32) - 128.0
+	else:
+		mono = samples.mean(axis=1, dtype=numpy.float32)
+	n_windows = -(-len(mono)//window_frames)
+	padded = numpy.zeros(n_windows*window_frames, dtype=numpy.float32)
+	padded[:len(mono)] = mono/full_scale
+	rms = numpy.sqrt(numpy.mean(numpy.square(padded.reshape(n_windows, window_frames)), axis=1))
+	db = 20.0*numpy.log10(numpy.maximum(rms, 1e-6))
+	return numpy.clip(1.0 - db/ENVELOPE_FLOOR_DB, 0.0, 1.0)
@@ -0,0 +1,60 @@
+"""
+Clocks of the animations and of the energy timing, injected in Pixels, the patterns and the energy sources.
+
+- RealClock: time.monotonic/time.sleep
+- AcceleratedClock: the real clock running speed times faster (e.g. offline rendering, CI runs)
+- VirtualClock: sleeping only advances the clock, for deterministic tests and profiling
+"""
+import threading
+import time
+
+
+class RealClock:
+	speed = 1.0
+
+	def monotonic(self):
+		return time.monotonic()
+
+	def sleep(self, seconds):
+		time.sleep(seconds)
+
+	def timer(self, seconds, function):
+		"""A (not started) threading.Timer calling function after seconds of this clock"""
+		return threading.Timer(seconds/self.speed, function)
+
+
+class AcceleratedClock(RealClock):
+	"""The real clock, speed times faster: it starts at the real time and sleeps last 1/speed"""
+	def __init__(self, speed):
+		self.speed = float(speed)
+		self._real_start = time.monotonic()
+
+	def monotonic(self):
+		return self._real_start + (time.monotonic() - self._real_start)*self.speed
+
+	def sleep(self, seconds):
+		time.sleep(seconds/self.speed)
+
+
+class VirtualClock(RealClock):
+	"""A clock that only moves when slept on (or advanced), sleeping returns at once"""
+	def __init__(self, start=0.0):
+		self.now = start
+		self._lock = threading.Lock()
+
+	def monotonic(self):
+		return self.now
+
+	def sleep(self, seconds):
+		self.advance(seconds)
+
+	def advance(self, seconds):
+		with self._lock:
+			self.now += max(0.0, seconds)
+
+	def timer(self, seconds, function):
+		# the time of the timer has already passed once it is waited on, it fires at once
+		return threading.Timer(0.0, function)
+
+
+DEFAULT_CLOCK = RealClock()
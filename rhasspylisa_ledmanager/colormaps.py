@@ -0,0 +1,123 @@
+"""
+Energy -> color of the overlay spots, with precomputed colormap lookup tables.
+
+A colormap is a COLORMAP_SIZE x 3 float table. The energy of a spot (clipped to [0, 1]) is interpolated
+between two entries, so a whole overlay is mapped with two gathers whatever the colormap, and keeps its
+fractional part for the 8.8 fixed point output (see pixels.FRAME_FRACTION_BITS) and the dithering:
+- energy colormaps (red, green, blue, viridis, heat) have the brightness baked in, the entry i is the
+  color at i scaled by i/255 (no energy, no light: the overlays are added to the dialogue states)
+- elevation colormaps (elevation) are a hue per elevation of the energy (energy_axis_z/level, from below to
+  above the plane), scaled by the level of the spot
+The colormap of a site is selected with NAME or SITE:NAME specs, see select_colormap.
+"""
+import numpy
+
+from .pixels import LED_MAX_VAL
+
+COLORMAP_SIZE = 256 # entries of a colormap table
+DEFAULT_COLORMAP = 'red'
+TRACKS_COLORMAP = 'tracks' # the tracked overlay keeps the color of each track (see tracked_sources)
+
+# (position, r, g, b) anchors of viridis, interpolated in between
+VIRIDIS_ANCHORS = (
+	(0.0, 68, 1, 84),
+	(0.125, 71, 44, 122),
+	(0.25, 59, 82, 139),
+	(0.375, 44, 114, 142),
+	(0.5, 33, 145, 140),
+	(0.625, 39, 173, 129),
+	(0.75, 94, 201, 98),
+	(0.875, 170, 220, 50),
+	(1.0, 253, 231, 37),
+)
+HEAT_ANCHORS = (
+	(0.0, 0, 0, 0),
+	(0.35, 255, 0, 0),
+	(0.7, 255, 160, 0),
+	(1.0, 255, 255, 200),
+)
+ELEVATION_HUES = (240.0, 0.0) # deg, hue of the energy straight below and straight above (green on the plane)
+
+
+def _interpolate(anchors):
+	positions, r, g, b = numpy.array(anchors, dtype=float).T
+	x = numpy.linspace(0.0, 1.0, COLORMAP_SIZE)
+	return numpy.column_stack([numpy.interp(x, positions, c) for c in (r, g, b)])
+
+
+def _hues(hues):
+	"""Full saturation colors of the hues (deg)"""
+	h = (numpy.asarray(hues, dtype=float) % 360.0)/60.0
+	x = 1.0 - numpy.abs(h % 2.0 - 1.0)
+	sector = h.astype(int) % 6
+	rgb = numpy.zeros((len(h), 3))
+	# (r, g, b) of the sectors: 1 at the dominant channel, x at the rising/falling one
+	for s, (full, part) in enumerate(((0, 1), (1, 0), (1, 2), (2, 1), (2, 0), (0, 2))):
+		rgb[sector == s, full] = 1.0
+		rgb[sector == s, part] = x[sector == s]
+	return LED_MAX_VAL*rgb
+
+
+def _brightness(colors):
+	"""Bake the brightness of the entries in the colors"""
+	return colors*numpy.linspace(0.0, 1.0, COLORMAP_SIZE)[:, None]
+
+
+def _single(channel):
+	colors = numpy.zeros((COLORMAP_SIZE, 3))
+	colors[:, channel] = LED_MAX_VAL
+	return colors
+
+
+# name -> (colors of the entries, by elevation)
+COLORMAPS = {
+	'red': (lambda: _brightness(_single(0)), False),
+	'green': (lambda: _brightness(_single(1)), False),
+	'blue': (lambda: _brightness(_single(2)), False),
+	'viridis': (lambda: _brightness(_interpolate(VIRIDIS_ANCHORS)), False),
+	'heat': (lambda: _interpolate(HEAT_ANCHORS), False), # black at 0, no brightness to bake
+	'elevation': (lambda: _hues(numpy.linspace(*ELEVATION_HUES, COLORMAP_SIZE)), True),
+}
+
+
+class Colormap:
+	"""A colormap table, mapping the energies of a base_sources to the (n_spots, 3) RGBs of its spots"""
+	def __init__(self, name=DEFAULT_COLORMAP):
+		if name not in COLORMAPS:
+			raise ValueError("Colormap not in {}: {}".format(sorted(COLORMAPS), name))
+		self.name = name
+		build, self.by_elevation = COLORMAPS[name]
+		# not rounded, so red maps the energy e exactly as LED_MAX_VAL*e did, fractional part included
+		self.table = build().astype(numpy.float32)
+		# step to the next entry, none after the last one
+		self._steps = numpy.vstack([numpy.diff(self.table, axis=0), numpy.zeros((1, 3), numpy.float32)])
+		self._scale = COLORMAP_SIZE - 1
+
+	def lookup(self, values):
+		"""Colors of values in [0, 1] (float, interpolated between the entries), the values out of it are clipped"""
+		position = numpy.clip(values, 0.0, 1.0)*self._scale
+		entries = position.astype(numpy.intp)
+		fraction = (position - entries)[:, None]
+		return self.table.take(entries, axis=0) + fraction*self._steps.take(entries, axis=0)
+
+	def __call__(self, energies):
+		if not self.by_elevation:
+			return self.lookup(energies.energy_plane_xy)
+		level = energies.level
+		# energy_axis_z/level is the (energy weighted) sin of the elevation, in [-1, 1]
+		elevation = energies.energy_axis_z/numpy.maximum(level, 1e-12)
+		return self.lookup(0.5*elevation + 0.5)*numpy.minimum(level, 1.0)[:, None]
+
+
+def select_colormap(specs, site_id, default=DEFAULT_COLORMAP):
+	"""
+	The colormap name of site_id among specs (NAME for every site or SITE:NAME), the one of the site
+	wins over the one of every site, default if none
+	"""
+	selected = {}
+	for spec in specs or ():
+		site, _, name = spec.rpartition(':')
+		if name not in COLORMAPS and name != TRACKS_COLORMAP:
+			raise ValueError("Colormap not in {}: {}".format(sorted(COLORMAPS), name))
+		selected[site] = name
+	return selected.get(site_id, selected.get('', default))
@@ -0,0 +1,90 @@
+"""
+Angular layout of the leds of a board.
+
+The angles are in degrees in the DOA frame of energy_DOAs (spot 0 starts at 0, counterclockwise), a led
+shows what is closer to its angle than to any other led of its ring. The leds are numbered ring after
+ring, in the order the hw expects them.
+"""
+from collections import namedtuple
+
+import numpy
+
+DEFAULT_LUT_RESOLUTION = 3600 # entries of the angle -> led lookup tables (0.1 deg)
+
+# A ring of leds: n_leds evenly spaced from offset (deg, angle of led 0), winding +1 counterclockwise
+# or -1 clockwise. angles (deg, one per led) overrides the even spacing, e.g. for rings with gaps.
+LedRing = namedtuple('LedRing', ['n_leds', 'offset', 'winding', 'angles'])
+LedRing.__new__.__defaults__ = (0.0, 1, None)
+
+
+class LedGeometry:
+	"""
+	Leds of a board on one or more rings, with precomputed lookup tables so that an angle (wake direction,
+	DOA spot) is mapped to its led in O(1)
+	"""
+	def __init__(self, rings, lut_resolution=DEFAULT_LUT_RESOLUTION):
+		self.rings = tuple(rings)
+		self.lut_resolution = lut_resolution
+		angles = []
+		ring_of_led = []
+		for r, ring in enumerate(self.rings):
+			if ring.angles is not None:
+				assert len(ring.angles) == ring.n_leds, "one angle per led"
+				ring_angles = numpy.asarray(ring.angles, dtype=float)
+			else:
+				ring_angles = ring.offset + ring.winding*numpy.arange(ring.n_leds)*360.0/ring.n_leds
+			angles.append(numpy.mod(ring_angles, 360.0))
+			ring_of_led.append(numpy.full(ring.n_leds, r))
+		self.led_angles = numpy.concatenate(angles)
+		self.ring_of_led = numpy.concatenate(ring_of_led)
+		self.n_leds = len(self.led_angles)
+		self.ring_start = numpy.cumsum([0] + [ring.n_leds for ring in self.rings])[:-1]
+		# (rings, lut_resolution): led closest to each angle of the table, for every ring
+		self.lut = numpy.stack([self._nearest_leds(r, (numpy.arange(lut_resolution) + 0.5)*360.0/lut_resolution)
+								for r in range(len(self.rings))])
+		self._spot_maps = {}
+
+	@classmethod
+	def ring(cls, n_leds, offset=0.0, winding=1):
+		"""A single evenly spaced ring"""
+		return cls([LedRing(n_leds, offset, winding)])
+
+	def _nearest_leds(self, ring_i, angles):
+		start = self.ring_start[ring_i]
+		ring_angles = self.led_angles[start:start + self.rings[ring_i].n_leds]
+		dist = numpy.abs(angles[:, None] - ring_angles[None, :]) % 360.0
+		dist = numpy.minimum(dist, 360.0 - dist)
+		return start + dist.argmin(axis=1)
+
+	def led_for_direction(self, direction, ring_i=0):
+		"""Led of the ring closest to direction (deg)"""
+		return int(self.lut[ring_i, int(direction*self.lut_resolution/360.0) % self.lut_resolution])
+
+	def led_for_azimuth(self, azimuth, ring_i=0):
+		"""Led of the ring closest to azimuth (rad, [0, 2pi))"""
+		return self.led_for_direction(numpy.rad2deg(azimuth), ring_i)
+
+	def spot_map(self, n_spots):
+		"""
+		Map n_spots evenly spaced spots on the leds: (spot_leds, spot_index), each spot is drawn on the
+		closest led of every ring. The leds with no spot (more leds than spots) show their closest spot.
+		"""
+		spot_map = self._spot_maps.get(n_spots)
+		if spot_map is None:
+			centers = (numpy.arange(n_spots) + 0.5)*360.0/n_spots
+			lut_i = (centers*self.lut_resolution/360.0).astype(int) % self.lut_resolution
+			spot_leds = self.lut[:, lut_i].ravel()
+			spot_index = numpy.tile(numpy.arange(n_spots), len(self.rings))
+			empty = numpy.setdiff1d(numpy.arange(self.n_leds), spot_leds)
+			spot_leds = numpy.concatenate([spot_leds, empty])
+			spot_index = numpy.concatenate([spot_index, (self.led_angles[empty]*n_spots/360.0).astype(int) % n_spots])
+			spot_map = (spot_leds, spot_index)
+			self._spot_maps[n_spots] = spot_map
+		return spot_map
+
+	def map_spots(self, rgb):
+		"""Draw a (n_spots, channels) array of spots on the leds, each led shows the max of its spots"""
+		spot_leds, spot_index = self.spot_map(len(rgb))
+		leds = numpy.zeros((self.n_leds,) + rgb.shape[1:], dtype=rgb.dtype)
+		numpy.maximum.at(leds, spot_leds, rgb[spot_index])
+		return leds
@@ -0,0 +1,73 @@
+"""Probe the LED hardware throughput (write latency, SPI clock, sustainable FPS)"""
+import logging
+import time
+from collections import namedtuple
+
+_LOGGER = logging.getLogger("rhasspylisa_ledmanager")
+
+HwCapabilities = namedtuple('HwCapabilities', ['write_latency', 'spi_speed_hz', 'max_fps'])
+
+DEFAULT_PROBE_FRAMES = 20
+DEFAULT_MAX_FPS = 100.0 # upper bound, there is no point in refreshing faster than this
+DEFAULT_FPS_HEADROOM = 0.5 # fraction of the time budget the hw write is allowed to use
+SPI_SPEED_TOLERANCE = 0.1 # a slower clock is preferred if its latency is within 10% of the best
+
+
+def measure_write_latency(write, n_frames=DEFAULT_PROBE_FRAMES):
+	"""
+	Call n_frames times the write function and return the median latency in seconds.
+	The first call is discarded, it may include lazy initialization of the device.
+	"""
+	write()
+	latencies = []
+	for _ in range(n_frames):
+		t_start = time.perf_counter()
+		write()
+		latencies.append(time.perf_counter() - t_start)
+	latencies.sort()
+	return latencies[len(latencies)//2]
+
+
+def select_spi_speed(latencies, tolerance=SPI_SPEED_TOLERANCE):
+	"""
+	From a dict {spi_speed_hz: latency} select the slowest clock whose latency is within tolerance
+	of the best one. Above that clock the write is dominated by the driver overhead and a faster clock
+	only reduces the signal margin on the LED strip.
+	"""
+	best = min(latencies.values())
+	for speed in sorted(latencies):
+		if latencies[speed] <= best * (1.0 + tolerance):
+			return speed
+	return max(latencies)
+
+
+def max_fps_from_latency(latency, headroom=DEFAULT_FPS_HEADROOM, fps_cap=DEFAULT_MAX_FPS):
+	"""The frame rate where a write uses at most the headroom fraction of a frame period"""
+	if latency <= 0.0:
+		return fps_cap
+	return min(fps_cap, headroom / latency)
+
+
+def probe_board(pixels, n_frames=DEFAULT_PROBE_FRAMES):
+	"""
+	Measure the write latency of a board (Pixels instance), select the SPI clock if the board
+	supports more than one and return the HwCapabilities. The current LED content is rewritten
+	during the probe, so there is no visible effect.
+	"""
+	spi_speed = None
+	candidates = pixels.spi_speed_candidates
+	if candidates:
+		latencies = {}
+		for speed in candidates:
+			pixels.set_spi_speed(speed)
+			latencies[speed] = measure_write_latency(pixels.update_leds, n_frames)
+			_LOGGER.debug("Probe {}: SPI {} Hz -> {:.3f} ms".format(type(pixels).__name__, speed, 1000*latencies[speed]))
+		spi_speed = select_spi_speed(latencies)
+		pixels.set_spi_speed(spi_speed)
+		latency = latencies[spi_speed]
+	else:
+		latency = measure_write_latency(pixels.update_leds, n_frames)
+	caps = HwCapabilities(write_latency=latency, spi_speed_hz=spi_speed, max_fps=max_fps_from_latency(latency))
+	_LOGGER.info("Probe {}: write latency {:.3f} ms, SPI clock {}, max fps {:.1f}".format(
+		type(pixels).__name__, 1000*caps.write_latency, caps.spi_speed_hz, caps.max_fps))
+	return caps
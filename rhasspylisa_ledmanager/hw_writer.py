@@ -0,0 +1,215 @@
+"""
+Led hw driven by a dedicated writer process.
+
+The writer process owns the board (SPI, everloop) and outputs the frames at its own rate, so the GC pauses
+and the message bursts of the manager do not stutter the leds. The frames are handed over in a ring of
+slots in shared memory: the manager sets the leds directly in the next slot and publishes it, the writer
+reads the last published slot in place (no pipe, no pickling, no copy between the processes).
+"""
+import logging
+import multiprocessing
+import time
+
+import numpy
+try:
+	from multiprocessing import shared_memory
+except ImportError:
+	# Python < 3.8, no writer process
+	shared_memory = None
+
+from .geometry import LedGeometry
+from .pixels import Pixels, LedPattern
+
+_LOGGER = logging.getLogger("rhasspylisa_ledmanager")
+
+DEFAULT_RING_SLOTS = 8
+DEFAULT_WRITER_FPS = 100.0
+WRITER_START_TIMEOUT = 10.0 # s, to open the board in the writer process
+WRITER_STOP_TIMEOUT = 2.0 # s
+
+
+class HwWriterException(Exception):
+	pass
+
+
+def ring_dtype(n_leds, slots):
+	return numpy.dtype([
+		('head', '<u8'), # seq of the last published frame
+		('stop', '<u4'),
+		('written', '<u4'), # frames output by the writer (wraps)
+		('slot_seq', '<u8', (slots,)), # 2*seq once the frame seq is published in the slot, odd while written
+		('frames', 'u1', (slots, n_leds, 3)),
+	])
+
+
+class FrameRing:
+	"""
+	A ring of slots frames (n_leds x rgb, uint8) in shared memory, one producer and one consumer.
+	Each slot has a seqlock: the consumer checks that the slot still holds the frame it read, a frame
+	overwritten while read (the consumer lapped by slots frames) is dropped.
+	"""
+	def __init__(self, n_leds, slots=DEFAULT_RING_SLOTS, name=None):
+		dtype = ring_dtype(n_leds, slots)
+		self.slots = slots
+		self.owner = name is None
+		self.frame = None
+		# the memory belongs to the manager. The spawned writer shares the resource tracker of the manager, so
+		# its attach registers the same name that the unlink of the manager unregisters
+		if self.owner:
+			self.shm = shared_memory.SharedMemory(create=True, size=dtype.itemsize)
+		else:
+			self.shm = shared_memory.SharedMemory(name=name)
+		self.ring = numpy.ndarray((), dtype=dtype, buffer=self.shm.buf)
+		if self.owner:
+			self.ring['head'] = 0
+			self.ring['stop'] = 0
+			self.ring['written'] = 0
+			self.ring['slot_seq'] = 0
+			self._begin(1)
+
+	@property
+	def name(self):
+		return self.shm.name
+
+	@property
+	def written(self):
+		"""Frames output by the writer (wraps at 2**32)"""
+		return int(self.ring['written'])
+
+	# producer
+
+	def _begin(self, seq):
+		slot = seq % self.slots
+		self.ring['slot_seq'][slot] = 2*seq + 1
+		self.frame = self.ring['frames'][slot] # the leds are set here until published
+
+	def publish(self):
+		seq = int(self.ring['head']) + 1
+		self.ring['slot_seq'][seq % self.slots] = 2*seq
+		self.ring['head'] = seq
+		self._begin(seq + 1)
+
+	# consumer
+
+	def latest(self, last_seq):
+		"""(seq, frame view) of the last published frame, (last_seq, None) if there is nothing newer"""
+		seq = int(self.ring['head'])
+		if seq == last_seq:
+			return last_seq, None
+		return seq, self.ring['frames'][seq % self.slots]
+
+	def valid(self, seq):
+		return int(self.ring['slot_seq'][seq % self.slots]) == 2*seq
+
+	def close(self):
+		# the views on the memory have to be released before closing it
+		self.frame = None
+		self.ring = None
+		self.shm.close()
+		if self.owner:
+			self.shm.unlink()
+
+
+def _writer_main(board, conn, ready, fps):
+	"""Writer process: open the board, send its rings, then output the ring frames at fps"""
+	from . import available_hw
+	try:
+		pixels = available_hw[board](pattern=LedPattern)
+		conn.send(pixels.geometry.rings)
+		name, slots = conn.recv()
+		ring = FrameRing(pixels.pixels_number, slots, name=name)
+	except Exception as e:
+		conn.send(e)
+		return
+	conn.send(True)
+
+	interval = 1.0/fps
+	last_seq = 0
+	next_tick = time.monotonic()
+	frame = None
+	while True:
+		ready.clear()
+		if ring.ring['stop']:
+			break
+		seq, frame = ring.latest(last_seq)
+		if frame is None:
+			# nothing new: no tick until the manager publishes
+			ready.wait()
+			next_tick = time.monotonic()
+			continue
+		for i, (r, g, b) in enumerate(frame.tolist()):
+			pixels.set_led(i, r, g, b)
+		if not ring.valid(seq):
+			continue
+		pixels.update_leds()
+		ring.ring['written'] = (int(ring.ring['written']) + 1) & 0xFFFFFFFF
+		last_seq = seq
+		next_tick += interval
+		wait = next_tick - time.monotonic()
+		if wait > 0.0:
+			time.sleep(wait)
+		else:
+			next_tick = time.monotonic()
+	frame = None
+	ring.close()
+
+
+class HwWriterBoard(Pixels):
+	"""The board hw_board, driven by a writer process at fps (see the module doc)"""
+	def __init__(self, pattern, hw_board, tables=None, fps=DEFAULT_WRITER_FPS, slots=DEFAULT_RING_SLOTS, clock=None):
+		if shared_memory is None:
+			raise HwWriterException("The led writer process needs Python 3.8 or later (multiprocessing.shared_memory)")
+		context = multiprocessing.get_context('spawn')
+		conn, child_conn = context.Pipe()
+		self._ready = context.Event()
+		self._process = context.Process(target=_writer_main, args=(hw_board, child_conn, self._ready, fps),
+										name="led-writer", daemon=True)
+		self._process.start()
+		rings = self._receive(conn)
+		self.ring = FrameRing(sum(ring.n_leds for ring in rings), slots)
+		try:
+			conn.send((self.ring.name, slots))
+			self._receive(conn)
+		except Exception:
+			# the writer could not attach: the memory is not left behind
+			self.ring.close()
+			raise
+		_LOGGER.info("Led writer process {} started for {}".format(self._process.pid, hw_board))
+		super().__init__(pattern=pattern, geometry=LedGeometry(rings), tables=tables, clock=clock)
+
+	def _receive(self, conn):
+		if not conn.poll(WRITER_START_TIMEOUT):
+			self._process.terminate()
+			raise HwWriterException("Led writer process not responding")
+		reply = conn.recv()
+		if isinstance(reply, Exception):
+			raise HwWriterException("Led writer process failed: " + str(reply))
+		return reply
+
+	def set_led(self, i, r, g, b):
+		if 0 <= i < self.pixels_number and self.ring.ring is not None:
+			self.ring.frame[i] = (r, g, b)
+
+	@property
+	def frames_written(self):
+		"""Frames output on the board by the writer process (wraps at 2**32), e.g. to check its cadence"""
+		return self.ring.written if self.ring.ring is not None else 0
+
+	def update_leds(self):
+		if self.ring.ring is not None:
+			self.ring.publish()
+			self._ready.set()
+
+	def probe(self, n_frames=None):
+		# update_leds only hands the frame over, the SPI write is timed by nobody here: set the fps instead
+		raise HwWriterException("The led writer process cannot be probed, set its fps (--max-fps) instead")
+
+	def close(self):
+		with self._write_lock:
+			super().close()
+			self.ring.ring['stop'] = 1
+			self._ready.set()
+			self._process.join(WRITER_STOP_TIMEOUT)
+			if self._process.is_alive():
+				self._process.terminate()
+			self.ring.close()
@@ -0,0 +1,144 @@
+"""
+Rate limiting of the localization topics (lisa/ssl/source, lisa/sst/source) at the MQTT ingress.
+
+Every key, a (site id, topic) pair, has a token bucket of rate messages/s and burst messages: the sites
+share the localization topics (or publish on their own, see lisa_decoder.source_site), a flooding ODAS
+only exhausts the bucket of its own site. A message without a token is handled before it is queued or parsed:
+- drop: it is dropped
+- merge: it replaces the message of its key waiting for a token (the latest sample wins), which is
+  delivered with the next token if no newer message takes it (see offer/flush)
+so at most one message per key waits outside the asyncio queue and the memory stays bounded whatever the
+rate of the publisher.
+"""
+import logging
+import threading
+from collections import Counter
+
+from .clock import DEFAULT_CLOCK
+
+_LOGGER = logging.getLogger("rhasspylisa_ledmanager")
+
+DEFAULT_INGRESS_RATE = 100.0 # messages/s per key
+DEFAULT_INGRESS_BURST = 20 # messages
+INGRESS_STRATEGIES = ('merge', 'drop')
+DEFAULT_INGRESS_STRATEGY = 'merge'
+INGRESS_QOS = (0, 1)
+MAX_INGRESS_BACKLOG = 500 # messages in the asyncio queue above which the limited topics are dropped
+INGRESS_LOG_INTERVAL = 10.0 # s between two warnings of a limited key
+
+
+class TokenBucket:
+	def __init__(self, rate, burst, now):
+		self.rate = rate
+		self.burst = burst
+		self.tokens = float(burst)
+		self.t = now
+
+	def _refill(self, now):
+		self.tokens = min(self.burst, self.tokens + (now - self.t)*self.rate)
+		self.t = now
+
+	def take(self, now):
+		"""Take a token if there is one"""
+		self._refill(now)
+		if self.tokens >= 1.0:
+			self.tokens -= 1.0
+			return True
+		return False
+
+	def wait(self, now):
+		"""Seconds until the next token"""
+		self._refill(now)
+		return max(0.0, (1.0 - self.tokens)/self.rate)
+
+
+def key_name(key):
+	"""topic or topic@site of a (site id, topic) key (site id None: a payload without site)"""
+	site_id, topic = key
+	return topic if site_id is None else "{}@{}".format(topic, site_id)
+
+
+class IngressLimiter:
+	"""Token buckets of the (site id, topic) keys of topics, see the module doc"""
+	def __init__(self, topics, rate=DEFAULT_INGRESS_RATE, burst=DEFAULT_INGRESS_BURST,
+				 strategy=DEFAULT_INGRESS_STRATEGY, qos=0, clock=None):
+		if strategy not in INGRESS_STRATEGIES:
+			raise ValueError("Ingress strategy not in {}: {}".format(INGRESS_STRATEGIES, strategy))
+		self.topics = set(topics)
+		self.rate = rate
+		self.burst = burst
+		self.strategy = strategy
+		self.qos = qos
+		self.clock = clock if clock is not None else DEFAULT_CLOCK
+		self._lock = threading.Lock()
+		self._buckets = {}
+		self._pending = {}
+		self._t_report = {}
+		self.received = Counter()
+		self.delivered = Counter()
+		self.dropped = Counter() # no token (drop), or superseded by a newer message (merge)
+		self.overflows = Counter() # dropped because the asyncio queue is full
+
+	def offer(self, key, message):
+		"""
+		A message of key is received, return (message to deliver now or None, None or the seconds after
+		which flush(key) has to be called to deliver the message left waiting)
+		"""
+		with self._lock:
+			now = self.clock.monotonic()
+			bucket = self._buckets.get(key)
+			if bucket is None:
+				bucket = self._buckets[key] = TokenBucket(self.rate, self.burst, now)
+			self.received[key] += 1
+			if bucket.take(now):
+				if self._pending.pop(key, None) is not None:
+					self.dropped[key] += 1
+				self.delivered[key] += 1
+				return message, None
+			self._report(key, now)
+			if self.strategy == 'drop':
+				self.dropped[key] += 1
+				return None, None
+			waiting = key in self._pending
+			if waiting:
+				self.dropped[key] += 1
+			self._pending[key] = message
+			return None, None if waiting else bucket.wait(now)
+
+	def flush(self, key):
+		"""
+		Deliver the message of key left waiting, return (message or None, None or the seconds after which flush
+		has to be called again): no message if a newer one took the token, a new wait if there is no token yet
+		"""
+		with self._lock:
+			if key not in self._pending:
+				return None, None
+			now = self.clock.monotonic()
+			bucket = self._buckets[key]
+			if not bucket.take(now):
+				return None, bucket.wait(now)
+			self.delivered[key] += 1
+			return self._pending.pop(key), None
+
+	def overflow(self, key):
+		with self._lock:
+			self.received[key] += 1
+			self.overflows[key] += 1
+			self._report(key, self.clock.monotonic())
+
+	def _report(self, key, now):
+		if now - self._t_report.get(key, -INGRESS_LOG_INTERVAL) >= INGRESS_LOG_INTERVAL:
+			self._t_report[key] = now
+			_LOGGER.warning("Ingress {} over {:.0f} msg/s: {}".format(key_name(key), self.rate, self.stats(key)))
+
+	def keys(self):
+		"""The keys received so far"""
+		with self._lock:
+			return sorted(self.received, key=key_name)
+
+	def stats(self, key):
+		received = self.received[key]
+		lost = self.dropped[key] + self.overflows[key]
+		return "received {}, delivered {}, {} {} ({:.1f}%), backlog overflows {}".format(
+			received, self.delivered[key], "merged" if self.strategy == 'merge' else "dropped", self.dropped[key],
+			100.0*lost/received if received else 0.0, self.overflows[key])
@@ -16,23 +16,36 @@
 
 
 import numpy
-import time
 
 from ..pixels import LedPattern
 
 class AlexaLedPattern(LedPattern):
-    def __init__(self, number, show=None):
-        super().__init__(number=number, show=show)
+    def __init__(self, number, show=None, geometry=None, tables=None, clock=None):
+        super().__init__(number=number, show=show, geometry=geometry, tables=tables, clock=clock)
         self.pixels = [0] * 4 * self.pixels_number
         self.stop = False
+        # precompiled frames: wakeup[position], the 2 alternating think frames, speak[position]
+        self.wakeup_frames = self.table('wakeup', self._build_wakeup)
+        self.think_frames = self.table('think', self._build_think)
+        self.speak_frames = self.table('speak', self._build_speak)
 
-    def wakeup(self, direction=0):
-        position = int((direction + 15) / (360 / self.pixels_number)) % self.pixels_number
+    def _build_wakeup(self):
+        frames = numpy.tile([0, 0, 0, 24], (self.pixels_number, self.pixels_number))
+        frames[numpy.arange(self.pixels_number), numpy.arange(self.pixels_number) * 4 + 2] = 48
+        return frames
 
-        pixels = [0, 0, 0, 24] * self.pixels_number
-        pixels[position * 4 + 2] = 48
+    def _build_think(self):
+        pixels = numpy.array([0, 0, 12, 12, 0, 0, 0, 24] * self.pixels_number)
+        return numpy.stack([numpy.roll(pixels, 4 * k)[:4 * self.pixels_number] for k in range(2)])
 
-        self.show(pixels)
+    def _build_speak(self):
+        return numpy.array([[0, 0, position, 24 - position] * self.pixels_number
+                            for position in range(self.pixels_number + 1)])
+
+    def wakeup(self, direction=0):
+        position = self.geometry.led_for_direction(direction)
+
+        self.show(self.wakeup_frames[position])
 
     def listen(self):
         pixels = [0, 0, 0, 24] * self.pixels_number
@@ -40,29 +53,30 @@ class AlexaLedPattern(LedPattern):
         self.show(pixels)
 
     def think(self):
-        pixels  = [0, 0, 12, 12, 0, 0, 0, 24] * self.pixels_number
-
+        k = 0
         while not self.stop:
-            self.show(pixels)
-            time.sleep(0.2)
-            pixels = pixels[-4:] + pixels[:-4]
+            self.show(self.think_frames[k])
+            self.sleep(0.2)
+            k ^= 1
 
     def speak(self):
         step = 1
         position = self.pixels_number
         while not self.stop:
-            pixels  = [0, 0, position, 24 - position] * self.pixels_number
-            self.show(pixels)
-            time.sleep(0.01)
+            self.show(self.speak_frames[position])
+            self.sleep(0.01)
             if position <= 0:
                 step = 1
-                time.sleep(0.4)
+                self.sleep(0.4)
             elif position >= self.pixels_number:
                 step = -1
-                time.sleep(0.4)
+                self.sleep(0.4)
 
             position += step
 
+    def speak_level(self, level):
+        self.show(self.speak_frames[int(level * self.pixels_number)])
+
     def off(self):
         self.show([0] * 4 * self.pixels_number)
 
@@ -74,7 +88,7 @@ class AlexaLedPattern(LedPattern):
 			
         self.off()
         _flash()
-        time.sleep(0.9)
+        self.sleep(0.9)
         _flash()
-        time.sleep(0.9)
+        self.sleep(0.9)
         self.off()
\ No newline at end of file
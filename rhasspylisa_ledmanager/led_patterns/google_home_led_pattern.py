@@ -16,7 +16,6 @@
 
 
 import numpy
-import time
 try:
     import queue as Queue
 except ImportError:
@@ -24,89 +23,104 @@ except ImportError:
 
 from ..pixels import LedPattern
 
+# pauses after each frame of the wakeup table: brightness ramp, first roll, two cross-fades, final
+WAKEUP_DELAYS = (0.005,) * 24 + (0.1, 0.1, 0.1, 0.0)
+
 class GoogleHomeLedPattern(LedPattern):
-	def __init__(self, number, show=None):
-		super().__init__(number=number, show=show)
+	def __init__(self, number, show=None, geometry=None, tables=None, clock=None):
+		super().__init__(number=number, show=show, geometry=geometry, tables=tables, clock=clock)
 		self.basis = numpy.array([0] * 4 * self.pixels_number)
 		self.basis[0 * 4 + 1] = 2
 		self.basis[3 * 4 + 1] = 1
 		self.basis[3 * 4 + 2] = 1
 		self.basis[6 * 4 + 2] = 2
 		self.basis[9 * 4 + 3] = 2
-		self.pixels = self.basis * 24
+		# every frame is the basis rolled by some leds at some brightness, all are precompiled
+		# brightness[rotation, i]: basis rolled by rotation leds at i/24 of the full brightness
+		self.brightness = self.table('brightness', self._build_brightness)
+		# wakeup[position]: the frames of the wakeup toward the led position
+		self.wakeup_frames = self.table('wakeup', self._build_wakeup)
+		self.rotation = 0
+
+	def _build_brightness(self):
+		rotated = numpy.stack([numpy.roll(self.basis * 24, r * 4) for r in range(self.pixels_number)])
+		return rotated[:, None, :] * numpy.arange(25)[None, :, None] / 24
+
+	def _build_wakeup(self):
+		n = self.pixels_number
+		frames = []
+		for position in range(n):
+			full = lambda r: self.brightness[(position + r) % n, 24]
+			ramp = [numpy.roll(self.basis, position * 4) * i for i in range(1, 25)]
+			frames.append(ramp + [full(1), full(2) * 0.5 + full(1), full(3) * 0.5 + full(2), full(3)])
+		return numpy.array(frames, dtype=float)
+
+	@property
+	def pixels(self):
+		return self.brightness[self.rotation, 24]
 
 	def wakeup(self, direction=0):
-		position = int((direction + 15) / 30) % self.pixels_number
+		position = self.geometry.led_for_direction(direction)
 
-		basis = numpy.roll(self.basis, position * 4)
-		for i in range(1, 25):
-			pixels = basis * i
+		for pixels, delay in zip(self.wakeup_frames[position], WAKEUP_DELAYS):
 			self.show(pixels)
-			time.sleep(0.005)
-
-		pixels =  numpy.roll(pixels, 4)
-		self.show(pixels)
-		time.sleep(0.1)
-
-		for i in range(2):
-			new_pixels = numpy.roll(pixels, 4)
-			self.show(new_pixels * 0.5 + pixels)
-			pixels = new_pixels
-			time.sleep(0.1)
+			if delay:
+				self.sleep(delay)
 
-		self.show(pixels)
-		self.pixels = pixels
+		self.rotation = (position + 3) % self.pixels_number
 
 	def listen(self):
-		pixels = self.pixels
-		for i in range(1, 25):
-			self.show(pixels * i / 24)
-			time.sleep(0.01)
+		for pixels in self.brightness[self.rotation, 1:25]:
+			self.show(pixels)
+			self.sleep(0.01)
 
 	def think(self):
-		pixels = self.pixels
+		rotation = self.rotation
 
 		while not self.stop:
-			pixels = numpy.roll(pixels, 4)
-			self.show(pixels)
-			time.sleep(0.2)
+			rotation = (rotation + 1) % self.pixels_number
+			self.show(self.brightness[rotation, 24])
+			self.sleep(0.2)
 
 		t = 0.1
 		for i in range(0, 5):
-			pixels = numpy.roll(pixels, 4)
-			self.show(pixels * (4 - i) / 4)
-			time.sleep(t)
+			rotation = (rotation + 1) % self.pixels_number
+			self.show(self.brightness[rotation, 24 - 6 * i])
+			self.sleep(t)
 			t /= 2
 
-		self.pixels = pixels
+		self.rotation = rotation
 
 	def speak(self):
-		pixels = self.pixels
+		frames = self.brightness[self.rotation]
 		step = 1
 		brightness = 5
 		while not self.stop:
-			self.show(pixels * brightness / 24)
-			time.sleep(0.02)
+			self.show(frames[brightness])
+			self.sleep(0.02)
 
 			if brightness <= 5:
 				step = 1
-				time.sleep(0.4)
+				self.sleep(0.4)
 			elif brightness >= 24:
 				step = -1
-				time.sleep(0.4)
+				self.sleep(0.4)
 
 			brightness += step
 
+	def speak_level(self, level):
+		# same brightness range as speak, 5..24
+		self.show(self.brightness[self.rotation, int(round(5 + 19*level))])
+
 	def off(self):
 		self.show([0] * 4 * self.pixels_number)
 
 	def blink(self):
 		
 		def _flash():
-			pixels = self.pixels
-			for i in range(1, 25):
-				self.show(pixels * i / 24)
-				time.sleep(0.01)
+			for pixels in self.brightness[self.rotation, 1:25]:
+				self.show(pixels)
+				self.sleep(0.01)
 		_flash()
-		time.sleep(0.2)
+		self.sleep(0.2)
 		self.off()
\ No newline at end of file
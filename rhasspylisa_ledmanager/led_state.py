@@ -0,0 +1,126 @@
+"""Dialogue state of the LEDs, driven by the Hermes events"""
+import logging
+import threading
+
+from .clock import DEFAULT_CLOCK
+
+_LOGGER = logging.getLogger("rhasspylisa_ledmanager")
+
+IDLE = 'idle'
+WAKE = 'wake'
+LISTENING = 'listening'
+THINKING = 'thinking'
+SPEAKING = 'speaking'
+RESULT = 'result'
+
+# Allowed transitions, an event leading to a state not in the list is stale (e.g. a late
+# AsrTextCaptured after the session is over) and is ignored. WAKE is allowed from every state (a repeated
+# hotword restarts the wakeup past the hotword holdoff), IDLE from every other state.
+TRANSITIONS = {
+	IDLE: (WAKE, LISTENING, SPEAKING),
+	WAKE: (LISTENING, IDLE, WAKE),
+	LISTENING: (THINKING, IDLE, WAKE),
+	THINKING: (RESULT, SPEAKING, LISTENING, IDLE, WAKE),
+	RESULT: (SPEAKING, LISTENING, IDLE, WAKE),
+	SPEAKING: (LISTENING, RESULT, IDLE, WAKE),
+}
+
+DEFAULT_HOTWORD_HOLDOFF = 1.0 # s, repeated hotwords closer than this do not restart the wakeup
+
+
+class LedStateMachine:
+	"""
+	Map the dialogue states on the LED patterns of a Pixels instance.
+	Every transition is a single Pixels.put (the patterns paint a full frame, no off() is needed
+	before them) and Pixels.put replaces any transition still waiting, so the queue never grows.
+	Redundant transitions are collapsed: same state, hotword repeated within the holdoff,
+	events of a session which is not the active one.
+	"""
+	def __init__(self, pixels, hotword_holdoff=DEFAULT_HOTWORD_HOLDOFF, clock=None):
+		self.pixels = pixels
+		self.clock = clock if clock is not None else DEFAULT_CLOCK
+		self.hotword_holdoff = hotword_holdoff
+		self.state = IDLE
+		self.session_id = None
+		self._lock = threading.RLock()
+		self._t_wake = -hotword_holdoff
+
+	def start_session(self, session_id):
+		with self._lock:
+			self.session_id = session_id
+
+	def transition(self, state, session_id=None, **kwargs):
+		"""
+		Move to state, kwargs are passed to the visual of the state (e.g. direction for WAKE,
+		recognized for RESULT). Return True if the transition was applied.
+		"""
+		with self._lock:
+			now = self.clock.monotonic()
+			if session_id is not None and self.session_id is not None and session_id != self.session_id:
+				_LOGGER.debug("LED state: ignore {} from session {} (active {})".format(state, session_id, self.session_id))
+				return False
+			if state == WAKE:
+				if now - self._t_wake < self.hotword_holdoff:
+					return False
+			elif state == self.state:
+				return False
+			if state not in TRANSITIONS[self.state]:
+				_LOGGER.debug("LED state: ignore {} -> {}".format(self.state, state))
+				return False
+
+			_LOGGER.debug("LED state: {} -> {}".format(self.state, state))
+			previous = self.state
+			self.state = state
+			if state == IDLE:
+				self.session_id = None
+				if previous == RESULT:
+					# the result visual ends with the leds off
+					return True
+			elif state == WAKE:
+				self.session_id = session_id
+				self._t_wake = now
+			self._show(state, **kwargs)
+			return True
+
+	def restore(self, state):
+		"""Resume a state saved before a restart (no transition check, the session is unknown)"""
+		with self._lock:
+			if state not in TRANSITIONS or state in (IDLE, WAKE, RESULT):
+				return False
+			_LOGGER.debug("LED state: restore {}".format(state))
+			self.state = state
+			self.session_id = None
+			self._show(state)
+			return True
+
+	def replay(self, pixels=None):
+		"""Show the current state again, e.g. on a reloaded pattern or on pixels (a new board)"""
+		with self._lock:
+			if pixels is not None:
+				self.pixels = pixels
+			if self.state in (LISTENING, THINKING, SPEAKING):
+				self._show(self.state)
+
+	def leave(self, state, session_id=None):
+		"""Go back to IDLE only if the current state is state (e.g. stop listening once thinking)"""
+		with self._lock:
+			if self.state != state:
+				return False
+			return self.transition(IDLE, session_id)
+
+	def _show(self, state, direction=0, recognized=True, envelope=None, window=None):
+		if state == WAKE:
+			self.pixels.wakeup(direction)
+		elif state == LISTENING:
+			self.pixels.speak()
+		elif state == THINKING:
+			self.pixels.think()
+		elif state == RESULT:
+			self.pixels.blink(times=1 if recognized else 2)
+		elif state == SPEAKING:
+			if envelope is not None:
+				self.pixels.speak_envelope(envelope, window)
+			else:
+				self.pixels.speak()
+		else:
+			self.pixels.off()
@@ -0,0 +1,91 @@
+"""
+Fast decoding of the LISA localization payloads (lisa/ssl/source, lisa/sst/source).
+
+These topics are the highest rate ones, so they skip the Hermes parsing into SSL_src_msg/SST_src_msg
+and are decoded straight in a numpy array of sources, one row per source: [x, y, z, energy].
+Supported payloads:
+- JSON, a single source {"x":.., "y":.., "z":.., "E":..} or a batch, either a list of sources or
+  {"sources": [...]} (SST uses "activity" instead of "E", an optional "id" identifies the source)
+- binary, BINARY_MAGIC followed by n records of BINARY_SOURCE_DTYPE (little endian, fixed layout)
+The site of a payload is the last level of a per-site topic (lisa/ssl/source/<siteId>), or the "siteId"
+of a JSON payload on the shared topic (see source_site), the binary ones on the shared topic have none.
+"""
+import json
+import logging
+import re
+
+import numpy
+
+try:
+	import orjson
+	_json_loads = orjson.loads
+except ImportError:
+	_json_loads = json.loads
+
+_LOGGER = logging.getLogger("rhasspylisa_ledmanager")
+
+BINARY_MAGIC = b'LSRC'
+BINARY_SOURCE_DTYPE = numpy.dtype([('x', '<f4'), ('y', '<f4'), ('z', '<f4'), ('e', '<f4'), ('id', '<i4')])
+NO_ID = -1 # id of a source that does not carry one
+
+SSL_ENERGY_KEY = 'E'
+SST_ENERGY_KEY = 'activity'
+_SITE_ID_RE = re.compile(rb'"siteId"\s*:\s*"([^"]*)"')
+
+
+def decode_sources(payload, energy_key):
+	"""
+	Decode a localization payload, return (sources, ids): sources is a (n, 4) float array
+	of [x, y, z, energy], ids a (n,) int array (NO_ID when the source has no id)
+	"""
+	if payload[:len(BINARY_MAGIC)] == BINARY_MAGIC:
+		records = numpy.frombuffer(payload, dtype=BINARY_SOURCE_DTYPE, offset=len(BINARY_MAGIC))
+		sources = numpy.empty((len(records), 4))
+		sources[:, 0] = records['x']
+		sources[:, 1] = records['y']
+		sources[:, 2] = records['z']
+		sources[:, 3] = records['e']
+		return sources, records['id'].astype(int)
+
+	data = _json_loads(payload)
+	if isinstance(data, dict):
+		data = data.get('sources', [data])
+	sources = numpy.array([(s['x'], s['y'], s['z'], s[energy_key]) for s in data], dtype=float).reshape(-1, 4)
+	ids = numpy.array([s.get('id', NO_ID) for s in data], dtype=int)
+	return sources, ids
+
+
+def source_site(topic, base_topics, payload):
+	"""
+	(base topic, site id or None) of a localization message on topic, (None, None) if topic is not one of
+	base_topics or of their per-site topics. The site id is found without decoding the payload.
+	"""
+	if topic in base_topics:
+		if payload[:len(BINARY_MAGIC)] == BINARY_MAGIC:
+			return topic, None
+		match = _SITE_ID_RE.search(payload)
+		return topic, match.group(1).decode('utf-8', 'replace') if match else None
+	base, _, site_id = topic.rpartition('/')
+	if base in base_topics and site_id:
+		return base, site_id
+	return None, None
+
+
+def decode_ssl(payload):
+	return decode_sources(payload, SSL_ENERGY_KEY)
+
+
+def decode_sst(payload):
+	return decode_sources(payload, SST_ENERGY_KEY)
+
+
+def encode_binary(sources, ids=None):
+	"""Build a binary payload from a (n, 4) array of [x, y, z, energy] (and optional ids)"""
+	sources = numpy.asarray(sources, dtype=float).reshape(-1, 4)
+	records = numpy.zeros(len(sources), dtype=BINARY_SOURCE_DTYPE)
+	records['x'] = sources[:, 0]
+	records['y'] = sources[:, 1]
+	records['z'] = sources[:, 2]
+	records['e'] = sources[:, 3]
+	records['id'] = NO_ID if ids is None else ids
+	return BINARY_MAGIC + records.tobytes()
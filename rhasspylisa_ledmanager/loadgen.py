@@ -0,0 +1,276 @@
+"""
+Load generator and replay tool for the LISA localization topics (lisa/ssl/source, lisa/sst/source).
+
+A stream is a sequence of (t, topic, payload), t in seconds from the start of the stream. Streams are
+generated (moving talkers, noise bursts, rates up to kHz, deterministic for a seed), recorded from a
+broker or read from a file, and then written to a file, published on a broker or delivered straight
+to an in-process LedManagerHermesMqtt (no broker, the handler latency is measured).
+
+The stream file is compact: a header (STREAM_MAGIC, version) followed by the records, each one
+STREAM_RECORD (t, topic index in TOPICS, payload size) and the raw payload, so a replay is exact.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import struct
+import time
+
+import numpy
+import paho.mqtt.client as mqtt
+import rhasspyhermes.cli as hermes_cli
+
+from lisa.rhasppy_messages import SSL_src_msg, SST_src_msg
+
+from .lisa_decoder import encode_binary, SSL_ENERGY_KEY, SST_ENERGY_KEY
+from .clock import AcceleratedClock
+
+_LOGGER = logging.getLogger("rhasspylisa_ledmanager")
+
+TOPICS = (SSL_src_msg.topic(), SST_src_msg.topic())
+STREAM_MAGIC = b'LLDG'
+STREAM_VERSION = 1
+STREAM_HEADER = struct.Struct('<4sH')
+STREAM_RECORD = struct.Struct('<dBI')
+
+PAYLOAD_FORMATS = ('json', 'batch', 'binary') # one JSON message per source, one JSON batch or one binary payload per tick
+DEFAULT_RATE = 100.0 # ticks/s, every tick publishes the sources of the talkers (and of the noise bursts)
+DEFAULT_DURATION = 10.0 # s
+DEFAULT_TALKERS = 2
+DEFAULT_SPEED = 30.0 # deg/s, angular speed of the talkers
+DEFAULT_NOISE_RATE = 0.5 # noise bursts/s
+DEFAULT_BURST_SOURCES = 8 # sources of a noise burst, in random directions
+TALK_SEGMENT = (1.0, 3.0) # s, duration range of the talk and pause segments
+
+
+def encode_sources(sources, ids, energy_key, payload_format, t=0.0):
+	"""The payloads of a (n, 4) array of [x, y, z, energy] sources in payload_format"""
+	if payload_format == 'binary':
+		return [encode_binary(sources, ids)]
+	messages = []
+	for n, (x, y, z, e) in enumerate(sources.tolist()):
+		message = {'x': x, 'y': y, 'z': z, energy_key: e, 'timestamp': int(1000*t), 'channel': n}
+		if ids is not None:
+			message['id'] = int(ids[n])
+		messages.append(message)
+	if payload_format == 'batch':
+		return [json.dumps({'sources': messages}).encode()]
+	return [json.dumps(message).encode() for message in messages]
+
+
+def _directions(azimuth, elevation):
+	return numpy.stack([numpy.cos(elevation)*numpy.cos(azimuth), numpy.cos(elevation)*numpy.sin(azimuth),
+						numpy.sin(elevation)], axis=1)
+
+
+def generate(rate=DEFAULT_RATE, duration=DEFAULT_DURATION, talkers=DEFAULT_TALKERS, speed=DEFAULT_SPEED,
+			 noise_rate=DEFAULT_NOISE_RATE, burst_sources=DEFAULT_BURST_SOURCES, payload_format='batch',
+			 sst=True, seed=0):
+	"""
+	Generate a stream: talkers moving on the ring at speed (deg/s, random direction) alternating talk and
+	pause segments, plus noise bursts (Poisson, noise_rate per second) of burst_sources low energy sources.
+	Every tick publishes the SSL sources and, if sst, the SST sources of the talking talkers (id = talker).
+	"""
+	rng = numpy.random.default_rng(seed)
+	azimuth = rng.uniform(0.0, 2.0*numpy.pi, talkers)
+	elevation = numpy.deg2rad(rng.uniform(-10.0, 30.0, talkers))
+	omega = numpy.deg2rad(speed)*rng.choice([-1.0, 1.0], talkers)
+	talking = rng.random(talkers) < 0.5
+	next_switch = rng.uniform(*TALK_SEGMENT, talkers)
+	talker_ids = numpy.arange(talkers)
+	for k in range(int(duration*rate)):
+		t = k/rate
+		switch = t >= next_switch
+		talking ^= switch
+		next_switch[switch] = t + rng.uniform(*TALK_SEGMENT, switch.sum())
+
+		xyz = _directions(azimuth + omega*t, elevation)
+		energy = numpy.where(talking, rng.uniform(0.6, 1.0, talkers), rng.uniform(0.0, 0.1, talkers))
+		ssl = numpy.column_stack([xyz, energy])
+		n_noise = burst_sources*rng.poisson(noise_rate/rate)
+		if n_noise:
+			noise = _directions(rng.uniform(0.0, 2.0*numpy.pi, n_noise), numpy.deg2rad(rng.uniform(-30.0, 60.0, n_noise)))
+			ssl = numpy.concatenate([ssl, numpy.column_stack([noise, rng.uniform(0.2, 0.5, n_noise)])])
+		for payload in encode_sources(ssl, None, SSL_ENERGY_KEY, payload_format, t):
+			yield t, TOPICS[0], payload
+		if sst:
+			sst_sources = numpy.column_stack([xyz, energy])[talking]
+			for payload in encode_sources(sst_sources, talker_ids[talking], SST_ENERGY_KEY, payload_format, t):
+				yield t, TOPICS[1], payload
+
+
+def write_stream(path, stream):
+	"""Write a stream in a file, return the number of records"""
+	count = 0
+	with open(path, 'wb') as stream_file:
+		stream_file.write(STREAM_HEADER.pack(STREAM_MAGIC, STREAM_VERSION))
+		for t, topic, payload in stream:
+			stream_file.write(STREAM_RECORD.pack(t, TOPICS.index(topic), len(payload)))
+			stream_file.write(payload)
+			count += 1
+	return count
+
+
+def read_stream(path):
+	"""Generator of the (t, topic, payload) records of a stream file, a truncated last record is dropped"""
+	with open(path, 'rb') as stream_file:
+		magic, version = STREAM_HEADER.unpack(stream_file.read(STREAM_HEADER.size))
+		if magic != STREAM_MAGIC or version != STREAM_VERSION:
+			raise ValueError("Not a stream file (version {}): {}".format(STREAM_VERSION, path))
+		while True:
+			record = stream_file.read(STREAM_RECORD.size)
+			if len(record) < STREAM_RECORD.size:
+				return
+			t, topic_i, size = STREAM_RECORD.unpack(record)
+			payload = stream_file.read(size)
+			if len(payload) < size:
+				# e.g. a recording interrupted while writing
+				_LOGGER.warning("Truncated record at {:.3f} s in {}".format(t, path))
+				return
+			yield t, TOPICS[topic_i], payload
+
+
+def paced(stream, speed=1.0):
+	"""Yield the records of a stream at their time (divided by speed, 0 is as fast as possible), with their lag"""
+	t_start = time.monotonic()
+	for t, topic, payload in stream:
+		lag = 0.0
+		if speed > 0.0:
+			lag = time.monotonic() - (t_start + t/speed)
+			if lag < 0.0:
+				time.sleep(-lag)
+				lag = 0.0
+		yield t, topic, payload, lag
+
+
+def publish_stream(client, stream, speed=1.0):
+	"""Publish a stream on a connected client, return (messages, elapsed s, lags s)"""
+	lags = []
+	t_start = time.monotonic()
+	for _, topic, payload, lag in paced(stream, speed):
+		client.publish(topic, payload)
+		lags.append(lag)
+	return len(lags), time.monotonic() - t_start, numpy.array(lags)
+
+
+def run_in_process(hermes, stream, speed=1.0):
+	"""Deliver a stream straight to the raw handlers of hermes, return (messages, elapsed s, latencies s, lags s)"""
+	latencies = []
+	lags = []
+
+	async def deliver():
+		for _, topic, payload, lag in paced(stream, speed):
+			t_message = time.perf_counter()
+			await hermes.on_raw_message(topic, payload)
+			latencies.append(time.perf_counter() - t_message)
+			lags.append(lag)
+
+	t_start = time.monotonic()
+	asyncio.run(deliver())
+	return len(latencies), time.monotonic() - t_start, numpy.array(latencies), numpy.array(lags)
+
+
+def record_stream(client, path, duration=None):
+	"""Record the localization topics received by a connected client in a stream file, return the records"""
+	records = []
+	t_start = time.monotonic()
+
+	def on_message(client, userdata, message):
+		records.append((time.monotonic() - t_start, message.topic, message.payload))
+
+	client.on_message = on_message
+	for topic in TOPICS:
+		client.subscribe(topic)
+	try:
+		if duration:
+			time.sleep(duration)
+		else:
+			while True:
+				time.sleep(1.0)
+	except KeyboardInterrupt:
+		pass
+	return write_stream(path, list(records))
+
+
+def _stats(name, values):
+	if not len(values):
+		return "{}: -".format(name)
+	return "{}: mean={:.3f}ms p50={:.3f}ms p99={:.3f}ms max={:.3f}ms".format(
+		name, 1000*values.mean(), 1000*numpy.percentile(values, 50), 1000*numpy.percentile(values, 99), 1000*values.max())
+
+
+# -----------------------------------------------------------------------------
+
+def main():
+	"""Main method."""
+	parser = argparse.ArgumentParser(prog="lisa-loadgen")
+	parser.add_argument("command", choices=("generate", "replay", "record"),
+						help="generate a stream, replay a stream file or record one from the broker")
+	parser.add_argument("--file", default=None,
+						help="Stream file: read by replay, written by record and by generate (instead of publishing)")
+	parser.add_argument("--in-process", action="store_true",
+						help="Deliver the stream to an in-process led manager instead of the broker, and measure it")
+	parser.add_argument("--hw-board", default="DummyBoard", help="Board of the in-process led manager")
+	parser.add_argument("--speed", type=float, default=1.0,
+						help="Replay speed factor, 0 to publish as fast as possible (default: 1)")
+	parser.add_argument("--rate", type=float, default=DEFAULT_RATE, help="Generated ticks/s (default: " + str(DEFAULT_RATE) + ")")
+	parser.add_argument("--duration", type=float, default=DEFAULT_DURATION,
+						help="Generated (or recorded, 0 until interrupted) seconds (default: " + str(DEFAULT_DURATION) + ")")
+	parser.add_argument("--talkers", type=int, default=DEFAULT_TALKERS, help="Moving talkers")
+	parser.add_argument("--talker-speed", type=float, default=DEFAULT_SPEED, help="Angular speed of the talkers (deg/s)")
+	parser.add_argument("--noise-rate", type=float, default=DEFAULT_NOISE_RATE, help="Noise bursts/s")
+	parser.add_argument("--burst-sources", type=int, default=DEFAULT_BURST_SOURCES, help="Sources of a noise burst")
+	parser.add_argument("--format", choices=PAYLOAD_FORMATS, default='batch', help="Generated payload format")
+	parser.add_argument("--no-sst", action="store_true", help="Generate only lisa/ssl/source")
+	parser.add_argument("--seed", type=int, default=0, help="Seed of the generated stream")
+	hermes_cli.add_hermes_args(parser)
+	args = parser.parse_args()
+
+	hermes_cli.setup_logging(args)
+	_LOGGER.debug(args)
+
+	if args.command == "generate":
+		stream = generate(rate=args.rate, duration=args.duration, talkers=args.talkers, speed=args.talker_speed,
+						  noise_rate=args.noise_rate, burst_sources=args.burst_sources, payload_format=args.format,
+						  sst=not args.no_sst, seed=args.seed)
+		if args.file and not args.in_process:
+			_LOGGER.info("Generated {} records in {}".format(write_stream(args.file, stream), args.file))
+			return 0
+	elif args.command == "replay":
+		if not args.file:
+			parser.error("replay needs --file")
+		stream = read_stream(args.file)
+	else:
+		if not args.file:
+			parser.error("record needs --file")
+		client = mqtt.Client()
+		hermes_cli.connect(client, args)
+		client.loop_start()
+		count = record_stream(client, args.file, args.duration)
+		client.loop_stop()
+		_LOGGER.info("Recorded {} records in {}".format(count, args.file))
+		return 0
+
+	if args.in_process:
+		from . import LedManagerHermesMqtt
+		# the manager timing (animations, layer timeout, tracks) runs at the replay speed
+		clock = AcceleratedClock(args.speed) if args.speed > 0.0 and args.speed != 1.0 else None
+		hermes = LedManagerHermesMqtt(mqtt.Client(), hw_led=args.hw_board, site_ids=args.site_id, clock=clock)
+		count, elapsed, latencies, lags = run_in_process(hermes, stream, args.speed)
+		_LOGGER.info("Delivered {} messages in {:.2f} s ({:.0f} msg/s)".format(count, elapsed, count/elapsed if elapsed else 0.0))
+		_LOGGER.info(_stats("Latency", latencies))
+		_LOGGER.info(_stats("Lag", lags))
+		hermes.log_handler_timing()
+	else:
+		client = mqtt.Client()
+		hermes_cli.connect(client, args)
+		client.loop_start()
+		count, elapsed, lags = publish_stream(client, stream, args.speed)
+		client.loop_stop()
+		_LOGGER.info("Published {} messages in {:.2f} s ({:.0f} msg/s)".format(count, elapsed, count/elapsed if elapsed else 0.0))
+		_LOGGER.info(_stats("Lag", lags))
+	return 0
+
+
+if __name__ == "__main__":
+	main()
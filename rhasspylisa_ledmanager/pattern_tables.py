@@ -0,0 +1,87 @@
+"""
+Precompiled frame tables of the led patterns.
+
+A table is built once by the pattern (a numpy array of frames) and cached on disk as .npy, keyed by the source
+of the pattern class (its bytecode when there is no source, e.g. frozen by PyInstaller), the table name, the led
+count and the geometry. Later starts map it read-only, so there is
+no build/parse cost and the pages are shared by all the managers of the host.
+"""
+import hashlib
+import inspect
+import logging
+import os
+import tempfile
+
+import numpy
+
+_LOGGER = logging.getLogger("rhasspylisa_ledmanager")
+
+TABLE_FORMAT_VERSION = 1
+
+
+class PatternTableCache:
+	"""Disk cache of pattern tables in cache_dir, None keeps the tables in memory only"""
+	def __init__(self, cache_dir=None):
+		self.cache_dir = cache_dir
+		if cache_dir:
+			os.makedirs(cache_dir, exist_ok=True)
+
+	@staticmethod
+	def table_key(pattern, name):
+		"""Hash of what a table depends on: pattern source, table name, led count and geometry"""
+		digest = hashlib.sha1()
+		digest.update(str(TABLE_FORMAT_VERSION).encode())
+		try:
+			digest.update(inspect.getsource(type(pattern)).encode())
+		except (OSError, TypeError):
+			# no source shipped (e.g. frozen): the bytecode of the methods
+			for attr, value in sorted(vars(type(pattern)).items()):
+				code = getattr(getattr(value, '__func__', value), '__code__', None)
+				if code is not None:
+					digest.update(attr.encode())
+					_code_digest(digest, code)
+		digest.update(name.encode())
+		digest.update(str(pattern.pixels_number).encode())
+		digest.update(numpy.ascontiguousarray(pattern.geometry.led_angles, dtype=float).tobytes())
+		return digest.hexdigest()[:20]
+
+	def get(self, pattern, name, build):
+		"""The table name of pattern, mapped from the cache or built with build() (and cached)"""
+		if not self.cache_dir:
+			return build()
+		path = os.path.join(self.cache_dir, "{}-{}-{}.npy".format(type(pattern).__name__, name, self.table_key(pattern, name)))
+		try:
+			return numpy.load(path, mmap_mode='r')
+		except (OSError, ValueError):
+			pass
+		table = numpy.ascontiguousarray(build())
+		# write aside and rename, a concurrent manager never maps a partial file
+		fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.npy.tmp')
+		try:
+			with os.fdopen(fd, 'wb') as tmp_file:
+				numpy.save(tmp_file, table)
+			os.replace(tmp_path, path)
+		except OSError:
+			_LOGGER.exception("Cannot cache pattern table " + path)
+			if os.path.exists(tmp_path):
+				os.remove(tmp_path)
+			return table
+		_LOGGER.debug("Compiled pattern table " + path)
+		return numpy.load(path, mmap_mode='r')
+
+
+def _code_digest(digest, code):
+	"""Hash the bytecode and the constants of code, nested code objects (lambdas, closures) included"""
+	digest.update(code.co_code)
+	for const in code.co_consts:
+		if inspect.iscode(const):
+			_code_digest(digest, const)
+		elif isinstance(const, frozenset):
+			# `in {...}` constants, their order changes with the string hash seed
+			digest.update(repr(sorted(map(repr, const))).encode())
+		else:
+			digest.update(repr(const).encode())
+
+
+# tables built at each start, when no cache directory is configured
+NO_CACHE = PatternTableCache()
@@ -1,14 +1,22 @@
 # Original from https://github.com/respeaker/4mics_hat
 
+import logging
 import time
 import threading
-from numpy import roll
+import numpy
+
+from .geometry import LedGeometry
+from .hw_probe import probe_board, DEFAULT_PROBE_FRAMES
+from .pattern_tables import NO_CACHE
+from .clock import DEFAULT_CLOCK
 
 try:
     import queue as Queue
 except ImportError:
     import Queue as Queue
 
+_LOGGER = logging.getLogger("rhasspylisa_ledmanager")
+
 
 # For Respeaker4MicArray
 try: 
@@ -30,20 +38,62 @@ LED_MIN_VAL = 0
 LED_MAX_VAL = 255
 clamp_led = lambda n, minn, maxn: int(max(min(maxn, n), minn))
 RESPEAKER_4MIC_ARRAY_N_LEDS = 12
+RESPEAKER_4MIC_ARRAY_SPI_SPEED = 8000000 # default clock, until the board is probed
+
+# Frames are kept in 8.8 fixed point (uint16), and quantized to the 8 bits of the leds only on output
+FRAME_FRACTION_BITS = 8
+FRAME_MAX = (LED_MAX_VAL << FRAME_FRACTION_BITS)
+MAX_KEYFRAME_INTERPOLATION = 0.1 # s, a shown frame is reached from the previous one in at most this time
+
+# How a layer which is not persisted is composed with the persisted one
+ADDING_POLICIES = {
+	'add': lambda persisted, data: persisted + data,
+	'sub': lambda persisted, data: persisted - data,
+	'max': numpy.maximum,
+	'min': numpy.minimum,
+}
 
 
 class LedPattern:
 	"""
 	A class describing what a Led can do 
 	"""
-	def __init__(self, number, show=None):
+	def __init__(self, number, show=None, geometry=None, tables=None, clock=None):
 		self.pixels_number = number
+		# the animations sleep on this clock (real, accelerated or virtual, see clock)
+		self.clock = clock if clock is not None else DEFAULT_CLOCK
+		# where the leds are, e.g. to point the wakeup to a direction
+		self.geometry = geometry if geometry is not None else LedGeometry.ring(number)
+		# where the precompiled frame tables are cached (see table)
+		self.tables = tables if tables is not None else NO_CACHE
 		if not show or not callable(show):
 			def dummy(data):
 				pass
 			show = dummy
 		self.show = show
 		self.stop = False
+		# called with the lateness (s) of every animation frame on its cadence, see sleep
+		self.on_late = None
+		self._t_frame = None
+
+	def table(self, name, build):
+		"""Frame table name, built once by build() and then mapped read-only from the table cache"""
+		return self.tables.get(self, name, build)
+
+	def sleep(self, seconds):
+		"""
+		Wait seconds until the next frame of an animation. The frame period (wake to wake) beyond seconds
+		is the lateness of the animation on its cadence (drawing time and oversleep), reported to on_late.
+		"""
+		self.clock.sleep(seconds)
+		now = self.clock.monotonic()
+		if self._t_frame is not None and self.on_late is not None:
+			self.on_late(now - self._t_frame - seconds)
+		self._t_frame = now
+
+	def restart_cadence(self):
+		"""A new animation starts, its first frame period is not measured"""
+		self._t_frame = None
 
 	def wakeup(self, direction=0):
 		raise NotImplementedError
@@ -57,34 +107,153 @@ class LedPattern:
 	def speak(self):
 		raise NotImplementedError
 
+	def speak_level(self, level):
+		"""One frame of the speak animation at level (0..1), e.g. from the audio envelope"""
+		raise NotImplementedError
+
 	def off(self):
 		raise NotImplementedError
+
+	def blink(self):
+		raise NotImplementedError
 		
 
 class Pixels:
-	
-	def __init__(self, pattern, n_leds, led_n_circshift):
-		self.pattern = pattern(show=self.show, number=n_leds)
-		self.queue = Queue.Queue()
-		self.thread = threading.Thread(target=self._run)
-		self.thread.daemon = True
-		self.thread.start()
+
+	# SPI clocks (Hz) that can be probed, empty if the board has no configurable clock
+	spi_speed_candidates = ()
+
+	def __init__(self, pattern, geometry, tables=None, clock=None):
+		n_leds = geometry.n_leds
+		self.geometry = geometry
+		self.clock = clock if clock is not None else DEFAULT_CLOCK
+		self.pattern = self.make_pattern(pattern, tables)
+		self._start_runner()
 		self._led_buffer = [0,0,0,0] * n_leds # [not_sure, r,g,b]
 		self.last_direction = None
-		self._led_n_circshift = led_n_circshift
-		print("Initiate Pixels with {} leds and circular shift of {} leds".format(n_leds, led_n_circshift))
+		# Frame pacing, the hw is never written faster than max_fps (None: no limit)
+		self._write_lock = threading.RLock()
+		self._max_fps = None
+		self._min_frame_interval = 0.0
+		self._last_write = 0.0
+		self._pending_write = None
+		# Pattern/board swaps: last write before the swap, until the first frame after it
+		self._swap_from = None
+		self._swap_drawn = threading.Event()
+		self.last_swap_gap = None
+		# Idle mode: the renderer is active while a pattern runs or a led is lit. Once idle nothing is
+		# composed or written (unchanged frames are not written) until a new transition or layer arrives
+		self._frame = None # last composed frame
+		self._running = 0
+		self._lit = False
+		self._active = False
+		self._active_event = threading.Event()
+		self._t_activity = self.clock.monotonic()
+		self.active_time = 0.0
+		self.idle_time = 0.0
+		# Output: temporal dithering (error diffusion per led/color) and the optional render thread
+		# which interpolates the shown frames (keyframes) at its own rate, see start_render
+		self.dither = False
+		self._dither_error = numpy.zeros(4*n_leds, dtype=numpy.int32)
+		self._render_thread = None
+		self._render_interval = None
+		self._render_event = threading.Event()
+		self._render_closed = False
+		self._rendered = None
+		self._key_from = None
+		self._key_to = None
+		self._key_time = 0.0
+		self._key_duration = 0.0
+		self.interpolate = True
+		# Watchdog (None: not monitored): monitor.frame_late(s) and monitor.queue_wait(s) are called with the
+		# lateness of the frames on their cadence and the wait of the transitions for the pattern thread
+		self.monitor = None
+		self._t_put = None
+		print("Initiate Pixels with {} leds on {} ring(s)".format(n_leds, len(geometry.rings)))
+
+	def make_pattern(self, pattern, tables=None):
+		"""An instance of the pattern class for these leds (its frame tables are compiled here)"""
+		pattern = pattern(show=self.show, number=self.geometry.n_leds, geometry=self.geometry, tables=tables,
+			clock=self.clock)
+		pattern.on_late = self._frame_late
+		return pattern
+
+	def _frame_late(self, late):
+		if self.monitor is not None:
+			self.monitor.frame_late(late)
+
+	def swap_pattern(self, pattern):
+		"""
+		Replace the pattern between two frames: once swapped the old pattern cannot draw anymore,
+		the current frame stays on the leds until something new is drawn.
+		"""
+		with self._write_lock:
+			old = self.pattern
+			old.show = lambda data: None
+			old.stop = True
+			self.pattern = pattern
+			# the old pattern ends (silently) its current animation on its own thread, while the new one
+			# starts at once on a new one. The queued transitions are bound to the old pattern.
+			old_queue = self.queue
+			self._start_runner()
+			old_queue.put(None)
+			self._mark_swap(self._last_write)
+
+	def take_over(self, pixels):
+		"""Continue from the frame shown by pixels, the board being replaced (not written anymore)"""
+		pixels.close()
+		self.max_fps = pixels.max_fps
+		self.dither = pixels.dither
+		self.interpolate = pixels.interpolate
+		self.monitor = pixels.monitor
+		if pixels._render_interval:
+			self.start_render(1.0/pixels._render_interval)
+		with self._write_lock:
+			self._mark_swap(pixels._last_write)
+			if pixels.pixels_number == self.pixels_number:
+				self.show(numpy.array(pixels.ledbuffer, dtype=float))
+
+	def close(self):
+		"""Stop the pattern thread and the pending write, the leds keep their last frame"""
+		with self._write_lock:
+			self.pattern.show = lambda data: None
+			self.pattern.stop = True
+			if self._pending_write is not None:
+				self._pending_write.cancel()
+				self._pending_write = None
+			self._drain()
+			self.queue.put(None)
+			self._render_closed = True
+			self._render_event.set()
+			# nobody waits on a closed board
+			self._active_event.set()
+
+	def _mark_swap(self, last_write):
+		self._swap_from = last_write
+		self.last_swap_gap = None
+		self._swap_drawn.clear()
+
+	def wait_swap_frame(self, timeout=None):
+		"""Time (s) between the last frame before the swap and the first one after, None if none was drawn"""
+		self._swap_drawn.wait(timeout)
+		return self.last_swap_gap
+
+	# The transitions are bound to the pattern of when they are put (as the bound methods are): a transition
+	# queued before a swap_pattern must not drive the new pattern from the old runner
 
 	def wakeup(self, direction=0):
 		self.last_direction = direction
+		pattern = self.pattern
 		def f():
-			self.pattern.wakeup(direction)
+			pattern.wakeup(direction)
 
 		self.put(f)
 
 	def listen(self):
 		if self.last_direction:
+			pattern, direction = self.pattern, self.last_direction
 			def f():
-				self.pattern.wakeup(self.last_direction)
+				pattern.wakeup(direction)
 			self.put(f)
 		else:
 			self.put(self.pattern.listen)
@@ -95,54 +264,128 @@ class Pixels:
 	def speak(self):
 		self.put(self.pattern.speak)
 
+	def speak_envelope(self, levels, window):
+		"""
+		Animate the speak pattern with the envelope levels (an iterable, one level per window seconds),
+		in sync with the playback that starts now. Late windows are skipped, not queued.
+		"""
+		pattern = self.pattern
+		def f():
+			t_start = self.clock.monotonic()
+			for n, level in enumerate(levels):
+				if pattern.stop:
+					break
+				wait = t_start + n*window - self.clock.monotonic()
+				if wait < -window:
+					continue
+				if wait > 0.0:
+					self.clock.sleep(wait)
+				pattern.speak_level(level)
+		self.put(f)
+
 	def off(self):
 		self.put(self.pattern.off)
 
-	def blink(self):
-		self.put(self.pattern.off)
+	def blink(self, times=1):
+		pattern = self.pattern
+		def f():
+			for _ in range(times):
+				pattern.blink()
+		self.put(f)
 
 	def put(self, func):
 		self.pattern.stop = True
-		if self.queue.qsize() > 1:
-			print('+-+-+-+- TOOOO MUCHHHH!!! (' + str(self.queue.qsize()) + ')')
+		# latest wins: a transition still waiting in the queue is superseded by the new one
+		self._drain()
+		self._t_put = self.clock.monotonic()
 		self.queue.put(func)
 
+	def _drain(self):
+		try:
+			while True:
+				self.queue.get_nowait()
+		except Queue.Empty:
+			pass
+
+	def _start_runner(self):
+		self.queue = Queue.Queue()
+		self.thread = threading.Thread(target=self._run, args=(self.queue, self.pattern), name="led-pattern")
+		self.thread.daemon = True
+		self.thread.start()
+
 	@property
 	def pixels_number(self):
 		return len(self._led_buffer)//4
 
 	def set_all(self, list_rgb, persist_data=True, adding_policy='add', compensate_list=0):
-		# a flat list of length n_pixel*3 (r,g,b)
-		# Get energy and combine
+		# a list (or (n, 3) array) of n spots (r,g,b) evenly spaced on the ring, each led shows the max of its spots
+		# (the spot -> led mapping is precomputed by the board geometry)
 		# compensate_list,the in degre a circula shift
-		data = [0,0,0,0] * self.pixels_number
-		
-		ratio = len(list_rgb)/self.pixels_number
-		idxs = [int(n*ratio) for n in range(self.pixels_number)]
+		rgb = numpy.asarray(list_rgb).reshape(-1, 3)
 		
 		# if the data has to be persisted stop the actual pattern in execution
 		if persist_data:
 			self.pattern.stop = True
 			
-		l_idx = idxs[0]
-		for n,idx in enumerate(idxs[1:]):
-			rgb = list_rgb[l_idx:idx]
-			r = max([c[0] for c in rgb])
-			g = max([c[1] for c in rgb])
-			b = max([c[2] for c in rgb])
-			
-			data[n*4:(n+1)*4] = [0, r, g, b] # first element is always 0
-			#data[n*4:(n+1)*4] = [0, rgb[0], rgb[1], rgb[2]] 
-			l_idx = idx
-		# compensate for any mismatch between angles and ledsdata = roll(data,-4*self.pixels_number//4)
-		data = roll(data, self.led_n_circshift*4)
-		self.show(data, persist_data=persist_data, adding_policy=adding_policy)
-
-	def _run(self):
+		data = numpy.zeros((self.pixels_number, 4), dtype=rgb.dtype) # first element is always 0
+		data[:, 1:] = self.geometry.map_spots(rgb)
+		self.show(data.ravel(), persist_data=persist_data, adding_policy=adding_policy)
+
+	def _run(self, queue, pattern):
+		"""Run the transitions of queue on pattern, the pattern of the runner (see swap_pattern)"""
 		while True:
-			func = self.queue.get()
-			self.pattern.stop = False
-			func()
+			func = queue.get()
+			if func is None:
+				break
+			pattern.stop = False
+			pattern.restart_cadence()
+			t_put = self._t_put
+			if self.monitor is not None and t_put is not None:
+				self.monitor.queue_wait(self.clock.monotonic() - t_put)
+			self._set_running(1)
+			try:
+				func()
+			except Exception:
+				# a bad transition (e.g. a malformed envelope) must not end the runner, the next ones still play
+				_LOGGER.exception("Led pattern transition failed")
+			finally:
+				self._set_running(-1)
+
+	def _set_running(self, n):
+		with self._write_lock:
+			self._running += n
+			self._update_activity()
+
+	def _update_activity(self):
+		active = self._running > 0 or self._lit
+		if active != self._active:
+			now = self.clock.monotonic()
+			if self._active:
+				self.active_time += now - self._t_activity
+			else:
+				self.idle_time += now - self._t_activity
+			self._t_activity = now
+			self._active = active
+			if active:
+				self._active_event.set()
+			else:
+				self._active_event.clear()
+
+	@property
+	def idle(self):
+		return not self._active
+
+	def activity(self):
+		"""(active, idle) seconds of the renderer since start, the current period included"""
+		with self._write_lock:
+			elapsed = self.clock.monotonic() - self._t_activity
+			if self._active:
+				return self.active_time + elapsed, self.idle_time
+			return self.active_time, self.idle_time + elapsed
+
+	def wait_active(self, timeout=None):
+		"""Block while the renderer is idle"""
+		return self._active_event.wait(timeout)
 
 	#def show(self, data, persist_data=True):
 	#	raise NotImplementedError
@@ -158,49 +401,148 @@ class Pixels:
 			ubtract from data the persisted value,  or use min/max between data and persisted data
 		 
 		"""
+		with self._write_lock:
+			frame = self._compose(data, persist_data, adding_policy)
+			if frame is None:
+				return
+			if self._render_thread is not None:
+				# the render thread moves the leds to the new frame
+				self._set_keyframe(frame)
+				return
+			self._set_leds(frame)
+			# update the entire LED strip
+			self._write_leds()
+
+	def _compose(self, data, persist_data, adding_policy):
+		"""Compose data with the persisted buffer, return the fixed point frame or None if it does not change"""
+		n = 4*self.pixels_number
 		if persist_data:
 			self.ledbuffer = data # save the buffer
-			for i in range(self.pixels_number):
-				self.set_led(i , int(data[4*i + 1]), int(data[4*i + 2]), int(data[4*i + 3]))
+			frame = numpy.asarray(data, dtype=float)[:n]
 		else:
-			data_set = [0,0,0]
-			for i in range(self.pixels_number):				
-				if adding_policy=='add':
-					data_set[0] = self.ledbuffer[4*i+1] + data[4*i+1]
-					data_set[1] = self.ledbuffer[4*i+2] + data[4*i+2]
-					data_set[2] = self.ledbuffer[4*i+3] + data[4*i+3]
-				elif adding_policy=='sub':
-					data_set[0] = self.ledbuffer[4*i+1] - data[4*i+1]
-					data_set[1] = self.ledbuffer[4*i+2] - data[4*i+2]
-					data_set[2] = self.ledbuffer[4*i+3] - data[4*i+3]
-				elif adding_policy=='max':
-					data_set[0] = max(self.ledbuffer[4*i+1], data[4*i+1])
-					data_set[1] = max(self.ledbuffer[4*i+2], data[4*i+2])
-					data_set[2] = max(self.ledbuffer[4*i+3], data[4*i+3])
-				elif adding_policy=='min':
-					data_set[0] = min(self.ledbuffer[4*i+1], data[4*i+1])
-					data_set[1] = min(self.ledbuffer[4*i+2], data[4*i+2])
-					data_set[2] = min(self.ledbuffer[4*i+3], data[4*i+3])
-				else:
-					print(adding_policy)
-					data_set[0] = self.ledbuffer[4*i+1] 
-					data_set[1] = self.ledbuffer[4*i+2] 
-					data_set[2] = self.ledbuffer[4*i+3] 
-				# limit min,max value to an int
-				# print(i, data_set[0], data_set[1], data_set[2])
-				self.set_led(i, data_set[0], data_set[1], data_set[2])
-		
-		# update the entire LED strip
+			persisted = numpy.asarray(self.ledbuffer, dtype=float)[:n]
+			data = numpy.asarray(data, dtype=float)[:n]
+			if adding_policy in ADDING_POLICIES:
+				frame = ADDING_POLICIES[adding_policy](persisted, data)
+			else:
+				print(adding_policy)
+				frame = persisted
+		frame = numpy.clip(frame*(1 << FRAME_FRACTION_BITS), 0, FRAME_MAX).astype(numpy.uint16)
+		if self._frame is not None and numpy.array_equal(frame, self._frame):
+			# e.g. a faded (all zero) overlay: nothing to write, the leds can stay idle
+			return None
+		self._frame = frame
+		self._lit = bool(frame.reshape(-1, 4)[:, 1:].any())
+		self._update_activity()
+		return frame
+
+	def _set_leds(self, frame):
+		"""Quantize a fixed point frame on the leds, diffusing the quantization error on the next frames if dither"""
+		frame = frame.astype(numpy.int32)
+		if self.dither:
+			frame += self._dither_error
+			leds = frame >> FRAME_FRACTION_BITS
+			self._dither_error = frame - (leds << FRAME_FRACTION_BITS)
+		else:
+			leds = frame >> FRAME_FRACTION_BITS
+		for i, (r, g, b) in enumerate(leds.reshape(-1, 4)[:, 1:].tolist()):
+			self.set_led(i, r, g, b)
+
+	def start_render(self, render_fps):
+		"""
+		Render the leds at render_fps (limited by max_fps) on a dedicated thread: every shown frame is a keyframe,
+		reached from the current one by linear interpolation in the time the pattern took between its last two
+		frames, so the animations are as smooth as the rate allows whatever the pattern cadence. The thread
+		waits (no tick) once the keyframe is reached, unless dithering a fractional frame.
+		"""
+		with self._write_lock:
+			self._render_interval = 1.0/render_fps
+			if self._render_thread is None:
+				self._render_thread = threading.Thread(target=self._render_loop, name="led-render", daemon=True)
+				self._render_thread.start()
+
+	def _set_keyframe(self, frame):
+		now = self.clock.monotonic()
+		self._key_from = self._rendered if self._rendered is not None else frame.astype(numpy.int32)
+		self._key_to = frame.astype(numpy.int32)
+		self._key_duration = min(now - self._key_time, MAX_KEYFRAME_INTERPOLATION) if self.interpolate else 0.0
+		self._key_time = now
+		self._render_event.set()
+
+	def _render_loop(self):
+		t_tick = None
+		while True:
+			if not self._render_event.is_set():
+				# the first tick after a wait is not late
+				t_tick = None
+				self._render_event.wait()
+			with self._write_lock:
+				if self._render_closed:
+					return
+				now = self.clock.monotonic()
+				elapsed = now - self._key_time
+				alpha = min(1.0, elapsed/self._key_duration) if self._key_duration > 0.0 else 1.0
+				frame = self._key_from + ((self._key_to - self._key_from)*alpha).astype(numpy.int32)
+				self._rendered = frame
+				self._set_leds(frame)
+				self._hw_write()
+				fractional = self.dither and (frame & ((1 << FRAME_FRACTION_BITS) - 1)).any()
+				if alpha >= 1.0 and not fractional:
+					self._render_event.clear()
+				interval = max(self._render_interval, self._min_frame_interval)
+			if t_tick is not None and self.monitor is not None:
+				self.monitor.frame_late(now - t_tick - interval)
+			t_tick = now
+			self.clock.sleep(interval)
+
+	def _write_leds(self):
+		"""
+		Push the composed frame to the hw. If the previous write is closer than 1/max_fps, the frame
+		is not written now but coalesced in a single pending write, so no more frames are sent than
+		the hw can output and the last composed frame is always the one shown.
+		"""
+		with self._write_lock:
+			wait = self._last_write + self._min_frame_interval - self.clock.monotonic()
+			if wait > 0.0:
+				if self._pending_write is None:
+					self._pending_write = self.clock.timer(wait, self._flush_pending)
+					self._pending_write.daemon = True
+					self._pending_write.start()
+				return
+			self._hw_write()
+
+	def _flush_pending(self):
+		with self._write_lock:
+			self._pending_write = None
+			self._hw_write()
+
+	def _hw_write(self):
+		self._last_write = self.clock.monotonic()
 		self.update_leds()
-		
+		if self._swap_from is not None:
+			self.last_swap_gap = self._last_write - self._swap_from
+			self._swap_from = None
+			self._swap_drawn.set()
+
 	@property
-	def led_n_circshift(self):
-		return self._led_n_circshift
-		
-	@led_n_circshift.setter
-	def led_n_circshift(self, val):
-		self._led_n_circshift = val
-	
+	def max_fps(self):
+		return self._max_fps
+
+	@max_fps.setter
+	def max_fps(self, val):
+		self._max_fps = val
+		self._min_frame_interval = 1.0/val if val else 0.0
+
+	def probe(self, n_frames=None):
+		"""Measure the hw throughput, select the SPI clock and limit the frame rate accordingly"""
+		with self._write_lock:
+			caps = probe_board(self, n_frames or DEFAULT_PROBE_FRAMES)
+			self.max_fps = caps.max_fps
+		return caps
+
+	def set_spi_speed(self, speed_hz):
+		raise NotImplementedError
+
 	@property
 	def ledbuffer(self):
 		return self._led_buffer
@@ -220,12 +562,19 @@ class Pixels:
 
 class Respeaker4MicArray(Pixels):
 
-	def __init__(self, pattern):
-		led_n_circshift=-RESPEAKER_4MIC_ARRAY_N_LEDS//4
-		super().__init__(pattern=pattern, n_leds=RESPEAKER_4MIC_ARRAY_N_LEDS, led_n_circshift=led_n_circshift)
-		self.dev = APA102(num_led=self.pixels_number)
+	spi_speed_candidates = (1000000, 2000000, 4000000, 8000000, 16000000)
+
+	# led 0 is centered at 105 deg of the DOA frame (the leds are shifted by 3 positions and half a led)
+	geometry = LedGeometry.ring(RESPEAKER_4MIC_ARRAY_N_LEDS, offset=105.0)
+
+	def __init__(self, pattern, tables=None, clock=None):
+		super().__init__(pattern=pattern, geometry=self.geometry, tables=tables, clock=clock)
+		self.dev = APA102(num_led=self.pixels_number, max_speed_hz=RESPEAKER_4MIC_ARRAY_SPI_SPEED)
 		self.power = LED(5)
 		self.power.on()
+
+	def set_spi_speed(self, speed_hz):
+		self.dev.spi.max_speed_hz = speed_hz
 		
 	def set_led(self, i, r, g, b):
 		if 0 <= i < self.pixels_number:
@@ -239,10 +588,10 @@ class Respeaker4MicArray(Pixels):
 
 class MatrixVoice(Pixels):
 
-	def __init__(self, pattern):
-		led_n_circshift=0
+	def __init__(self, pattern, tables=None, clock=None):
 		n_leds=ev_led.length
-		super().__init__(pattern=pattern, n_leds=n_leds, led_n_circshift=led_n_circshift)
+		super().__init__(pattern=pattern, geometry=LedGeometry.ring(n_leds, offset=180.0/n_leds), tables=tables,
+			clock=clock)
 		# self.PIXELS_N = ev_led.length
 		self._everloop_leds = ['black'] * self.pixels_number
 		# ev_led.set(self.everloop_leds)
@@ -261,8 +610,8 @@ class MatrixVoice(Pixels):
 
 class DummyBoard(Pixels):
 
-	def __init__(self, pattern):
-		super().__init__(pattern=pattern, n_leds=10, led_n_circshift=0)
+	def __init__(self, pattern, tables=None, clock=None):
+		super().__init__(pattern=pattern, geometry=LedGeometry.ring(10, offset=18.0), tables=tables, clock=clock)
 		self.dev = 'Dummy'
 		
 	def set_led(self, i, r, g, b):
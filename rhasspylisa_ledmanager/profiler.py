@@ -0,0 +1,166 @@
+"""
+On-demand sampling profiler of the running led manager.
+
+While a profile runs, a thread samples the stacks of all the other threads (the asyncio loop, the pattern
+runner, the renderer, ...) every interval from sys._current_frames, nothing is traced or installed in the
+sampled threads. Nothing runs at all between two profiles.
+
+At the end it writes:
+- a collapsed stack file (one "thread;outer;...;inner count" line per stack, as read by flamegraph.pl
+  and speedscope)
+- a summary: the samples of the pattern, compositing and SPI hot paths, and the per-function self/total samples
+"""
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+_LOGGER = logging.getLogger("rhasspylisa_ledmanager")
+
+DEFAULT_PROFILE_DURATION = 10.0 # s
+DEFAULT_SAMPLE_INTERVAL = 0.005 # s between two samples
+MAX_PROFILE_DURATION = 300.0 # s
+SUMMARY_FUNCTIONS = 40 # functions listed in the summary
+# A sample ending in one of these functions is a thread waiting (sleep, event, queue, select), not busy
+IDLE_FUNCTIONS = ('clock:sleep', 'threading:wait', 'threading:join', 'selectors:select', 'connection:poll')
+
+# Hot paths of the summary: functions of these modules (or module:function prefixes)
+HOT_PATHS = {
+	'pattern': ('led_patterns.',),
+	'compositing': ('pixels:show', 'pixels:set_all', 'pixels:_compose', 'pixels:_set_leds', 'pixels:_set_keyframe',
+					'pixels:_render_loop', 'geometry:', 'energy_DOAs:'),
+	'spi': ('apa102:', 'pixels:update_leds', 'pixels:_hw_write', 'hw_writer:'),
+}
+
+
+class ProfilerException(Exception):
+	pass
+
+
+def _function_name(code):
+	module = os.path.splitext(os.path.basename(code.co_filename))[0]
+	parent = os.path.basename(os.path.dirname(code.co_filename))
+	if parent == 'led_patterns':
+		module = parent + '.' + module
+	return "{}:{}".format(module, code.co_name)
+
+
+class SamplingProfiler:
+	"""Sample the thread stacks for a duration, one profile at a time (see start)"""
+	def __init__(self, output_dir=None, interval=DEFAULT_SAMPLE_INTERVAL):
+		self.output_dir = output_dir or tempfile.gettempdir()
+		self.interval = interval
+		self._thread = None
+		self._lock = threading.Lock()
+		self.last_files = None
+
+	@property
+	def running(self):
+		return self._thread is not None and self._thread.is_alive()
+
+	def start(self, duration=DEFAULT_PROFILE_DURATION, name=None):
+		"""Profile for duration seconds in background, the files are named name (default: timestamped)"""
+		duration = min(float(duration), MAX_PROFILE_DURATION)
+		with self._lock:
+			if self.running:
+				raise ProfilerException("A profile is already running")
+			name = name or time.strftime("ledmanager-profile-%Y%m%d-%H%M%S")
+			self._thread = threading.Thread(target=self._profile, args=(duration, name), name="led-profiler", daemon=True)
+			self._thread.start()
+		_LOGGER.info("Profiling for {:.1f} s".format(duration))
+
+	def wait(self, timeout=None):
+		thread = self._thread
+		if thread is not None:
+			thread.join(timeout)
+		return self.last_files
+
+	def _profile(self, duration, name):
+		stacks, n_samples = self.sample(duration)
+		base = os.path.join(self.output_dir, name)
+		self.last_files = (base + ".folded", base + ".summary.txt")
+		write_collapsed(self.last_files[0], stacks)
+		write_summary(self.last_files[1], stacks, n_samples, self.interval)
+		_LOGGER.info("Profile of {} samples written in {} and {}".format(n_samples, *self.last_files))
+
+	def sample(self, duration):
+		"""Sample the other threads for duration seconds, return (Counter of the stacks, samples)"""
+		stacks = Counter()
+		own_id = threading.get_ident()
+		t_end = time.monotonic() + duration
+		n_samples = 0
+		next_sample = time.monotonic()
+		while time.monotonic() < t_end:
+			names = {thread.ident: thread.name for thread in threading.enumerate()}
+			for thread_id, frame in sys._current_frames().items():
+				if thread_id == own_id:
+					continue
+				functions = []
+				while frame is not None:
+					functions.append(_function_name(frame.f_code))
+					frame = frame.f_back
+				functions.append(names.get(thread_id, str(thread_id)))
+				stacks[tuple(reversed(functions))] += 1
+			n_samples += 1
+			next_sample += self.interval
+			wait = next_sample - time.monotonic()
+			if wait > 0.0:
+				time.sleep(wait)
+			else:
+				next_sample = time.monotonic()
+		return stacks, n_samples
+
+
+def write_collapsed(path, stacks):
+	with open(path, 'w') as f:
+		for stack, count in sorted(stacks.items()):
+			f.write("{} {}\n".format(";".join(stack), count))
+
+
+def function_samples(stacks):
+	"""(self, total) Counters of samples per function (total: the function is on the stack, once per sample)"""
+	self_samples = Counter()
+	total_samples = Counter()
+	for stack, count in stacks.items():
+		functions = stack[1:]
+		if functions:
+			self_samples[functions[-1]] += count
+		for function in set(functions):
+			total_samples[function] += count
+	return self_samples, total_samples
+
+
+def _is_hot(function, prefixes):
+	return any(function.startswith(prefix) for prefix in prefixes)
+
+
+def write_summary(path, stacks, n_samples, interval):
+	self_samples, total_samples = function_samples(stacks)
+	with open(path, 'w') as f:
+		f.write("{} samples every {:.1f} ms\n\n".format(n_samples, 1000*interval))
+		f.write("Threads: busy samples (not waiting) and busy samples in a function of the hot paths\n")
+		threads = Counter()
+		busy = Counter()
+		hot = Counter()
+		for stack, count in stacks.items():
+			threads[stack[0]] += count
+			if stack[-1] in IDLE_FUNCTIONS:
+				continue
+			busy[stack[0]] += count
+			for category, prefixes in HOT_PATHS.items():
+				if any(_is_hot(function, prefixes) for function in stack[1:]):
+					hot[stack[0], category] += count
+		for thread, count in threads.most_common():
+			f.write("  {:<24} busy {}/{} {}\n".format(thread, busy[thread], count, " ".join(
+				"{} {}".format(category, hot[thread, category]) for category in HOT_PATHS)))
+		for category, prefixes in HOT_PATHS.items():
+			f.write("\nHot path {}: function, self samples, total samples\n".format(category))
+			for function, total in total_samples.most_common():
+				if _is_hot(function, prefixes):
+					f.write("  {:<48} {:>8} {:>8}\n".format(function, self_samples[function], total))
+		f.write("\nAll functions: self samples, total samples\n")
+		for function, count in self_samples.most_common(SUMMARY_FUNCTIONS):
+			f.write("  {:<48} {:>8} {:>8}\n".format(function, count, total_samples[function]))
@@ -0,0 +1,81 @@
+"""
+Adaptive quality of the energy overlays under load.
+
+The cost of the energy frames (time spent handling the SSL/SST messages) is measured per window as a load
+(seconds of processing per second). Over budget, or when the watchdog reports the frames or the loop late,
+the quality is stepped down one step per window in the QUALITY_STEPS order; it is stepped back up one step
+every STEP_UP_WINDOWS windows of headroom. The dialogue states (wakeup, think, speak) are never degraded,
+the overlays make room for them.
+"""
+import logging
+import threading
+
+_LOGGER = logging.getLogger("rhasspylisa_ledmanager")
+
+# Stepped down in this order (and back up in the reverse one)
+QUALITY_STEPS = (
+	'spot_resolution', # the overlays are drawn on LOW_QUALITY_SPOT_DECIMATION times fewer spots
+	'sst_overlay', # the SST messages are dropped, no tracked overlay
+	'fps', # the leds are written at LOW_QUALITY_FPS at most
+	'dither', # no temporal dithering
+)
+DEFAULT_LOAD_BUDGET = 0.3 # s/s of energy frame processing, stepped down above
+DEFAULT_LOAD_HEADROOM = 0.1 # s/s, stepped back up below
+STEP_UP_WINDOWS = 3 # windows with headroom before a step up
+LOW_QUALITY_SPOT_DECIMATION = 3
+LOW_QUALITY_FPS = 20.0
+
+
+class CostMeter:
+	"""Processing time added since the last take (thread safe)"""
+	def __init__(self):
+		self._lock = threading.Lock()
+		self.total = 0.0
+
+	def add(self, elapsed):
+		with self._lock:
+			self.total += elapsed
+
+	def take(self):
+		with self._lock:
+			total = self.total
+			self.total = 0.0
+		return total
+
+
+class QualityController:
+	"""Step the quality level (0: full quality, len(QUALITY_STEPS): every step down), apply(level) applies it"""
+	def __init__(self, apply, budget=DEFAULT_LOAD_BUDGET, headroom=DEFAULT_LOAD_HEADROOM):
+		self.apply = apply
+		self.budget = budget
+		self.headroom = headroom
+		self.level = 0
+		self.cost = CostMeter()
+		self._headroom_windows = 0
+
+	@property
+	def steps_down(self):
+		return QUALITY_STEPS[:self.level]
+
+	def update(self, window, late=False):
+		"""End of a window of window seconds (late: the frames or the loop were late in it), return the level"""
+		load = self.cost.take()/window if window > 0.0 else 0.0
+		if late or load > self.budget:
+			self._headroom_windows = 0
+			if self.level < len(QUALITY_STEPS):
+				self._set_level(self.level + 1, "load {:.2f}{}".format(load, ", late" if late else ""))
+		elif load < self.headroom:
+			self._headroom_windows += 1
+			if self.level > 0 and self._headroom_windows >= STEP_UP_WINDOWS:
+				self._headroom_windows = 0
+				self._set_level(self.level - 1, "load {:.2f}".format(load))
+		else:
+			self._headroom_windows = 0
+		return self.level
+
+	def _set_level(self, level, reason):
+		step = QUALITY_STEPS[max(level, self.level) - 1]
+		_LOGGER.warning("Quality {} {} ({}), level {}/{}".format(
+			"down:" if level > self.level else "up:", step, reason, level, len(QUALITY_STEPS)))
+		self.level = level
+		self.apply(level)
@@ -0,0 +1,93 @@
+"""
+Snapshot of the visual state (dialogue state, persisted led layer, energy arrays) in a small memory-mapped file,
+so that a restarted manager shows again what it was showing.
+"""
+import logging
+import os
+import threading
+import time
+
+import numpy
+
+_LOGGER = logging.getLogger("rhasspylisa_ledmanager")
+
+SNAPSHOT_MAGIC = b'LLMS'
+SNAPSHOT_VERSION = 1
+DEFAULT_SNAPSHOT_INTERVAL = 1.0 # s
+DEFAULT_SNAPSHOT_MAX_AGE = 30.0 # s, an older dialogue state is not resumed (the session is over), only shown
+
+
+def snapshot_dtype(n_leds, n_spots):
+	return numpy.dtype([
+		('magic', 'S4'),
+		('version', '<u2'),
+		('n_leds', '<u2'),
+		('n_spots', '<u2'),
+		('seq', '<u4'), # odd while a snapshot is being written
+		('time', '<f8'), # wall clock, it has to survive the process
+		('state', 'S16'),
+		('led_buffer', '<f4', (4*n_leds,)),
+		('localized', '<f4', (3, n_spots)), # energy_plane_xy, energy_axis_z, level
+		('tracked', '<f4', (3, n_spots)),
+		('tracked_rgb', '<f4', (n_spots, 3)),
+	])
+
+
+class StateSnapshot:
+	"""A single snapshot record, memory mapped on path (created or resized if its layout does not match)"""
+	def __init__(self, path, n_leds, n_spots):
+		self.path = path
+		dtype = snapshot_dtype(n_leds, n_spots)
+		valid = os.path.isfile(path) and os.path.getsize(path) == dtype.itemsize
+		self._map = numpy.memmap(path, dtype=dtype, mode='r+' if valid else 'w+', shape=(1,))
+		self.record = self._map[0] # a view on the mapped record
+		if not valid or self.record['magic'] != SNAPSHOT_MAGIC or self.record['version'] != SNAPSHOT_VERSION \
+				or self.record['n_leds'] != n_leds or self.record['n_spots'] != n_spots:
+			self.record['seq'] = 0
+			self.record['time'] = 0.0
+			self.record['magic'] = SNAPSHOT_MAGIC
+			self.record['version'] = SNAPSHOT_VERSION
+			self.record['n_leds'] = n_leds
+			self.record['n_spots'] = n_spots
+		elif self.record['seq'] % 2:
+			# torn write (the process died in save): drop the record, the next saves make it valid again
+			_LOGGER.warning("Snapshot {} was being written, discarded".format(path))
+			self.record['seq'] += 1
+			self.record['time'] = 0.0
+		self._lock = threading.Lock()
+
+	@property
+	def valid(self):
+		return self.record['time'] > 0.0 and self.record['seq'] % 2 == 0
+
+	@property
+	def age(self):
+		return time.time() - self.record['time']
+
+	def save(self, state, led_buffer, localized, tracked):
+		"""Write the state, the persisted led layer and the localized/tracked base_sources arrays"""
+		with self._lock:
+			record = self.record
+			record['seq'] += 1
+			record['state'] = state.encode()
+			record['led_buffer'] = led_buffer
+			# at full resolution whatever the spot decimation of the sources
+			record['localized'] = localized.expand(numpy.array((localized.energy_plane_xy, localized.energy_axis_z, localized.level)))
+			record['tracked'] = tracked.expand(numpy.array((tracked.energy_plane_xy, tracked.energy_axis_z, tracked.level)))
+			record['tracked_rgb'] = tracked.expand(tracked.rgb, axis=0)
+			record['time'] = time.time()
+			record['seq'] += 1
+
+	def restore(self, localized, tracked):
+		"""Reload the energy arrays, return (state, led_buffer) or None if there is no complete snapshot"""
+		with self._lock:
+			if not self.valid:
+				return None
+			record = self.record
+			localized.energy_plane_xy, localized.energy_axis_z, localized.level = localized.merge(record['localized'])
+			tracked.energy_plane_xy, tracked.energy_axis_z, tracked.level = tracked.merge(record['tracked'])
+			tracked.rgb = tracked.merge(record['tracked_rgb'], axis=0)
+			return record['state'].decode(), numpy.array(record['led_buffer'], dtype=float)
+
+	def flush(self):
+		self._map.flush()
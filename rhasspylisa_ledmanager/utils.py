@@ -1,17 +1,67 @@
 """Utility methods"""
-import io
-import wave
+import struct
+import typing
+from collections import namedtuple
 
+WavInfo = namedtuple(
+    "WavInfo",
+    ["duration", "sample_rate", "channels", "sample_width", "data_offset", "data_size", "audio_format"],
+)
 
-def get_wav_duration(wav_bytes: bytes) -> float:
-    """Return the real-time duration of a WAV file"""
-    with io.BytesIO(wav_bytes) as wav_buffer:
-        wav_file: wave.Wave_read = wave.open(wav_buffer, "rb")
-        with wav_file:
-            width = wav_file.getsampwidth()
-            rate = wav_file.getframerate()
+WAV_FMT = struct.Struct("<HHIIHH")
+WAV_FORMAT_PCM = 1
+WAV_FORMAT_EXTENSIBLE = 0xFFFE # the format is the first 2 bytes of the sub format GUID
+
+
+def parse_wav_header(wav_bytes: typing.Union[bytes, memoryview]) -> WavInfo:
+    """
+    Walk the RIFF chunks of a WAV file (without copying it) up to the data chunk,
+    ValueError if the header is truncated or malformed
+    """
+    view = memoryview(wav_bytes)
+    if len(view) < 12 or view[0:4] != b"RIFF" or view[8:12] != b"WAVE":
+        raise ValueError("Not a RIFF/WAVE payload")
+
+    fmt = None
+    offset = 12
+    while offset + 8 <= len(view):
+        chunk_id = view[offset : offset + 4]
+        (chunk_size,) = struct.unpack_from("<I", view, offset + 4)
+        body = offset + 8
+        if chunk_id == b"fmt ":
+            if chunk_size < WAV_FMT.size or body + WAV_FMT.size > len(view):
+                raise ValueError("Truncated WAV fmt chunk")
+            # format tag, channels, sample rate, byte rate, block align, bits per sample
+            fmt = WAV_FMT.unpack_from(view, body)
+            audio_format = fmt[0]
+            if audio_format == WAV_FORMAT_EXTENSIBLE and chunk_size >= 26 and body + 26 <= len(view):
+                (audio_format,) = struct.unpack_from("<H", view, body + 24)
+        elif chunk_id == b"data":
+            if fmt is None:
+                raise ValueError("WAV data chunk before fmt chunk")
+            _, channels, rate, _, block_align, bits = fmt
+            if not rate or not channels:
+                raise ValueError("WAV with {} Hz, {} channels".format(rate, channels))
+            # Streamed WAVs have a 0 or 0xFFFFFFFF data size, the data is the rest of the payload
+            available = len(view) - body
+            data_size = chunk_size if 0 < chunk_size <= available else available
+            frames = data_size // block_align if block_align else 0
+            return WavInfo(
+                duration=frames / float(rate),
+                sample_rate=rate,
+                channels=channels,
+                sample_width=bits // 8,
+                data_offset=body,
+                data_size=data_size,
+                audio_format=audio_format,
+            )
 
-            # getnframes is not reliable.
-            guess_frames = (len(wav_bytes) - 44) / width
+        # Chunks are word aligned
+        offset = body + chunk_size + (chunk_size & 1)
 
-            return guess_frames / float(rate)
+    raise ValueError("WAV without data chunk")
+
+
+def get_wav_duration(wav_bytes: bytes) -> float:
+    """Return the real-time duration of a WAV file"""
+    return parse_wav_header(wav_bytes).duration
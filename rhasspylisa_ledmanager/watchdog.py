@@ -0,0 +1,145 @@
+"""
+Watchdog of the led manager timing.
+
+Three measures are kept per window (the max of the window):
+- loop_lag: how late the asyncio loop runs a callback (handle_messages_async falling behind)
+- frame_late: how late the frames are on their cadence (pattern sleeps, render ticks), see LedPattern.sleep
+- queue_wait: how long a led transition waits for the pattern thread (Pixels.put -> start)
+
+At the end of every window the maxima are compared with the thresholds. An exceeded threshold is an
+alert (logged and passed to alert, e.g. published on the status topic) and the manager is degraded;
+it is restored after RECOVER_WINDOWS windows without alert.
+The watchdog only runs while the leds are active (see wait_active): on an idle satellite its thread
+blocks and the asyncio loop is not probed, nothing wakes until a transition or a layer arrives.
+"""
+import logging
+import threading
+import time
+
+from .clock import DEFAULT_CLOCK
+
+_LOGGER = logging.getLogger("rhasspylisa_ledmanager")
+
+WATCHDOG_STATUS_TOPIC = 'lisa/ledmanager/status/watchdog'
+DEFAULT_WATCHDOG_WINDOW = 1.0 # s, window of the measures
+DEFAULT_LOOP_LAG = 0.05 # s, alert threshold of the asyncio loop lag
+DEFAULT_FRAME_LATE = 0.05 # s, alert threshold of a frame late on its cadence
+DEFAULT_QUEUE_WAIT = 0.25 # s, alert threshold of a transition waiting for the pattern thread
+LOOP_PROBE_INTERVAL = 0.1 # s between two probes of the asyncio loop
+RECOVER_WINDOWS = 5 # windows without alert before leaving the degraded mode
+
+MEASURES = ('loop_lag', 'frame_late', 'queue_wait')
+
+
+class WindowMax:
+	"""Max and count of the values added since the last take (thread safe)"""
+	def __init__(self):
+		self._lock = threading.Lock()
+		self.max = 0.0
+		self.count = 0
+
+	def add(self, value):
+		with self._lock:
+			self.count += 1
+			if value > self.max:
+				self.max = value
+
+	def take(self):
+		with self._lock:
+			window = (self.max, self.count)
+			self.max = 0.0
+			self.count = 0
+		return window
+
+
+class Watchdog:
+	"""
+	Measure the timing of the manager and check it every window (see start). alert(status) is called with the
+	status (dict) of every window with an alert and when the degraded mode is left, degrade(bool) when the
+	degraded mode is entered or left, on_window(status) at the end of every window. wait_active() blocks
+	while there is nothing to watch (e.g. Pixels.wait_active), loop is the asyncio loop probed.
+	"""
+	def __init__(self, alert=None, degrade=None, window=DEFAULT_WATCHDOG_WINDOW, loop_lag=DEFAULT_LOOP_LAG,
+				 frame_late=DEFAULT_FRAME_LATE, queue_wait=DEFAULT_QUEUE_WAIT, clock=None, on_window=None,
+				 wait_active=None):
+		self.alert = alert
+		self.degrade = degrade
+		self.on_window = on_window
+		self.wait_active = wait_active
+		self.loop = None
+		self.window = window
+		self.thresholds = {'loop_lag': loop_lag, 'frame_late': frame_late, 'queue_wait': queue_wait}
+		self.clock = clock if clock is not None else DEFAULT_CLOCK
+		self.measures = {name: WindowMax() for name in MEASURES}
+		self.degraded = False
+		self.alerts = 0
+		self._ok_windows = 0
+		self._thread = None
+
+	def frame_late(self, seconds):
+		self.measures['frame_late'].add(seconds)
+
+	def queue_wait(self, seconds):
+		self.measures['queue_wait'].add(seconds)
+
+	def loop_lag(self, seconds):
+		self.measures['loop_lag'].add(seconds)
+
+	def probe_loop(self):
+		"""Measure how late the asyncio loop runs a callback posted now"""
+		loop = self.loop
+		if loop is None or loop.is_closed():
+			return
+		t_probe = time.monotonic()
+		try:
+			loop.call_soon_threadsafe(lambda: self.loop_lag(time.monotonic() - t_probe))
+		except RuntimeError:
+			# closed in between
+			pass
+
+	def start(self):
+		if self._thread is None:
+			self._thread = threading.Thread(target=self._check_loop, name="led-watchdog", daemon=True)
+			self._thread.start()
+
+	def _check_loop(self):
+		probes = max(1, int(round(self.window/LOOP_PROBE_INTERVAL)))
+		while True:
+			if self.wait_active is not None:
+				self.wait_active()
+			for _ in range(probes):
+				self.probe_loop()
+				self.clock.sleep(self.window/probes)
+			self.check()
+
+	def check(self):
+		"""Check the window that ends, alert and degrade (or restore), return the status of the window"""
+		window = {name: measure.take() for name, measure in self.measures.items()}
+		exceeded = [name for name, (value, count) in window.items() if count and value > self.thresholds[name]]
+		status = {name: round(1000*value, 1) for name, (value, _) in window.items()}
+		status['exceeded'] = exceeded
+		notify = bool(exceeded)
+		if exceeded:
+			self.alerts += 1
+			self._ok_windows = 0
+			_LOGGER.warning("Watchdog: " + ", ".join("{} {:.1f} ms > {:.1f} ms".format(
+				name, 1000*window[name][0], 1000*self.thresholds[name]) for name in exceeded))
+			if not self.degraded:
+				self._set_degraded(True)
+		elif self.degraded:
+			self._ok_windows += 1
+			if self._ok_windows >= RECOVER_WINDOWS:
+				_LOGGER.info("Watchdog: back in time for {} windows".format(self._ok_windows))
+				self._set_degraded(False)
+				notify = True
+		status['degraded'] = self.degraded
+		if notify and self.alert is not None:
+			self.alert(status)
+		if self.on_window is not None:
+			self.on_window(status)
+		return status
+
+	def _set_degraded(self, degraded):
+		self.degraded = degraded
+		if self.degrade is not None:
+			self.degrade(degraded)
@@ -1 +1,19 @@
 #!/usr/bin/env bash
+set -e
+
+# Directory of *this* script
+this_dir="$( cd "$( dirname "$0" )" && pwd )"
+src_dir="$(realpath "${this_dir}/..")"
+
+venv="${src_dir}/.venv"
+if [[ -d "${venv}" ]]; then
+    echo "Using virtual environment at ${venv}"
+    source "${venv}/bin/activate"
+fi
+
+export PYTHONPATH="${src_dir}:${PYTHONPATH}"
+
+# -----------------------------------------------------------------------------
+
+# UPDATE_GOLDEN=1 rewrites the golden frames (tests/golden), --benchmark-skip skips the micro-benchmarks
+python3 -m pytest "${src_dir}/tests" "$@"
@@ -31,7 +31,8 @@ setuptools.setup(
     install_requires=requirements,
     entry_points={
         "console_scripts": [
-            "rhasspy-lisa-led-manager = rhasspylisa_ledmanager.__main__:main"
+            "rhasspy-lisa-led-manager = rhasspylisa_ledmanager.__main__:main",
+            "lisa-loadgen = rhasspylisa_ledmanager.loadgen:main",
         ]
     },
     classifiers=[
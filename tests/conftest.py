@@ -0,0 +1,69 @@
+"""Shared fixtures: virtual clock, recording led backend and golden frame sequences"""
+import json
+import os
+from pathlib import Path
+
+import numpy
+import pytest
+
+from rhasspylisa_ledmanager.clock import VirtualClock
+from rhasspylisa_ledmanager.geometry import LedGeometry
+from rhasspylisa_ledmanager.pixels import Pixels
+from rhasspylisa_ledmanager.led_patterns.google_home_led_pattern import GoogleHomeLedPattern
+from rhasspylisa_ledmanager.led_patterns.alexa_led_pattern import AlexaLedPattern
+
+GOLDEN_DIR = Path(__file__).parent / "golden"
+PATTERNS = {"GoogleHome": GoogleHomeLedPattern, "Alexa": AlexaLedPattern}
+
+
+class StoppingClock(VirtualClock):
+	"""The virtual clock of the patterns, their animation loops are stopped once the clock reaches stop_at"""
+	def __init__(self, stop_at=None):
+		super().__init__()
+		self.stop_at = stop_at
+		self.pattern = None
+
+	def sleep(self, seconds):
+		super().sleep(seconds)
+		if self.pattern is not None and self.stop_at is not None and self.now >= self.stop_at:
+			self.pattern.stop = True
+
+
+class RecordingBoard(Pixels):
+	"""A 12 leds board (the Respeaker 4 mic array layout) recording every frame written on the hw"""
+
+	geometry = LedGeometry.ring(12, offset=105.0)
+
+	def __init__(self, pattern, clock=None, record=True):
+		self.record = record
+		self.frames = []
+		self._leds = numpy.zeros((self.geometry.n_leds, 3), dtype=int)
+		super().__init__(pattern=pattern, geometry=self.geometry, clock=clock)
+
+	def set_led(self, i, r, g, b):
+		self._leds[i] = (r, g, b)
+
+	def update_leds(self):
+		if self.record:
+			self.frames.append([round(self.clock.monotonic(), 6), self._leds.ravel().tolist()])
+
+
+@pytest.fixture
+def clock():
+	return StoppingClock()
+
+
+@pytest.fixture
+def golden():
+	"""Compare a frame sequence with its golden file, UPDATE_GOLDEN=1 (re)writes the golden files"""
+	def check(name, frames):
+		path = GOLDEN_DIR / (name + ".json")
+		if os.environ.get("UPDATE_GOLDEN"):
+			GOLDEN_DIR.mkdir(exist_ok=True)
+			path.write_text("[\n" + ",\n".join(json.dumps(frame) for frame in frames) + "\n]\n")
+		assert path.is_file(), "No golden frames for {}, run with UPDATE_GOLDEN=1".format(name)
+		expected = json.loads(path.read_text())
+		assert len(frames) == len(expected), "{}: {} frames, {} expected".format(name, len(frames), len(expected))
+		for n, (frame, expected_frame) in enumerate(zip(frames, expected)):
+			assert frame == expected_frame, "{}: frame {} differs".format(name, n)
+	return check
@@ -0,0 +1,108 @@
+"""Micro-benchmarks of the hot functions (pytest-benchmark), run with the tests or skipped with --benchmark-skip"""
+import io
+import json
+import wave
+
+import numpy
+import pytest
+
+from conftest import PATTERNS, RecordingBoard
+from rhasspylisa_ledmanager.audio_envelope import rms_envelope
+from rhasspylisa_ledmanager.colormaps import Colormap
+from rhasspylisa_ledmanager.energy_DOAs import localized_sources, tracked_sources, AzimuthGrid
+from rhasspylisa_ledmanager.lisa_decoder import decode_ssl, encode_binary
+
+pytest.importorskip("pytest_benchmark")
+
+
+@pytest.fixture
+def board():
+	return RecordingBoard(PATTERNS["GoogleHome"], record=False)
+
+
+@pytest.fixture
+def sources():
+	rng = numpy.random.default_rng(0)
+	xyz = rng.normal(size=(10, 3))
+	xyz /= numpy.linalg.norm(xyz, axis=1)[:, None]
+	return numpy.column_stack([xyz, rng.uniform(0.0, 1.0, 10)])
+
+
+def test_show_persist(benchmark, board):
+	frames = [numpy.full(4*board.pixels_number, float(n)) for n in range(2)]
+	counter = iter(range(10**9))
+	benchmark(lambda: board.show(frames[next(counter) % 2]))
+
+
+def test_show_overlay(benchmark, board):
+	board.show(numpy.full(4*board.pixels_number, 10.0))
+	overlays = [numpy.full(4*board.pixels_number, float(n)) for n in range(2)]
+	counter = iter(range(10**9))
+	benchmark(lambda: board.show(overlays[next(counter) % 2], persist_data=False, adding_policy="add"))
+
+
+def test_set_all(benchmark, board):
+	rng = numpy.random.default_rng(0)
+	spots = [rng.integers(0, 255, (36, 3)) for _ in range(2)]
+	counter = iter(range(10**9))
+	benchmark(lambda: board.set_all(spots[next(counter) % 2], persist_data=False, adding_policy="max"))
+
+
+def test_map_spots(benchmark, board):
+	rgb = numpy.random.default_rng(0).uniform(0.0, 1.0, (36, 3))
+	benchmark(board.geometry.map_spots, rgb)
+
+
+def test_speak_level(benchmark, board):
+	levels = iter(numpy.tile(numpy.linspace(0.0, 1.0, 50), 10**6))
+	benchmark(lambda: board.pattern.speak_level(next(levels)))
+
+
+def test_localized_update_batch(benchmark, sources):
+	energies = localized_sources()
+	benchmark(energies.update_batch, sources)
+
+
+def test_localized_update_batch_grid(benchmark, sources):
+	energies = localized_sources(azimuth_grid=AzimuthGrid())
+	benchmark(energies.update_batch, sources)
+
+
+@pytest.mark.parametrize("name", ["red", "viridis", "elevation"])
+def test_colormap(benchmark, sources, name):
+	energies = localized_sources()
+	energies.update_batch(sources)
+	benchmark(Colormap(name), energies)
+
+
+def test_dominant_azimuth(benchmark, sources):
+	energies = localized_sources()
+	for _ in range(30):
+		energies.update_batch(sources)
+	benchmark(energies.dominant_azimuth)
+
+
+def test_tracked_update_batch(benchmark, sources):
+	energies = tracked_sources()
+	benchmark(energies.update_batch, sources[:3], numpy.arange(3))
+
+
+def test_decode_ssl_binary(benchmark, sources):
+	benchmark(decode_ssl, encode_binary(sources))
+
+
+def test_decode_ssl_json(benchmark, sources):
+	payload = json.dumps({"sources": [dict(zip(("x", "y", "z", "E"), source)) for source in sources.tolist()]}).encode()
+	benchmark(decode_ssl, payload)
+
+
+def test_rms_envelope(benchmark):
+	buffer = io.BytesIO()
+	with wave.open(buffer, "wb") as wav_file:
+		wav_file.setnchannels(1)
+		wav_file.setsampwidth(2)
+		wav_file.setframerate(16000)
+		samples = (8000*numpy.sin(numpy.arange(16000)*0.05)).astype(numpy.int16)
+		wav_file.writeframes(samples.tobytes())
+	wav_bytes = buffer.getvalue()
+	benchmark(lambda: list(rms_envelope(wav_bytes)))
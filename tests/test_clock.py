@@ -0,0 +1,65 @@
+"""The clocks, and the timing of the energy sources and of the led state machine on the virtual clock"""
+import time
+
+import numpy
+
+from conftest import PATTERNS, RecordingBoard
+from rhasspylisa_ledmanager.clock import AcceleratedClock, VirtualClock
+from rhasspylisa_ledmanager.energy_DOAs import localized_sources, tracked_sources
+from rhasspylisa_ledmanager.led_state import LedStateMachine, IDLE, WAKE
+
+
+def test_virtual_clock():
+	clock = VirtualClock(start=10.0)
+	clock.sleep(0.5)
+	clock.sleep(-1.0)
+	assert clock.monotonic() == 10.5
+	fired = []
+	timer = clock.timer(60.0, lambda: fired.append(clock.monotonic()))
+	timer.start()
+	timer.join(1.0)
+	assert fired == [10.5]
+
+
+def test_accelerated_clock():
+	clock = AcceleratedClock(100.0)
+	t_real = time.monotonic()
+	t_clock = clock.monotonic()
+	clock.sleep(2.0)
+	real = time.monotonic() - t_real
+	assert 0.02 <= real < 0.5
+	assert clock.monotonic() - t_clock >= 2.0
+
+
+def test_track_timeout():
+	clock = VirtualClock()
+	energies = tracked_sources(clock=clock, track_timeout=1.0)
+	energies.update_batch(numpy.array([[1.0, 0.0, 0.0, 0.8]]), numpy.array([7]))
+	assert energies.track_active.sum() == 1
+	clock.sleep(0.5)
+	energies.update_batch(numpy.zeros((0, 4)))
+	assert energies.track_active.sum() == 1
+	clock.sleep(0.6)
+	energies.update_batch(numpy.zeros((0, 4)))
+	assert energies.track_active.sum() == 0
+
+
+def test_dominant_azimuth_window():
+	clock = VirtualClock()
+	energies = localized_sources(clock=clock)
+	energies.update_batch(numpy.array([[0.0, 1.0, 0.0, 1.0]]))
+	assert energies.dominant_azimuth(window=1.0) is not None
+	clock.sleep(2.0)
+	assert energies.dominant_azimuth(window=1.0) is None
+
+
+def test_hotword_holdoff(clock):
+	board = RecordingBoard(PATTERNS["GoogleHome"], clock, record=False)
+	state = LedStateMachine(board, hotword_holdoff=1.0, clock=clock)
+	assert state.transition(WAKE)
+	assert state.transition(IDLE)
+	clock.advance(0.5)
+	assert not state.transition(WAKE)
+	clock.advance(0.6)
+	assert state.transition(WAKE)
+	board.close()
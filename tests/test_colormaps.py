@@ -0,0 +1,57 @@
+"""Colormap tables of the overlays and the colormap of a site"""
+import numpy
+import pytest
+
+from rhasspylisa_ledmanager.colormaps import Colormap, COLORMAPS, COLORMAP_SIZE, select_colormap
+from rhasspylisa_ledmanager.energy_DOAs import localized_sources
+from rhasspylisa_ledmanager.pixels import LED_MAX_VAL
+
+
+@pytest.fixture
+def energies():
+	rng = numpy.random.default_rng(0)
+	xyz = rng.normal(size=(20, 3))
+	xyz /= numpy.linalg.norm(xyz, axis=1)[:, None]
+	energies = localized_sources()
+	energies.update_batch(numpy.column_stack([xyz, rng.uniform(0.0, 0.3, 20)]))
+	return energies
+
+
+def test_tables():
+	for name in COLORMAPS:
+		colormap = Colormap(name)
+		assert colormap.table.shape == (COLORMAP_SIZE, 3) and colormap.table.dtype == numpy.float32
+		if not colormap.by_elevation:
+			# no energy, no light
+			assert not colormap.table[0].any()
+	with pytest.raises(ValueError):
+		Colormap('rainbow')
+
+
+def test_red_as_before(energies):
+	energies.energy_plane_xy = numpy.clip(energies.energy_plane_xy, 0.0, 1.0)
+	before = numpy.zeros((energies.n_spots, 3))
+	before[:, 0] = LED_MAX_VAL*energies.energy_plane_xy
+	# the fractional part is kept (8.8 fixed point output, dithering)
+	numpy.testing.assert_allclose(Colormap('red')(energies), before, atol=1e-4)
+
+
+def test_elevation(energies):
+	colormap = Colormap('elevation')
+	energies.level = numpy.full(energies.n_spots, 1.0)
+	for z, channel in ((-1.0, 2), (0.0, 1), (1.0, 0)):
+		energies.energy_axis_z = numpy.full(energies.n_spots, z)
+		rgb = colormap(energies)
+		assert (rgb.argmax(axis=1) == channel).all()
+	energies.level = numpy.zeros(energies.n_spots)
+	assert not colormap(energies).any()
+
+
+def test_select_colormap():
+	specs = ['viridis', 'kitchen:heat', 'hall:elevation']
+	assert select_colormap(specs, 'kitchen') == 'heat'
+	assert select_colormap(specs, 'default') == 'viridis'
+	assert select_colormap(None, 'kitchen') == 'red'
+	assert select_colormap(['kitchen:tracks'], 'kitchen', default='tracks') == 'tracks'
+	with pytest.raises(ValueError):
+		select_colormap(['kitchen:rainbow'], 'kitchen')
@@ -0,0 +1,80 @@
+"""Golden frames of Pixels.show and Pixels.set_all, for every adding policy"""
+import numpy
+import pytest
+
+from conftest import PATTERNS, RecordingBoard
+
+POLICIES = ("add", "sub", "max", "min")
+N_SPOTS = 36
+
+
+@pytest.fixture
+def board(clock):
+	return RecordingBoard(PATTERNS["GoogleHome"], clock)
+
+
+def persisted_frame(n_leds, seed=0):
+	rng = numpy.random.default_rng(seed)
+	frame = rng.integers(0, 128, 4*n_leds).astype(float)
+	frame[::4] = 0
+	return frame
+
+
+def spots(seed=1):
+	rng = numpy.random.default_rng(seed)
+	return rng.integers(0, 160, (N_SPOTS, 3))
+
+
+@pytest.mark.parametrize("policy", POLICIES)
+def test_show_policy(board, golden, policy):
+	board.show(persisted_frame(board.pixels_number))
+	overlay = persisted_frame(board.pixels_number, seed=2)
+	board.show(overlay, persist_data=False, adding_policy=policy)
+	golden("show_" + policy, board.frames)
+
+
+@pytest.mark.parametrize("policy", POLICIES)
+def test_set_all_policy(board, golden, policy):
+	board.show(persisted_frame(board.pixels_number))
+	board.set_all(spots(), persist_data=False, adding_policy=policy)
+	# an overlay is composed on the persisted frame, not on the previous overlay
+	board.set_all(spots(seed=3), persist_data=False, adding_policy=policy)
+	golden("set_all_" + policy, board.frames)
+
+
+def test_set_all_persist(board, golden):
+	board.set_all(spots(), persist_data=True)
+	board.set_all(spots(seed=3), persist_data=False, adding_policy="add")
+	golden("set_all_persist", board.frames)
+
+
+def test_policies_semantics(board):
+	persisted = persisted_frame(board.pixels_number)
+	overlay = persisted_frame(board.pixels_number, seed=2)
+	expected = {
+		"add": persisted + overlay,
+		"sub": persisted - overlay,
+		"max": numpy.maximum(persisted, overlay),
+		"min": numpy.minimum(persisted, overlay),
+	}
+	for policy in POLICIES:
+		board.show(persisted)
+		board.show(overlay, persist_data=False, adding_policy=policy)
+		leds = numpy.clip(expected[policy], 0, 255).reshape(-1, 4)[:, 1:].astype(int).ravel().tolist()
+		assert board.frames[-1][1] == leds, policy
+
+
+def test_unchanged_frame_not_written(board):
+	frame = persisted_frame(board.pixels_number)
+	board.show(frame)
+	board.show(frame)
+	board.set_all(numpy.zeros((N_SPOTS, 3), dtype=int), persist_data=False, adding_policy="add")
+	assert len(board.frames) == 1
+
+
+def test_float_overlay_keeps_fraction(board):
+	board.show(numpy.zeros(4*board.pixels_number))
+	board.set_all(numpy.full((N_SPOTS, 3), 10.5), persist_data=False, adding_policy="add")
+	# 8.8 fixed point: the half is kept for the dithering (written as 10 without it)
+	assert (board._frame.reshape(-1, 4)[:, 1:] == int(10.5*256)).all()
+	assert board.frames[-1][1] == [10]*3*board.pixels_number
@@ -0,0 +1,85 @@
+"""The batch geometry kernel of energy_DOAs against the scalar functions, and the bounds of the azimuth grid"""
+import numpy
+import pytest
+
+from rhasspylisa_ledmanager.energy_DOAs import localized_sources, AzimuthGrid, calc_sources, calc_angles, \
+	calc_energies, calc_spot_index, DEFAULT_RING_RESOLUTION
+
+
+def unit_sources(n, seed=0):
+	rng = numpy.random.default_rng(seed)
+	xyz = rng.normal(size=(n, 3))
+	xyz /= numpy.linalg.norm(xyz, axis=1)[:, None]
+	return numpy.column_stack([xyz, rng.uniform(0.0, 1.0, n)])
+
+
+def test_calc_sources_scalar():
+	sources = unit_sources(2000)
+	azimuth, ring_i, E_xy, E_z = calc_sources(sources, DEFAULT_RING_RESOLUTION)
+	for (x, y, z, e), *batch in zip(sources, azimuth, ring_i, E_xy, E_z):
+		r, elev, az = calc_angles(x, y, z)
+		expected = (az + numpy.pi, int(calc_spot_index(az + numpy.pi, DEFAULT_RING_RESOLUTION)) % DEFAULT_RING_RESOLUTION,
+					*calc_energies(e, elev, az))
+		assert batch[1] == expected[1]
+		assert batch[0::2] == pytest.approx(expected[0::2], abs=1e-12)
+		assert batch[3] == pytest.approx(expected[3], abs=1e-12)
+
+
+def test_calc_sources_origin():
+	azimuth, ring_i, E_xy, E_z = calc_sources(numpy.array([[0.0, 0.0, 0.0, 0.5]]), DEFAULT_RING_RESOLUTION)
+	assert (E_xy[0], E_z[0]) == (0.5, 0.0)
+
+
+def test_grid_bounds():
+	grid = AzimuthGrid()
+	sources = unit_sources(20000, seed=1)
+	rho = numpy.hypot(sources[:, 0], sources[:, 1])
+	sources = sources[rho >= 0.2]
+	rho = rho[rho >= 0.2]
+	exact, ring_exact, _, _ = calc_sources(sources, DEFAULT_RING_RESOLUTION)
+	ring_grid = grid.lookup(sources)
+	off = numpy.abs(ring_grid - ring_exact)
+	off = numpy.minimum(off, DEFAULT_RING_RESOLUTION - off)
+	assert off.max() <= 1
+	# the true azimuth is within max_error of the ring position looked up
+	step = 2.0*numpy.pi/DEFAULT_RING_RESOLUTION
+	low = ring_grid*step - grid.max_error(rho)
+	high = (ring_grid + 1)*step + grid.max_error(rho)
+	wrapped = (exact - low) % (2.0*numpy.pi)
+	assert (wrapped <= high - low + 1e-12).all()
+
+
+def test_update_batch_sequential():
+	batch, sequential = localized_sources(), localized_sources()
+	rng = numpy.random.default_rng(2)
+	for n in rng.integers(0, 12, 50):
+		sources = unit_sources(n, seed=int(n))
+		batch.update_batch(sources)
+		for x, y, z, e in sources:
+			sequential._add_source(e, x, y, z)
+	numpy.testing.assert_allclose(batch.energies, sequential.energies, atol=1e-12)
+	numpy.testing.assert_allclose(batch.history_azimuth, sequential.history_azimuth, atol=1e-12)
+	assert batch.dominant_azimuth() == pytest.approx(sequential.dominant_azimuth())
+
+
+def test_grid_resolution_mismatch():
+	with pytest.raises(ValueError):
+		localized_sources(azimuth_grid=AzimuthGrid(ring_resolution=360))
+
+
+def test_spot_decimation():
+	full, coarse = localized_sources(), localized_sources()
+	coarse.set_spot_decimation(3)
+	assert coarse.energy_plane_xy.shape == (full.n_spots//3,)
+	# a source on the coarse kernels is the max of its merged spots
+	for source in unit_sources(20):
+		full.clear()
+		coarse.clear()
+		full.update_batch(source)
+		coarse.update_batch(source)
+		numpy.testing.assert_allclose(coarse.energy_plane_xy, full.energy_plane_xy.reshape(-1, 3).max(axis=1), atol=1e-12)
+	# back to full resolution: the merged spots are expanded
+	coarse.set_spot_decimation(1)
+	numpy.testing.assert_allclose(coarse.energy_plane_xy, numpy.repeat(full.energy_plane_xy.reshape(-1, 3).max(axis=1), 3))
+	with pytest.raises(ValueError):
+		coarse.set_spot_decimation(7)
@@ -0,0 +1,73 @@
+"""The led geometry: angle -> led lookup tables and the spot -> led maps"""
+import numpy
+import pytest
+
+from rhasspylisa_ledmanager.geometry import LedGeometry, LedRing, DEFAULT_LUT_RESOLUTION
+
+
+def test_lut_wrap():
+	geometry = LedGeometry.ring(12)
+	assert geometry.lut.shape == (1, DEFAULT_LUT_RESOLUTION)
+	# led 0 is at 0 deg: both sides of the wrap are on it
+	for direction in (0.0, 0.05, 359.9, 359.95, 360.0, -0.1, 720.0):
+		assert geometry.led_for_direction(direction) == 0, direction
+	# half way between two leds, on either side
+	assert geometry.led_for_direction(14.9) == 0
+	assert geometry.led_for_direction(15.1) == 1
+	assert geometry.led_for_direction(345.1) == 0
+	assert geometry.led_for_direction(344.9) == 11
+	assert geometry.led_for_azimuth(numpy.deg2rad(90.0)) == 3
+
+
+def test_lut_matches_nearest():
+	geometry = LedGeometry.ring(10, offset=18.0)
+	directions = (numpy.arange(DEFAULT_LUT_RESOLUTION) + 0.5)*360.0/DEFAULT_LUT_RESOLUTION
+	dist = numpy.abs(directions[:, None] - geometry.led_angles[None, :]) % 360.0
+	expected = numpy.minimum(dist, 360.0 - dist).argmin(axis=1)
+	assert [geometry.led_for_direction(d) for d in directions] == expected.tolist()
+
+
+def shifted_mapping(rgb, n_leds, shift):
+	"""The former Pixels.set_all: each led the max of its share of the spots, rolled by shift leds"""
+	bounds = numpy.array([int(n*len(rgb)/n_leds) for n in range(n_leds)])
+	return numpy.roll(numpy.maximum.reduceat(rgb, bounds, axis=0), shift, axis=0)
+
+
+@pytest.mark.parametrize("n_spots", (12, 36, 72))
+def test_respeaker_as_shifted(n_spots):
+	geometry = LedGeometry.ring(12, offset=105.0)
+	rgb = numpy.random.default_rng(n_spots).integers(0, 256, (n_spots, 3))
+	numpy.testing.assert_array_equal(geometry.map_spots(rgb), shifted_mapping(rgb, 12, -3))
+
+
+def test_two_rings():
+	geometry = LedGeometry([LedRing(12), LedRing(6, offset=30.0)])
+	assert geometry.n_leds == 18
+	assert geometry.ring_of_led.tolist() == [0]*12 + [1]*6
+	# the leds of the second ring are numbered after the first one
+	assert geometry.led_for_direction(90.0, ring_i=0) == 3
+	assert geometry.led_for_direction(90.0, ring_i=1) == 12 + 1
+	# a spot is drawn on its closest led of every ring
+	rgb = numpy.zeros((36, 3), dtype=int)
+	rgb[3] = (255, 0, 0) # 35 deg
+	leds = geometry.map_spots(rgb)
+	assert numpy.nonzero(leds[:, 0])[0].tolist() == [1, 12]
+
+
+def test_reversed_winding():
+	clockwise = LedGeometry.ring(12, offset=0.0, winding=-1)
+	assert clockwise.led_angles.tolist() == [0.0] + [360.0 - 30.0*n for n in range(1, 12)]
+	assert clockwise.led_for_direction(30.0) == 11
+	assert clockwise.led_for_direction(330.0) == 1
+	# the spots run the other way round
+	rgb = numpy.arange(12)[:, None]*numpy.ones(3, dtype=int)
+	counterclockwise = LedGeometry.ring(12, offset=0.0)
+	numpy.testing.assert_array_equal(clockwise.map_spots(rgb)[1:], counterclockwise.map_spots(rgb)[1:][::-1])
+
+
+def test_more_leds_than_spots():
+	geometry = LedGeometry.ring(12)
+	rgb = numpy.arange(1, 5)[:, None]*numpy.ones(3, dtype=int)
+	leds = geometry.map_spots(rgb)
+	# every led shows a spot, the one it is in
+	assert leds[:, 0].tolist() == [1, 1, 1, 2, 2, 2, 3, 3, 3, 4, 4, 4]
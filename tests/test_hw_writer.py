@@ -0,0 +1,91 @@
+"""The frame ring of the led writer process (seqlock, lapped slots) and the writer board itself"""
+import time
+
+import numpy
+import pytest
+
+from rhasspylisa_ledmanager import hw_writer
+from rhasspylisa_ledmanager.hw_writer import FrameRing
+
+pytestmark = pytest.mark.skipif(hw_writer.shared_memory is None, reason="no multiprocessing.shared_memory")
+
+N_LEDS = 12
+SLOTS = 4
+
+
+@pytest.fixture
+def rings():
+	producer = FrameRing(N_LEDS, SLOTS)
+	consumer = FrameRing(N_LEDS, SLOTS, name=producer.name)
+	yield producer, consumer
+	consumer.close()
+	producer.close()
+
+
+def publish(producer, value):
+	producer.frame[:] = value
+	producer.publish()
+
+
+def test_publish_latest(rings):
+	producer, consumer = rings
+	assert consumer.latest(0) == (0, None)
+	publish(producer, 7)
+	seq, frame = consumer.latest(0)
+	assert seq == 1 and consumer.valid(seq)
+	assert (frame == 7).all()
+	# nothing newer
+	assert consumer.latest(seq) == (seq, None)
+	# only the last published frame is read, the skipped ones are not queued
+	publish(producer, 8)
+	publish(producer, 9)
+	seq, frame = consumer.latest(seq)
+	assert seq == 3 and (frame == 9).all() and consumer.valid(seq)
+
+
+def test_lapped_slot_dropped(rings):
+	producer, consumer = rings
+	publish(producer, 1)
+	seq, frame = consumer.latest(0)
+	# the producer laps the consumer while it reads: the slot holds another frame now
+	for value in range(2, SLOTS + 2):
+		publish(producer, value)
+	assert not consumer.valid(seq)
+	# the slot being written (odd) is not valid either
+	assert not consumer.valid(int(producer.ring['head']) + 1)
+
+
+def test_close_unlinks():
+	producer = FrameRing(N_LEDS, SLOTS)
+	name = producer.name
+	producer.close()
+	assert producer.ring is None and producer.frame is None
+	with pytest.raises(FileNotFoundError):
+		FrameRing(N_LEDS, SLOTS, name=name)
+
+
+def wait_for(condition, timeout=10.0):
+	deadline = time.monotonic() + timeout
+	while not condition():
+		if time.monotonic() > deadline:
+			return False
+		time.sleep(0.01)
+	return True
+
+
+def test_writer_board():
+	from rhasspylisa_ledmanager.hw_writer import HwWriterBoard
+	from rhasspylisa_ledmanager.led_patterns.google_home_led_pattern import GoogleHomeLedPattern
+
+	board = HwWriterBoard(pattern=GoogleHomeLedPattern, hw_board="DummyBoard", fps=200.0)
+	try:
+		assert board._process.is_alive()
+		assert board.pixels_number == 10 # the geometry of the DummyBoard, sent by the writer
+		assert board.frames_written == 0
+		board.think()
+		# the pattern frames are handed over and output by the writer process
+		assert wait_for(lambda: board.frames_written > 0)
+	finally:
+		board.close()
+	assert not board._process.is_alive()
+	assert board.frames_written == 0
@@ -0,0 +1,58 @@
+"""Rate limiting of the localization topics on the virtual clock"""
+import pytest
+
+from rhasspylisa_ledmanager.clock import VirtualClock
+from rhasspylisa_ledmanager.ingress import IngressLimiter
+
+TOPIC = ("kitchen", "lisa/ssl/source") # (site id, topic) key
+
+
+def limiter(strategy):
+	return IngressLimiter([TOPIC[1]], rate=10.0, burst=2, strategy=strategy, clock=VirtualClock())
+
+
+def test_drop():
+	ingress = limiter('drop')
+	delivered = [ingress.offer(TOPIC, n)[0] for n in range(5)]
+	assert delivered == [0, 1, None, None, None]
+	ingress.clock.advance(0.1)
+	assert ingress.offer(TOPIC, 5) == (5, None)
+	assert ingress.offer(TOPIC, 6) == (None, None)
+	assert (ingress.received[TOPIC], ingress.delivered[TOPIC], ingress.dropped[TOPIC]) == (7, 3, 4)
+
+
+def test_merge_latest_wins():
+	ingress = limiter('merge')
+	assert ingress.offer(TOPIC, 0) == (0, None)
+	assert ingress.offer(TOPIC, 1) == (1, None)
+	message, wait = ingress.offer(TOPIC, 2)
+	assert message is None and wait == pytest.approx(0.1)
+	# the messages received while one waits replace it, without a new flush
+	assert ingress.offer(TOPIC, 3) == (None, None)
+	assert ingress.offer(TOPIC, 4) == (None, None)
+	assert ingress.flush(TOPIC)[0] is None
+	ingress.clock.advance(0.1)
+	assert ingress.flush(TOPIC) == (4, None)
+	assert ingress.flush(TOPIC) == (None, None)
+	assert (ingress.delivered[TOPIC], ingress.dropped[TOPIC]) == (3, 2)
+
+
+def test_merge_superseded_by_newer():
+	ingress = limiter('merge')
+	for n in range(3):
+		ingress.offer(TOPIC, n)
+	ingress.clock.advance(0.1)
+	# a newer message takes the token, the waiting one is merged in it
+	assert ingress.offer(TOPIC, 3) == (3, None)
+	assert ingress.flush(TOPIC) == (None, None)
+	assert ingress.dropped[TOPIC] == 1
+
+
+def test_sites_have_their_own_bucket():
+	ingress = limiter('drop')
+	hall = ("hall", TOPIC[1])
+	flood = [ingress.offer(TOPIC, n)[0] for n in range(50)]
+	assert flood.count(None) == 48
+	assert [ingress.offer(hall, n)[0] for n in range(2)] == [0, 1]
+	assert ingress.keys() == [hall, TOPIC]
+	assert "dropped 48" in ingress.stats(TOPIC) and "dropped 0" in ingress.stats(hall)
@@ -0,0 +1,166 @@
+"""The led transitions: the pattern runner, and the dialogue states driven by the Hermes events"""
+import io
+import threading
+import wave
+
+import pytest
+
+from conftest import PATTERNS, RecordingBoard
+from rhasspylisa_ledmanager.audio_envelope import rms_envelope
+from rhasspylisa_ledmanager.led_state import LedStateMachine, TRANSITIONS, DEFAULT_HOTWORD_HOLDOFF, IDLE, WAKE, LISTENING, THINKING, RESULT, SPEAKING
+
+
+def make_wav(frames=1600):
+	with io.BytesIO() as buffer:
+		with wave.open(buffer, "wb") as wav:
+			wav.setnchannels(1)
+			wav.setsampwidth(2)
+			wav.setframerate(16000)
+			wav.writeframes(b"\x00\x10"*frames)
+		return buffer.getvalue()
+
+
+class CallRecorder:
+	"""Pixels stand-in recording the visuals asked by the state machine"""
+	def __init__(self):
+		self.calls = []
+
+	def __getattr__(self, name):
+		return lambda *args, **kwargs: self.calls.append(name)
+
+
+def test_runner_survives_a_failing_transition(clock):
+	board = RecordingBoard(PATTERNS["GoogleHome"], clock)
+	failed = threading.Event()
+	done = threading.Event()
+
+	def fail():
+		failed.set()
+		# e.g. an envelope of a truncated WAV
+		list(rms_envelope(b"RIFF\x00\x00\x00\x00WAVE"))
+
+	board.put(fail)
+	assert failed.wait(5.0)
+	board.put(done.set)
+	assert done.wait(5.0)
+	assert board.thread.is_alive()
+	board.close()
+
+
+def test_feedback_sounds_keep_the_dialogue_state():
+	paho = pytest.importorskip("paho.mqtt.client")
+	from rhasspyhermes.asr import AsrTextCaptured
+	from rhasspyhermes.audioserver import AudioPlayBytes, AudioPlayFinished
+	from rhasspyhermes.dialogue import DialogueSessionStarted
+	from rhasspyhermes.nlu import NluIntent, Intent
+	from rhasspyhermes.tts import TtsSay
+	from rhasspylisa_ledmanager import LedManagerHermesMqtt
+
+	hermes = LedManagerHermesMqtt(paho.Client(), hw_led="DummyBoard", speak_envelope=True, watchdog=False,
+								  adaptive_quality=False)
+	state = hermes.led_state
+	wav = make_wav()
+
+	def play(request_id):
+		hermes.on_play_bytes(AudioPlayBytes(wav_bytes=wav), request_id=request_id)
+
+	try:
+		hermes.wakeup()
+		hermes.on_session_started(DialogueSessionStarted(session_id="s1"))
+		hermes.start_listening_intent("s1")
+		hermes.on_text_captured(AsrTextCaptured(text="turn on the light", likelihood=1.0, seconds=1.0, session_id="s1"))
+		assert state.state == THINKING
+		# the recorded beep, then its end
+		play("beep")
+		assert state.state == THINKING
+		hermes.on_play_finished(AudioPlayFinished(id="beep"))
+		assert state.state == THINKING
+		hermes.on_intent(NluIntent(input="turn on the light", intent=Intent(intent_name="Light", confidence_score=1.0),
+								   session_id="s1"))
+		assert state.state == RESULT
+		# the TTS answer is spoken until its audio is played
+		hermes.on_say(TtsSay(text="done", id="say1", session_id="s1"))
+		play("say1")
+		assert state.state == SPEAKING
+		hermes.on_play_finished(AudioPlayFinished(id="say1"))
+		assert state.state == IDLE
+	finally:
+		hermes.pixels.close()
+
+
+def test_queued_transition_keeps_its_pattern(clock):
+	board = RecordingBoard(PATTERNS["GoogleHome"], clock)
+	old = board.pattern
+	woken = {}
+	running, release = threading.Event(), threading.Event()
+
+	def blocking():
+		running.set()
+		release.wait(5.0)
+
+	board.put(blocking)
+	assert running.wait(5.0)
+	# queued behind the blocking transition, then the pattern is swapped
+	board.wakeup(90)
+	new = board.make_pattern(PATTERNS["Alexa"])
+	for pattern in (old, new):
+		pattern.wakeup = lambda direction, pattern=pattern: woken.setdefault(pattern, direction)
+	old_thread = board.thread
+	board.swap_pattern(new)
+	release.set()
+	board.close()
+	old_thread.join(5.0)
+	# the old runner ends with the old pattern, it never drives the new one
+	assert woken == {old: 90}
+
+
+def test_replay_speaking_without_envelope(clock):
+	pixels = CallRecorder()
+	state = LedStateMachine(pixels, clock=clock)
+	for step in (WAKE, LISTENING, THINKING):
+		assert state.transition(step)
+	assert state.transition(SPEAKING, envelope=iter([0.5]), window=0.05)
+	# the envelope was consumed by the previous pattern: the replay speaks without it
+	state.replay()
+	assert pixels.calls[-2:] == ["speak_envelope", "speak"]
+
+
+def test_transition_table():
+	for state, allowed in TRANSITIONS.items():
+		assert WAKE in allowed, state
+		assert (IDLE in allowed) == (state != IDLE), state
+		assert set(allowed) <= set(TRANSITIONS), state
+
+
+@pytest.mark.parametrize("start", sorted(TRANSITIONS))
+def test_transitions_from(start, clock):
+	for target in TRANSITIONS:
+		pixels = CallRecorder()
+		state = LedStateMachine(pixels, clock=clock)
+		state.state = start
+		# past the holdoff of the wakeup that led here
+		clock.sleep(DEFAULT_HOTWORD_HOLDOFF)
+		applied = state.transition(target)
+		assert applied == (target in TRANSITIONS[start]), (start, target)
+		assert state.state == (target if applied else start)
+
+
+def test_hotword_holdoff(clock):
+	pixels = CallRecorder()
+	state = LedStateMachine(pixels, clock=clock)
+	assert state.transition(WAKE, direction=90)
+	# a repeated hotword within the holdoff does not restart the wakeup, past it it does
+	assert not state.transition(WAKE, direction=90)
+	clock.sleep(DEFAULT_HOTWORD_HOLDOFF)
+	assert state.transition(WAKE, direction=90)
+	assert pixels.calls == ["wakeup", "wakeup"]
+
+
+def test_stale_session(clock):
+	state = LedStateMachine(CallRecorder(), clock=clock)
+	assert state.transition(WAKE, "s1")
+	assert state.transition(LISTENING, "s1")
+	# a late event of another session is ignored, IDLE ends the session
+	assert not state.transition(THINKING, "s0")
+	assert state.transition(IDLE, "s1")
+	assert state.session_id is None
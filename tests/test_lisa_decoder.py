@@ -0,0 +1,99 @@
+"""Decoding of the localization payloads (JSON and binary) and their site"""
+import asyncio
+import json
+import time
+
+import numpy
+import pytest
+
+from rhasspylisa_ledmanager.lisa_decoder import decode_ssl, decode_sst, encode_binary, source_site, NO_ID, \
+	BINARY_SOURCE_DTYPE
+
+SSL = "lisa/ssl/source"
+SST = "lisa/sst/source"
+SOURCES = numpy.array([[1.0, 0.0, 0.0, 0.5], [0.0, -0.6, 0.8, 0.25]])
+
+
+def test_json_single_and_batch():
+	sources, ids = decode_ssl(b'{"x": 1.0, "y": 0.0, "z": 0.0, "E": 0.5}')
+	numpy.testing.assert_array_equal(sources, SOURCES[:1])
+	assert ids.tolist() == [NO_ID]
+	batch = [{"x": x, "y": y, "z": z, "activity": e, "id": i} for i, (x, y, z, e) in enumerate(SOURCES)]
+	for payload in (json.dumps(batch), json.dumps({"sources": batch, "siteId": "kitchen"})):
+		sources, ids = decode_sst(payload.encode())
+		numpy.testing.assert_array_equal(sources, SOURCES)
+		assert ids.tolist() == [0, 1]
+	sources, ids = decode_ssl(b'[]')
+	assert sources.shape == (0, 4) and not len(ids)
+
+
+def test_binary_as_json():
+	sources, ids = decode_sst(encode_binary(SOURCES, [3, 4]))
+	numpy.testing.assert_allclose(sources, SOURCES, rtol=1e-6) # float32 records
+	assert ids.tolist() == [3, 4]
+	sources, ids = decode_ssl(encode_binary(SOURCES))
+	assert ids.tolist() == [NO_ID, NO_ID]
+
+
+def test_binary_truncated():
+	payload = encode_binary(SOURCES)
+	with pytest.raises(ValueError):
+		decode_ssl(payload[:-BINARY_SOURCE_DTYPE.itemsize//2])
+	with pytest.raises(KeyError):
+		decode_ssl(b'{"x": 1.0, "y": 0.0}')
+
+
+def test_source_site():
+	topics = (SSL, SST)
+	assert source_site(SSL + "/kitchen", topics, encode_binary(SOURCES)) == (SSL, "kitchen")
+	assert source_site(SST, topics, b'{"siteId": "hall", "sources": []}') == (SST, "hall")
+	assert source_site(SSL, topics, b'{"x": 0, "y": 0, "z": 1, "E": 1}') == (SSL, None)
+	assert source_site(SSL, topics, encode_binary(SOURCES)) == (SSL, None)
+	assert source_site("lisa/ledmanager/admin/reload", topics, b'{}') == (None, None)
+	assert source_site(SSL + "/", topics, b'{}') == (None, None)
+
+
+def test_manager_drops_other_sites():
+	paho = pytest.importorskip("paho.mqtt.client")
+	from rhasspylisa_ledmanager import LedManagerHermesMqtt
+	hermes = LedManagerHermesMqtt(paho.Client(), hw_led="DummyBoard", site_ids=["kitchen"], watchdog=False,
+								  adaptive_quality=False, ingress_rate=0)
+	try:
+		for topic, payload, lit in ((SSL + "/hall", encode_binary(SOURCES), False),
+									(SSL, b'{"siteId": "hall", "x": 1, "y": 0, "z": 0, "E": 1}', False),
+									(SSL + "/kitchen", encode_binary(SOURCES), True)):
+			hermes.localized_energies.clear()
+			asyncio.run(hermes.on_raw_message(topic, payload))
+			assert hermes.localized_energies.level.any() == lit, topic
+	finally:
+		hermes.pixels.close()
+
+
+class RecordingLoop:
+	"""The asyncio loop of the manager, the callbacks posted from the other threads are kept"""
+	def __init__(self):
+		self.callbacks = []
+
+	def call_soon_threadsafe(self, callback, *args):
+		self.callbacks.append((callback, args))
+
+
+def test_layers_expire_on_the_loop():
+	paho = pytest.importorskip("paho.mqtt.client")
+	from rhasspylisa_ledmanager import LedManagerHermesMqtt
+	from rhasspylisa_ledmanager.clock import VirtualClock
+	hermes = LedManagerHermesMqtt(paho.Client(), hw_led="DummyBoard", watchdog=False, adaptive_quality=False,
+								  ingress_rate=0, clock=VirtualClock())
+	hermes.loop = RecordingLoop()
+	try:
+		hermes.on_ssl_payload(encode_binary(SOURCES))
+		deadline = time.monotonic() + 5.0
+		while not hermes.loop.callbacks and time.monotonic() < deadline:
+			time.sleep(0.001)
+		# expired (virtual time), the clear is posted to the loop, not done on the expiry thread
+		assert [callback for callback, _ in hermes.loop.callbacks] == [hermes._clear_layers]
+		assert hermes.localized_energies.level.any()
+		hermes._clear_layers()
+		assert not hermes.localized_energies.level.any()
+	finally:
+		hermes.pixels.close()
@@ -0,0 +1,73 @@
+"""The load generator: stream files, seeded generation, pacing and the in-process replay"""
+import numpy
+import pytest
+
+from rhasspylisa_ledmanager.loadgen import generate, write_stream, read_stream, paced, run_in_process, TOPICS, \
+	STREAM_HEADER, STREAM_RECORD, PAYLOAD_FORMATS
+
+
+def test_round_trip(tmp_path):
+	path = str(tmp_path / "stream.bin")
+	stream = list(generate(duration=0.5, payload_format='binary'))
+	assert write_stream(path, stream) == len(stream)
+	assert list(read_stream(path)) == stream
+
+
+def test_truncated_last_record(tmp_path):
+	path = str(tmp_path / "stream.bin")
+	stream = list(generate(duration=0.2))
+	write_stream(path, stream)
+	with open(path, 'rb') as stream_file:
+		data = stream_file.read()
+	# cut in the payload of the last record, then in its header
+	for cut in (3, len(stream[-1][2]) + STREAM_RECORD.size - 2):
+		with open(path, 'wb') as stream_file:
+			stream_file.write(data[:-cut])
+		assert list(read_stream(path)) == stream[:-1]
+	with open(path, 'wb') as stream_file:
+		stream_file.write(data[:STREAM_HEADER.size])
+	assert list(read_stream(path)) == []
+
+
+def test_not_a_stream(tmp_path):
+	path = tmp_path / "stream.bin"
+	path.write_bytes(b"RIFF\x00\x00")
+	with pytest.raises(ValueError):
+		list(read_stream(str(path)))
+
+
+@pytest.mark.parametrize("payload_format", PAYLOAD_FORMATS)
+def test_seeded(payload_format):
+	kwargs = dict(duration=1.0, noise_rate=5.0, payload_format=payload_format)
+	stream = list(generate(seed=3, **kwargs))
+	assert stream == list(generate(seed=3, **kwargs))
+	assert stream != list(generate(seed=4, **kwargs))
+	assert {topic for _, topic, _ in stream} == set(TOPICS)
+	times = [t for t, _, _ in stream]
+	assert times == sorted(times) and times[-1] < 1.0
+
+
+def test_paced():
+	stream = [(0.0, TOPICS[0], b'a'), (0.02, TOPICS[0], b'b'), (0.04, TOPICS[1], b'c')]
+	records = list(paced(stream, speed=2.0))
+	assert [record[:3] for record in records] == stream
+	assert all(lag >= 0.0 for *_, lag in records)
+	# as fast as possible: no lag
+	assert [lag for *_, lag in paced(stream, speed=0.0)] == [0.0]*3
+
+
+def test_run_in_process():
+	paho = pytest.importorskip("paho.mqtt.client")
+	from rhasspylisa_ledmanager import LedManagerHermesMqtt
+	hermes = LedManagerHermesMqtt(paho.Client(), hw_led="DummyBoard", watchdog=False, adaptive_quality=False,
+								  ingress_rate=0)
+	try:
+		stream = list(generate(duration=0.5, payload_format='binary'))
+		count, elapsed, latencies, lags = run_in_process(hermes, stream, speed=0.0)
+		assert count == len(stream) == len(latencies) == len(lags)
+		assert elapsed > 0.0 and (latencies > 0.0).all()
+		# the talkers were drawn
+		assert hermes.localized_energies.level.any()
+		assert set(hermes.handler_timing) >= set(TOPICS)
+	finally:
+		hermes.pixels.close()
@@ -0,0 +1,61 @@
+"""Golden frames of every led pattern method, driven by the virtual clock"""
+import pytest
+
+from conftest import PATTERNS, RecordingBoard
+
+STOP_AT = 1.5 # s of virtual time, when the animation loops (think, speak) are stopped
+
+CASES = {
+	"wakeup_0": lambda pattern: pattern.wakeup(0),
+	"wakeup_200": lambda pattern: pattern.wakeup(200),
+	"listen": lambda pattern: pattern.listen(),
+	"think": lambda pattern: pattern.think(),
+	"speak": lambda pattern: pattern.speak(),
+	"speak_level": lambda pattern: [pattern.speak_level(level) for level in (0.0, 0.1, 0.25, 0.5, 0.75, 1.0)],
+	"off": lambda pattern: pattern.off(),
+	"blink": lambda pattern: pattern.blink(),
+	# the state left by a wakeup (direction) is used by the following animations
+	"wakeup_think": lambda pattern: (pattern.wakeup(90), pattern.think()),
+	"wakeup_listen_speak": lambda pattern: (pattern.wakeup(300), pattern.listen(), pattern.speak()),
+}
+
+
+@pytest.mark.parametrize("case", sorted(CASES))
+@pytest.mark.parametrize("pattern_name", sorted(PATTERNS))
+def test_pattern_frames(pattern_name, case, clock, golden):
+	board = RecordingBoard(PATTERNS[pattern_name], clock)
+	clock.pattern = board.pattern
+	clock.stop_at = STOP_AT
+	CASES[case](board.pattern)
+	assert board.frames, "no frame written"
+	golden("{}_{}".format(pattern_name, case), board.frames)
+
+
+@pytest.mark.parametrize("pattern_name", sorted(PATTERNS))
+def test_loops_stop(pattern_name, clock):
+	board = RecordingBoard(PATTERNS[pattern_name], clock)
+	clock.pattern = board.pattern
+	clock.stop_at = STOP_AT
+	board.pattern.speak()
+	# stopped at the first frame after STOP_AT (the speak loop pauses 0.4 s at its ends)
+	assert STOP_AT <= clock.now < STOP_AT + 0.5
+
+
+def test_table_key_without_source(monkeypatch):
+	import inspect
+	from rhasspylisa_ledmanager.pattern_tables import PatternTableCache
+
+	patterns = {name: RecordingBoard(pattern_class, record=False).pattern for name, pattern_class in PATTERNS.items()}
+	with_source = {name: PatternTableCache.table_key(pattern, "frames") for name, pattern in patterns.items()}
+
+	def no_source(obj):
+		raise OSError("could not get source code")
+	monkeypatch.setattr(inspect, "getsource", no_source)
+	# frozen: keyed by the bytecode, stable and still one key per pattern
+	keys = {name: PatternTableCache.table_key(pattern, "frames") for name, pattern in patterns.items()}
+	assert keys == {name: PatternTableCache.table_key(pattern, "frames") for name, pattern in patterns.items()}
+	assert len(set(keys.values())) == len(keys)
+	assert not set(keys.values()) & set(with_source.values())
+	# and one key per table of a pattern
+	for pattern in patterns.values():
+		assert PatternTableCache.table_key(pattern, "brightness") != PatternTableCache.table_key(pattern, "wakeup")
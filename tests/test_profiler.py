@@ -0,0 +1,33 @@
+"""The sampling profiler: stacks of the other threads, collapsed stack file and summary"""
+import threading
+
+from rhasspylisa_ledmanager.profiler import SamplingProfiler, function_samples
+
+
+def spin(stop):
+	while not stop.is_set():
+		sum(range(1000))
+
+
+def test_profile_files(tmp_path):
+	stop = threading.Event()
+	thread = threading.Thread(target=spin, args=(stop,), name="busy", daemon=True)
+	thread.start()
+	profiler = SamplingProfiler(str(tmp_path), interval=0.002)
+	profiler.start(0.2, name="profile")
+	collapsed, summary = profiler.wait(5.0)
+	stop.set()
+	thread.join()
+
+	stacks = {}
+	for line in open(collapsed):
+		stack, count = line.rsplit(" ", 1)
+		stacks[tuple(stack.split(";"))] = int(count)
+	assert not any(stack[0] == "led-profiler" for stack in stacks)
+	busy = {stack: count for stack, count in stacks.items() if stack[0] == "busy"}
+	assert busy and all(stack[1:].count("test_profiler:spin") == 1 for stack in busy)
+
+	self_samples, total_samples = function_samples(stacks)
+	assert total_samples["test_profiler:spin"] == sum(busy.values())
+	assert sum(self_samples.values()) == sum(stacks.values())
+	assert "busy" in open(summary).read()
@@ -0,0 +1,49 @@
+"""The adaptive quality controller: step down under load (or late), step back up with headroom"""
+import pytest
+
+from rhasspylisa_ledmanager.quality import QualityController, QUALITY_STEPS, STEP_UP_WINDOWS, LOW_QUALITY_SPOT_DECIMATION
+
+
+def test_steps():
+	levels = []
+	quality = QualityController(levels.append, budget=0.3, headroom=0.1)
+	quality.cost.add(0.5)
+	assert quality.update(1.0) == 1
+	assert quality.steps_down == ('spot_resolution',)
+	assert quality.update(1.0, late=True) == 2
+	for _ in range(5):
+		quality.cost.add(0.9)
+		quality.update(1.0)
+	assert quality.level == len(QUALITY_STEPS)
+	assert levels == [1, 2, 3, 4]
+
+	# between headroom and budget: the level is kept
+	quality.cost.add(0.2)
+	quality.update(1.0)
+	for _ in range(STEP_UP_WINDOWS - 1):
+		quality.update(1.0)
+	assert quality.level == len(QUALITY_STEPS)
+	quality.update(1.0)
+	assert quality.steps_down == QUALITY_STEPS[:-1]
+	for _ in range(len(QUALITY_STEPS)*STEP_UP_WINDOWS):
+		quality.update(1.0)
+	assert quality.level == 0
+	assert levels == [1, 2, 3, 4, 3, 2, 1, 0]
+
+
+def test_manager_steps_down_the_splat():
+	paho = pytest.importorskip("paho.mqtt.client")
+	from rhasspylisa_ledmanager import LedManagerHermesMqtt
+	hermes = LedManagerHermesMqtt(paho.Client(), hw_led="DummyBoard")
+	try:
+		# the adaptive quality owns the watchdog alerts, no degraded mode on top of it
+		assert hermes.watchdog.degrade is None
+		hermes.quality.update(1.0, late=True)
+		n_spots = hermes.localized_energies.n_spots
+		for energies in (hermes.localized_energies, hermes.tracked_energies):
+			assert energies.energy_plane_xy.shape == (n_spots//LOW_QUALITY_SPOT_DECIMATION,)
+		hermes.localized_energies.update_batch([[1.0, 0.0, 0.0, 1.0]])
+		# the colormap and set_all draw the 12 merged spots
+		assert hermes.pixels._lit
+	finally:
+		hermes.pixels.close()
@@ -0,0 +1,74 @@
+"""The render thread: keyframe interpolation and the temporal dithering of the 8.8 fixed point frames"""
+import time
+
+import numpy
+import pytest
+
+from conftest import PATTERNS, RecordingBoard
+from rhasspylisa_ledmanager.pixels import FRAME_FRACTION_BITS, MAX_KEYFRAME_INTERPOLATION
+
+RENDER_FPS = 100.0
+
+
+@pytest.fixture
+def board(clock):
+	board = RecordingBoard(PATTERNS["GoogleHome"], clock)
+	yield board
+	board.close()
+
+
+def frame(board, value):
+	data = numpy.zeros((board.pixels_number, 4))
+	data[:, 1:] = value
+	return data.ravel()
+
+
+def wait_for(condition, timeout=5.0):
+	deadline = time.monotonic() + timeout
+	while not condition():
+		assert time.monotonic() < deadline, "timeout"
+		time.sleep(0.001)
+
+
+def rendered(board):
+	"""Wait for the render thread to reach its keyframe (it stops ticking)"""
+	wait_for(lambda: not board._render_event.is_set())
+
+
+def test_interpolation(board, clock):
+	board.start_render(RENDER_FPS)
+	board.show(frame(board, 0))
+	rendered(board)
+	start = len(board.frames)
+	clock.advance(1.0)
+	board.show(frame(board, (10, 200, 60)))
+	rendered(board)
+	frames = numpy.array([leds for _, leds in board.frames[start:]]).reshape(-1, board.pixels_number, 3)
+	# over the interpolation time at the render rate, every channel moving monotonically up
+	assert len(frames) >= MAX_KEYFRAME_INTERPOLATION*RENDER_FPS
+	assert (numpy.diff(frames, axis=0) >= 0).all()
+	assert (numpy.diff(frames[:, :, 1], axis=0) > 0).any()
+	# and landing exactly on the keyframe
+	assert (frames[-1] == (10, 200, 60)).all()
+	assert (frames[-2] != (10, 200, 60)).any()
+
+
+def test_dither_mean(board):
+	n = 1 << FRAME_FRACTION_BITS
+	board.dither = True
+	board.start_render(RENDER_FPS)
+	# a fractional frame keeps the render thread ticking, the quantization error moving to the next frames
+	board.show(frame(board, 10.25))
+	wait_for(lambda: len(board.frames) >= n)
+	board.close()
+	leds = numpy.array([leds for _, leds in board.frames[:n]])
+	assert set(numpy.unique(leds)) == {10, 11}
+	# within one 8.8 LSB of the fractional value
+	assert abs(leds.mean(axis=0) - 10.25).max() <= 1.0/n
+
+
+def test_no_dither_truncates(board):
+	board.start_render(RENDER_FPS)
+	board.show(frame(board, 10.75))
+	rendered(board)
+	assert board.frames[-1][1] == [10]*3*board.pixels_number
@@ -0,0 +1,61 @@
+"""The memory-mapped snapshot of the visual state: save, restore, and a save torn by a crash"""
+import numpy
+
+from rhasspylisa_ledmanager.energy_DOAs import localized_sources, tracked_sources
+from rhasspylisa_ledmanager.snapshot import StateSnapshot
+
+N_LEDS = 12
+
+
+def sources():
+	localized, tracked = localized_sources(), tracked_sources()
+	localized.update_batch([[1.0, 0.0, 0.0, 0.8]])
+	tracked.update_batch([[0.0, 1.0, 0.2, 0.5]], numpy.array([3]))
+	return localized, tracked
+
+
+def test_save_restore(tmp_path):
+	path = str(tmp_path / "snapshot")
+	localized, tracked = sources()
+	led_buffer = numpy.arange(4*N_LEDS, dtype=float)
+	snapshot = StateSnapshot(path, N_LEDS, localized.n_spots)
+	assert snapshot.restore(localized_sources(), tracked_sources()) is None
+	snapshot.save('thinking', led_buffer, localized, tracked)
+	snapshot.flush()
+
+	# as a restarted manager
+	restored_localized, restored_tracked = localized_sources(), tracked_sources()
+	state, restored_buffer = StateSnapshot(path, N_LEDS, localized.n_spots).restore(restored_localized, restored_tracked)
+	assert state == 'thinking'
+	numpy.testing.assert_array_equal(restored_buffer, led_buffer)
+	for restored, saved in ((restored_localized, localized), (restored_tracked, tracked)):
+		for name in ('energy_plane_xy', 'energy_axis_z', 'level'):
+			numpy.testing.assert_allclose(getattr(restored, name), getattr(saved, name), rtol=1e-6, atol=1e-30)
+	numpy.testing.assert_allclose(restored_tracked.rgb, tracked.rgb, rtol=1e-6, atol=1e-30)
+
+
+def test_layout_change(tmp_path):
+	path = str(tmp_path / "snapshot")
+	localized, tracked = sources()
+	StateSnapshot(path, N_LEDS, localized.n_spots).save('thinking', numpy.zeros(4*N_LEDS), localized, tracked)
+	# another board: the old record does not apply
+	assert not StateSnapshot(path, 2*N_LEDS, localized.n_spots).valid
+
+
+def test_torn_write(tmp_path):
+	path = str(tmp_path / "snapshot")
+	localized, tracked = sources()
+	snapshot = StateSnapshot(path, N_LEDS, localized.n_spots)
+	snapshot.save('thinking', numpy.zeros(4*N_LEDS), localized, tracked)
+	# the process dies in the middle of the next save
+	snapshot.record['seq'] += 1
+	snapshot.flush()
+	del snapshot
+
+	reopened = StateSnapshot(path, N_LEDS, localized.n_spots)
+	assert not reopened.valid
+	assert reopened.restore(localized_sources(), tracked_sources()) is None
+	# the next save is valid again
+	reopened.save('speaking', numpy.zeros(4*N_LEDS), localized, tracked)
+	assert reopened.valid
+	assert reopened.restore(localized_sources(), tracked_sources())[0] == 'speaking'
@@ -0,0 +1,67 @@
+"""Association of the tracked sources (SST) to their tracks: by SST id, else by nearest neighbour"""
+import numpy
+
+from rhasspylisa_ledmanager.energy_DOAs import tracked_sources, DEFAULT_TRACK_TIMEOUT, NO_SOURCE_ID
+
+
+def at(*degrees, energy=0.5):
+	"""Sources on the plane at these azimuths (deg)"""
+	azimuth = numpy.deg2rad(degrees)
+	return numpy.column_stack([numpy.cos(azimuth), numpy.sin(azimuth), numpy.zeros(len(azimuth)),
+							   numpy.full(len(azimuth), energy)])
+
+
+def moved(tracked, track_i, azimuth):
+	"""Wrapped azimuth distance (deg) of the track from azimuth (rad)"""
+	return abs(numpy.rad2deg((tracked.track_pos[track_i, 0] - azimuth + numpy.pi) % (2.0*numpy.pi) - numpy.pi))
+
+
+def tracks(tracked):
+	"""color -> track index of the active tracks"""
+	active = numpy.nonzero(tracked.track_active)[0]
+	return {int(tracked.track_color[i]): int(i) for i in active}
+
+
+def test_by_id(clock):
+	tracked = tracked_sources(clock=clock)
+	tracked.update_batch(at(0.0, 90.0), numpy.array([7, 8]))
+	by_color = tracks(tracked)
+	ids = {int(tracked.track_id[i]) for i in by_color.values()}
+	assert ids == {7, 8}
+	track_7 = int(numpy.nonzero(tracked.track_id == 7)[0][0])
+	position = tracked.track_pos[track_7, 0]
+	# the sources cross: the ids keep their tracks, whatever the nearest one
+	clock.sleep(0.1)
+	tracked.update_batch(at(85.0, 5.0), numpy.array([7, 8]))
+	assert tracks(tracked) == by_color
+	assert tracked.track_id[track_7] == 7
+	# id 7 moved half way (alpha) to 85 deg, not to the nearest source at 5 deg
+	assert 40.0 < moved(tracked, track_7, position) < 45.0
+
+
+def test_by_nearest_neighbour(clock):
+	tracked = tracked_sources(clock=clock)
+	tracked.update_batch(at(0.0, 120.0))
+	by_color = tracks(tracked)
+	assert len(by_color) == 2
+	azimuths = {color: tracked.track_pos[i, 0] for color, i in by_color.items()}
+	# the same sources, moved a little and in the other order: no new track, each one on its nearest track
+	clock.sleep(0.1)
+	tracked.update_batch(at(125.0, 5.0))
+	assert tracks(tracked) == by_color
+	for color, i in by_color.items():
+		assert 0.0 < moved(tracked, i, azimuths[color]) < 5.0
+	assert (tracked.track_id[list(by_color.values())] == NO_SOURCE_ID).all()
+
+
+def test_gate_and_timeout(clock):
+	tracked = tracked_sources(clock=clock, gate=30.0)
+	tracked.update_batch(at(0.0))
+	# out of the gate: a new track
+	clock.sleep(0.1)
+	tracked.update_batch(at(90.0))
+	assert tracked.track_active.sum() == 2
+	# not updated for the timeout: dropped
+	clock.sleep(DEFAULT_TRACK_TIMEOUT)
+	tracked.update_batch(at(90.0))
+	assert tracked.track_active.sum() == 1
@@ -0,0 +1,77 @@
+"""The watchdog: frame cadence measured on the virtual clock, alerts, degraded mode and recovery"""
+import asyncio
+import threading
+import time
+
+import pytest
+
+from conftest import PATTERNS, RecordingBoard
+from rhasspylisa_ledmanager.watchdog import Watchdog, RECOVER_WINDOWS
+
+SPI_TIME = 0.03 # s of virtual time taken by a hw write
+
+
+@pytest.mark.parametrize("pattern_name", sorted(PATTERNS))
+def test_frame_late(pattern_name, clock):
+	board = RecordingBoard(PATTERNS[pattern_name], clock, record=False)
+	board.update_leds = lambda: clock.advance(SPI_TIME)
+	watchdog = Watchdog()
+	board.monitor = watchdog
+	clock.pattern = board.pattern
+	clock.stop_at = 1.0
+	board.pattern.think()
+	late, count = watchdog.measures['frame_late'].take()
+	assert count > 0
+	assert late == pytest.approx(SPI_TIME)
+
+
+def test_degrade_and_recover():
+	alerts = []
+	degraded = []
+	watchdog = Watchdog(alert=alerts.append, degrade=degraded.append, loop_lag=0.05)
+	watchdog.loop_lag(0.01)
+	assert watchdog.check()['exceeded'] == []
+	assert not alerts and not degraded
+
+	watchdog.loop_lag(0.2)
+	watchdog.frame_late(0.01)
+	status = watchdog.check()
+	assert status == {'loop_lag': 200.0, 'frame_late': 10.0, 'queue_wait': 0.0, 'exceeded': ['loop_lag'], 'degraded': True}
+	assert alerts == [status] and degraded == [True]
+
+	for _ in range(RECOVER_WINDOWS - 1):
+		watchdog.check()
+	assert degraded == [True]
+	status = watchdog.check()
+	assert not status['degraded']
+	assert degraded == [True, False] and len(alerts) == 2
+
+
+def test_idle_does_not_wake():
+	active = threading.Event()
+	windows = []
+	watchdog = Watchdog(window=0.01, on_window=windows.append, wait_active=active.wait)
+	watchdog.start()
+	time.sleep(0.1)
+	assert windows == []
+	active.set()
+	time.sleep(0.1)
+	assert windows
+	active.clear()
+	time.sleep(0.05)
+	count = len(windows)
+	time.sleep(0.1)
+	assert len(windows) == count
+
+
+def test_loop_lag_probe():
+	loop = asyncio.new_event_loop()
+	watchdog = Watchdog()
+	watchdog.loop = loop
+	watchdog.probe_loop()
+	time.sleep(0.06)
+	loop.run_until_complete(asyncio.sleep(0))
+	loop.close()
+	lag, count = watchdog.measures['loop_lag'].take()
+	assert count == 1 and lag >= 0.06
+	watchdog.probe_loop() # closed loop, not probed
@@ -0,0 +1,61 @@
+"""WAV header parsing: the well formed headers as the wave module, ValueError on the malformed ones"""
+import io
+import struct
+import wave
+
+import pytest
+
+from rhasspylisa_ledmanager.audio_envelope import rms_envelope
+from rhasspylisa_ledmanager.utils import parse_wav_header, get_wav_duration, WAV_FORMAT_PCM
+
+
+def make_wav(rate=16000, channels=1, width=2, frames=1600):
+	with io.BytesIO() as buffer:
+		with wave.open(buffer, "wb") as wav:
+			wav.setnchannels(channels)
+			wav.setsampwidth(width)
+			wav.setframerate(rate)
+			wav.writeframes(b"\x10\x00"*(frames*channels*width//2))
+		return buffer.getvalue()
+
+
+def with_fmt(audio_format=WAV_FORMAT_PCM, rate=16000, channels=1, extra=b""):
+	fmt = struct.pack("<HHIIHH", audio_format, channels, rate, rate*2*channels, 2*channels, 16) + extra
+	data = b"\x00\x01"*160
+	body = b"WAVE" + b"fmt " + struct.pack("<I", len(fmt)) + fmt + b"data" + struct.pack("<I", len(data)) + data
+	return b"RIFF" + struct.pack("<I", len(body)) + body
+
+
+def test_pcm():
+	info = parse_wav_header(make_wav(rate=22050, channels=2, frames=2205))
+	assert (info.sample_rate, info.channels, info.sample_width, info.audio_format) == (22050, 2, 2, WAV_FORMAT_PCM)
+	assert info.data_offset == 44 and info.data_size == 2205*4
+	assert get_wav_duration(make_wav(frames=8000)) == pytest.approx(0.5)
+	assert len(list(rms_envelope(make_wav(frames=1600), window=0.02))) == 5
+
+
+def test_truncated():
+	wav = make_wav()
+	for size in (0, 11, 20, 30):
+		with pytest.raises(ValueError):
+			parse_wav_header(wav[:size])
+	# no data chunk
+	with pytest.raises(ValueError):
+		parse_wav_header(wav[:36])
+
+
+def test_zero_rate():
+	with pytest.raises(ValueError):
+		parse_wav_header(with_fmt(rate=0))
+	with pytest.raises(ValueError):
+		parse_wav_header(with_fmt(channels=0))
+
+
+def test_non_pcm():
+	info = parse_wav_header(with_fmt(audio_format=3))
+	assert info.audio_format == 3
+	with pytest.raises(ValueError):
+		rms_envelope(with_fmt(audio_format=3))
+	# extensible, PCM sub format
+	extensible = with_fmt(audio_format=0xFFFE, extra=struct.pack("<HHI", 22, 16, 4) + struct.pack("<H", 1) + b"\x00"*14)
+	assert parse_wav_header(extensible).audio_format == WAV_FORMAT_PCM